@@ -0,0 +1,201 @@
+"""
+Benchmark suite of SGP, on loopback. All results go to one JSON file, so that a run can be compared with an earlier one:
+    (a) codec: ns per message to encode and to decode each message ID with Protocol.py, next to the before/after
+    cases of CodecBenchmark.py.
+    (b) throughput: moves per second relayed by one server process(Server.py), for 2 to 4 players per room, and a
+    growing number of rooms. The bots(Bot.py) run with --predict, so every bot sends one move per frame.
+    (c) latency: p50/p99 time from sending a move until it is received by each other player of the room(peer), and
+    until its echo is received by the player itself. Next to it, the arrival skew: p50/p99 time between the first and
+    the last player of the room receiving a move, 0 if the RTT equalization is perfect.
+    (d) collision: ns per collision check of the client, for growing levels, with the collision grid(CollisionGrid.py),
+    next to the scan over all tiles of CollisionBenchmark.py.
+The throughput and latency are only measured once the games of all rooms have started.
+
+Usage: python Benchmarks/BenchmarkSuite.py <[OPTIONAL]seconds per server run(default 5)>
+    <[OPTIONAL]--output=<file>(default Benchmarks/results.json)> <[OPTIONAL]--baseline=<results file of an earlier run>>
+    <[OPTIONAL]--quick(less rooms and repetitions)>
+With --baseline, every result that is more than 20%(and for a latency also more than 1 ms) worse than in the baseline
+is printed, and the exit code is 1.
+"""
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import time
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import CodecBenchmark
+import CollisionBenchmark
+from Bot import Fleet
+from Protocol import HEADER, HEADER_BYTES, PING, POSITION, START, COORDINATES, decodeFrame, encodeBatches, splitBatch
+
+TOLERANCE = 0.2  # A result that is more than 20% worse than the baseline is a regression
+MIN_LATENCY_CHANGE = 1  # ms, below this a latency change is noise on loopback, whatever the percentage
+
+move_direction = HEADER_BYTES[HEADER[3][1][2]]
+move_absolute = POSITION.pack(HEADER[3][1][0], 640, 300)
+fruit = POSITION.pack(HEADER[6][1][0], 640, 300) + COORDINATES.pack(500, 200)
+batch = encodeBatches([move_direction, move_absolute, fruit, move_direction])[0]
+
+CODEC_CASES = [
+    # (name, encode, decode)
+    ("msg 1", lambda: HEADER_BYTES[HEADER[1][2][0]], lambda: decodeFrame(HEADER_BYTES[HEADER[1][2][0]])),
+    ("msg 2", lambda: START.pack(HEADER[2][1][0], 39950, 500, 200),
+     lambda: decodeFrame(START.pack(HEADER[2][1][0], 39950, 500, 200))),
+    ("msg 3 direction", lambda: HEADER_BYTES[HEADER[3][1][2]], lambda: decodeFrame(move_direction)),
+    ("msg 3 absolute", lambda: POSITION.pack(HEADER[3][1][0], 640, 300), lambda: decodeFrame(move_absolute)),
+    ("msg 4", lambda: HEADER_BYTES[HEADER[4][1][0]], lambda: decodeFrame(HEADER_BYTES[HEADER[4][1][0]])),
+    ("msg 5", lambda: PING.pack(HEADER[5][0][0], 12345), lambda: decodeFrame(PING.pack(HEADER[5][0][0], 12345))),
+    ("msg 6 absolute", lambda: move_absolute + COORDINATES.pack(500, 200), lambda: decodeFrame(fruit)),
+    ("msg 7(4 moves)", lambda: encodeBatches([move_direction, move_absolute, fruit, move_direction]),
+     lambda: [decodeFrame(message) for message in splitBatch(batch)]),
+]
+
+
+def nanosecondsPerCall(function, repetitions):
+    return min(timeit.repeat(function, number=repetitions, repeat=3)) / repetitions * 1e9
+
+
+def codecResults(repetitions):
+    results = {}
+    for name, encode, decode in CODEC_CASES:
+        results[name] = {'encode_ns': nanosecondsPerCall(encode, repetitions),
+                         'decode_ns': nanosecondsPerCall(decode, repetitions)}
+    legacy = {name: {'before_ns': before, 'after_ns': after}
+              for name, (before, after) in CodecBenchmark.run(repetitions).items()}
+    return results, legacy
+
+
+def freePort():
+    probe = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    probe.bind(('127.0.0.1', 0))
+    port = probe.getsockname()[1]
+    probe.close()
+    return port
+
+
+def serverResults(n_of_players, n_of_rooms, seconds):
+    """
+    Starting a server, filling n_of_rooms rooms with bots, and measuring once all games have started.
+    """
+    port = freePort()
+    server = subprocess.Popen([sys.executable, os.path.join(ROOT, 'Server.py'), str(port), '127.0.0.1',
+                               str(n_of_players)], cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        deadline = time.monotonic() + 10
+        while True:
+            try:
+                socket.create_connection(('127.0.0.1', port)).close()
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise RuntimeError("Server did not start")
+                time.sleep(0.1)
+        time.sleep(0.5)  # The probe connection has taken a place in the first room, until the server noticed it left
+
+        n_of_bots = n_of_players * n_of_rooms
+        fleet = Fleet('127.0.0.1', port, n_of_bots, predict=True, room_size=n_of_players)
+        fleet.connect()
+        fleet.runFor(30, until=lambda: fleet.n_of_started == n_of_bots)
+        if fleet.n_of_started < n_of_bots:
+            raise RuntimeError(f"Only {fleet.n_of_started} of {n_of_bots} bots started their game")
+        fleet.runFor(1)  # The moves that were sent while the last room was starting, are not counted
+        fleet.resetStatistics()
+        start = time.monotonic()
+        fleet.runFor(seconds)
+        statistics = fleet.statistics(time.monotonic() - start)
+        fleet.leave()
+    finally:
+        server.terminate()
+        server.wait()
+    return statistics
+
+
+def flatten(results):
+    """
+    All results as {name: value}, only the values of which a change means a regression or an improvement.
+    """
+    flat = {}
+    for name, values in results['codec'].items():
+        for metric, value in values.items():
+            flat[f"codec {name} {metric}"] = value
+    for name, values in results.get('collision', {}).items():
+        flat[f"collision {name} grid_ns"] = values['grid_ns']
+    for run in results['server']:
+        for metric in ('relayed_per_s', 'echo_p50_ms', 'echo_p99_ms', 'peer_p50_ms', 'peer_p99_ms', 'skew_p50_ms',
+                       'skew_p99_ms'):
+            flat[f"server {run['players']} players x {run['rooms']} rooms {metric}"] = run[metric]
+    return flat
+
+
+def regressions(results, baseline):
+    """
+    The results that are more than TOLERANCE worse than in the baseline. A higher value is worse, except for the
+    throughput(_per_s).
+    """
+    worse = []
+    current = flatten(results)
+    for name, old in flatten(baseline).items():
+        new = current.get(name)
+        if new is None or not old:
+            continue
+        change = (old - new) / old if name.endswith('_per_s') else (new - old) / old
+        if name.endswith('_ms') and new - old < MIN_LATENCY_CHANGE:
+            continue
+        if change > TOLERANCE:
+            worse.append((name, old, new))
+    return worse
+
+
+def main():
+    arguments = [argument for argument in sys.argv if not argument.startswith('--')]
+    options = dict(argument[2:].partition('=')[::2] for argument in sys.argv if argument.startswith('--'))
+    seconds = float(arguments[1]) if len(arguments) > 1 else 5
+    output = options.get('output') or os.path.join(ROOT, 'Benchmarks', 'results.json')
+    quick = 'quick' in options
+
+    results = {'python': platform.python_version(), 'platform': platform.platform(),
+               'date': time.strftime('%Y-%m-%d %H:%M:%S'), 'seconds_per_run': seconds, 'server': []}
+    print("[CODEC]")
+    results['codec'], results['legacy_codec'] = codecResults(20_000 if quick else 200_000)
+    for name, values in results['codec'].items():
+        print(f"{name:<20}encode {values['encode_ns']:8.1f} ns   decode {values['decode_ns']:8.1f} ns")
+
+    print("[SERVER]")
+    for n_of_rooms in ((1, 4) if quick else (1, 4, 16)):
+        for n_of_players in (2, 3, 4):
+            run = {'players': n_of_players, 'rooms': n_of_rooms}
+            run.update(serverResults(n_of_players, n_of_rooms, seconds))
+            results['server'].append(run)
+            print(f"{n_of_players} players x {n_of_rooms:>2} rooms: {run['relayed_per_s']:8.0f} moves/s relayed, echo "
+                  f"p50 {run['echo_p50_ms']:6.1f} ms p99 {run['echo_p99_ms']:6.1f} ms, peer p50 "
+                  f"{run['peer_p50_ms']:6.1f} ms p99 {run['peer_p99_ms']:6.1f} ms, skew p50 {run['skew_p50_ms']:5.1f} ms "
+                  f"p99 {run['skew_p99_ms']:5.1f} ms")
+
+    print("[COLLISION]")
+    results['collision'] = {}
+    for name, (n_of_tiles, before, after) in CollisionBenchmark.run(2_000 if quick else 20_000).items():
+        results['collision'][name] = {'tiles': n_of_tiles, 'scan_ns': before, 'grid_ns': after}
+        print(f"{name:<20}{n_of_tiles:>6} tiles   scan {before:10.0f} ns   grid {after:8.0f} ns")
+
+    with open(output, 'w') as file:
+        json.dump(results, file, indent=2)
+    print("Results written to", output)
+
+    if options.get('baseline'):
+        with open(options['baseline']) as file:
+            worse = regressions(results, json.load(file))
+        for name, old, new in worse:
+            print(f"[REGRESSION] {name}: {old:.1f} -> {new:.1f}")
+        if worse:
+            sys.exit(1)
+        print("No regressions against", options['baseline'])
+
+
+if __name__ == "__main__":
+    main()
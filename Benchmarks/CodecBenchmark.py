@@ -0,0 +1,137 @@
+"""
+Microbenchmark of the encoding/decoding cost per message: the string based header building of the original
+implementation('before'), against the table driven codec of Protocol.py('after').
+
+Usage: python Benchmarks/CodecBenchmark.py <[OPTIONAL]number of repetitions(default 200000)>
+"""
+import os
+import struct
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Protocol import HEADER, HEADER_BYTES, HEADER_DECODE, CLIENT_FRAME_LENGTH, POSITION, START, COORDINATES
+
+PING = struct.Struct('>BH')  # The 3 byte ping of the original implementation(now 32-bit time stamps, see ClockSync.py)
+
+
+####################################
+# Before: the original bin() and '0'/'1' string implementation
+####################################
+
+leading_zeros_2_bit = {1: '0', 2: ''}
+leading_zeros_3_bit = {1: '00', 2: '0', 3: ''}
+
+
+def legacyEncodeHeader(msg_id, player_id, direction):
+    player_id = leading_zeros_2_bit[len(bin(player_id)[2:])] + bin(player_id)[2:]
+    msg_id = leading_zeros_3_bit[len(bin(msg_id)[2:])] + bin(msg_id)[2:]
+    direction = leading_zeros_3_bit[len(bin(direction)[2:])] + bin(direction)[2:]
+    return int(str(msg_id + player_id + direction), 2).to_bytes(1, byteorder='big')
+
+
+def legacyEncodePosition(msg_id, player_id, x, y):
+    return legacyEncodeHeader(msg_id, player_id, 0) + round(x).to_bytes(2, byteorder='big') + \
+        round(y).to_bytes(2, byteorder='big')
+
+
+def legacyEncodePing(time_stamp):
+    return legacyEncodeHeader(5, 0, 0) + round(time_stamp).to_bytes(2, byteorder='big')
+
+
+def legacyEncodeStart(n_of_opponents, speed, time_left, fruit_x, fruit_y):
+    return legacyEncodeHeader(2, n_of_opponents, speed) + round(time_left).to_bytes(2, byteorder='big') + \
+        round(fruit_x).to_bytes(2, byteorder='big') + round(fruit_y).to_bytes(2, byteorder='big')
+
+
+def legacyEncodeFruit(client_msg, fruit_x, fruit_y):
+    return client_msg + round(fruit_x).to_bytes(2, byteorder='big') + round(fruit_y).to_bytes(2, byteorder='big')
+
+
+def legacyDecodeHeader(msg):
+    header_string = ''
+    header = msg[0]
+    for bit in range(7, -1, -1):
+        header_string += str((header & (1 << bit)) >> bit)
+    return int(header_string[:3], 2), int(header_string[3:5], 2), int(header_string[5:8], 2)
+
+
+def legacyIdentify(msg):
+    msg_id, _, direction = legacyDecodeHeader(msg)
+    if msg_id == 3 or msg_id == 6:
+        if direction == 0:
+            if len(msg) < 5:
+                return -1, -1
+            return 5, msg_id
+        return 1, msg_id
+    elif msg_id == 5:
+        if len(msg) < 3:
+            return -1, -1
+        return 3, msg_id
+    elif msg_id == 4:
+        return 1, msg_id
+
+
+def legacyDecodePosition(msg):
+    msg_id, player_id, direction = legacyDecodeHeader(msg)
+    return msg_id, player_id, int.from_bytes(msg[1:3], byteorder='big', signed=False), \
+        int.from_bytes(msg[3:5], byteorder='big', signed=False)
+
+
+####################################
+# After: Protocol.py
+####################################
+
+def identify(msg):
+    n_of_bytes = CLIENT_FRAME_LENGTH[msg[0]]
+    if len(msg) < n_of_bytes:
+        return -1, -1
+    return n_of_bytes, HEADER_DECODE[msg[0]][0]
+
+
+def decodePosition(msg):
+    header, x, y = POSITION.unpack_from(msg)
+    msg_id, player_id, _ = HEADER_DECODE[header]
+    return msg_id, player_id, x, y
+
+
+move_direction = HEADER_BYTES[HEADER[3][1][2]]
+move_absolute = POSITION.pack(HEADER[3][1][0], 640, 300)
+
+CASES = [
+    # (name, before, after)
+    ("encode 1 byte(msg ID 1/3/4)", lambda: legacyEncodeHeader(3, 1, 2), lambda: HEADER_BYTES[HEADER[3][1][2]]),
+    ("encode 3 byte(msg ID 5)", lambda: legacyEncodePing(12345), lambda: PING.pack(HEADER[5][0][0], 12345)),
+    ("encode 5 byte(msg ID 3/6)", lambda: legacyEncodePosition(3, 1, 640.4, 300.2),
+     lambda: POSITION.pack(HEADER[3][1][0], round(640.4), round(300.2))),
+    ("encode 7 byte(msg ID 2)", lambda: legacyEncodeStart(1, 0, 39950, 500, 200),
+     lambda: START.pack(HEADER[2][1][0], 39950, 500, 200)),
+    ("encode 9 byte(msg ID 6)", lambda: legacyEncodeFruit(move_absolute, 500, 200),
+     lambda: move_absolute + COORDINATES.pack(500, 200)),
+    ("frame length 1 byte", lambda: legacyIdentify(move_direction), lambda: identify(move_direction)),
+    ("frame length 5 byte", lambda: legacyIdentify(move_absolute), lambda: identify(move_absolute)),
+    ("decode header", lambda: legacyDecodeHeader(move_direction), lambda: HEADER_DECODE[move_direction[0]]),
+    ("decode 5 byte(msg ID 3/6)", lambda: legacyDecodePosition(move_absolute), lambda: decodePosition(move_absolute)),
+]
+
+
+def nanosecondsPerCall(function, repetitions):
+    return min(timeit.repeat(function, number=repetitions, repeat=3)) / repetitions * 1e9
+
+
+def run(repetitions=200_000):
+    """
+    Returns, per case, the cost(ns per message) before and after.
+    """
+    results = {}
+    for name, before, after in CASES:
+        assert before() == after(), name  # Both implementations need to give the same bytes/values
+        results[name] = (nanosecondsPerCall(before, repetitions), nanosecondsPerCall(after, repetitions))
+    return results
+
+
+if __name__ == "__main__":
+    repetitions = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    print(f"{'case':<30}{'before(ns)':>12}{'after(ns)':>12}{'speedup':>10}")
+    for name, (before, after) in run(repetitions).items():
+        print(f"{name:<30}{before:>12.1f}{after:>12.1f}{before / after:>9.1f}x")
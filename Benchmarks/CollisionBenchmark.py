@@ -0,0 +1,95 @@
+"""
+Microbenchmark of the collision check of the client(network_game.py): the scan over every tile of the map('before'),
+against the query of the collision grid of CollisionGrid.py('after'). The level is 1-1.txt, and larger levels made by
+repeating it n x n times. The player is put on random positions in the level, a query gives whether the player hits a
+wall, and otherwise whether it takes the fruit.
+
+Usage: python Benchmarks/CollisionBenchmark.py <[OPTIONAL]number of queries(default 20000)>
+"""
+import os
+import random
+import sys
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+from pygame import Rect
+from CollisionGrid import CollisionGrid
+
+TILE_WIDTH = 15  # tileWidth of network_game.py
+REPEATS = (1, 2, 4, 8)  # The level is repeated n x n times
+
+
+class Tile():
+    def __init__(self, x, y, w, h, hasCollision):
+        self.rect = Rect(x, y, w, h)
+        self.hasCollision = hasCollision
+        self.isCollectible = not hasCollision
+
+
+def loadLevel(repeat):
+    """
+    The walls of 1-1.txt, repeated repeat x repeat times, and the fruit(added after the walls, like the client does).
+    """
+    with open(os.path.join(ROOT, '1-1.txt')) as file:
+        rows = [row.rstrip("\n") for row in file]
+    rows = [row * repeat for row in rows] * repeat
+    tiles = [Tile(x * TILE_WIDTH, y * TILE_WIDTH, TILE_WIDTH, TILE_WIDTH, True)
+             for y, row in enumerate(rows) for x, tile in enumerate(row) if tile == '#']
+    tiles.append(Tile(40 * TILE_WIDTH, 15 * TILE_WIDTH, 33, 33, False))
+    grid = CollisionGrid(max(len(row) for row in rows), len(rows), TILE_WIDTH)
+    for tile in tiles:
+        grid.insert(tile)
+    return tiles, grid, len(rows[0]) * TILE_WIDTH, len(rows) * TILE_WIDTH
+
+
+def scan(tiles, rect):
+    """
+    The collision check before the grid: every tile of the map.
+    """
+    for tile in tiles:
+        if tile.hasCollision and tile.rect.colliderect(rect):
+            return True, False
+        if tile.isCollectible and tile.rect.colliderect(rect):
+            return False, True
+    return False, False
+
+
+def query(grid, rect):
+    tiles = grid.query(rect)
+    for tile in tiles:
+        if tile.hasCollision and tile.rect.colliderect(rect):
+            return True, False
+    for tile in tiles:
+        if tile.isCollectible and tile.rect.colliderect(rect):
+            return False, True
+    return False, False
+
+
+def run(n_of_queries=20_000):
+    """
+    Returns, per level size, (number of tiles, cost(ns per query) before, cost after).
+    """
+    results = {}
+    for repeat in REPEATS:
+        tiles, grid, width, height = loadLevel(repeat)
+        rects = [Rect(random.randrange(width - TILE_WIDTH), random.randrange(height - TILE_WIDTH), TILE_WIDTH,
+                      TILE_WIDTH) for _ in range(n_of_queries)]
+        assert all(scan(tiles, rect) == query(grid, rect) for rect in rects)  # Both need to give the same answer
+        n_of_scans = max(n_of_queries // len(tiles), 20)  # The scan is slow on the large levels
+        before = min(timeit.repeat(lambda: [scan(tiles, rect) for rect in rects[:n_of_scans]], number=1, repeat=3))
+        after = min(timeit.repeat(lambda: [query(grid, rect) for rect in rects], number=1, repeat=3))
+        results[f"{repeat}x{repeat} level"] = (len(tiles), before / n_of_scans * 1e9, after / n_of_queries * 1e9)
+    return results
+
+
+def main():
+    n_of_queries = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    print(f"{'level':<15}{'tiles':>8}{'scan(ns)':>14}{'grid(ns)':>12}{'speedup':>10}")
+    for name, (n_of_tiles, before, after) in run(n_of_queries).items():
+        print(f"{name:<15}{n_of_tiles:>8}{before:>14.0f}{after:>12.0f}{before / after:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
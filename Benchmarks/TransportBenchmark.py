@@ -0,0 +1,242 @@
+"""
+Loopback comparison of the tail latency of the moves over TCP, and over UDP(Transport.py), with packet loss.
+
+A client sends a move(msg ID 3, 5 bytes) every frame(1/30 s), and a peer echoes every move back, like the server does.
+The round trip of each move is measured. Both directions go through an impairment shim, that delays every packet by
+DELAY ms(one way), and loses each packet with the given probability:
+    -UDP: a relay that drops the datagram, or forwards it after the delay.
+    -TCP: the kernel does not lose anything on loopback, so the relay emulates what TCP does with a lost segment: it is
+    only delivered after the retransmission timeout(RECOVERY ms, 200 ms being the minimum RTO of Linux), and all data
+    sent after it waits for it(head-of-line blocking). A retransmission can get lost too, doubling the timeout.
+A move that never comes back(UDP: lost in all its datagrams) is counted as lost.
+
+Usage: python Benchmarks/TransportBenchmark.py <[OPTIONAL]seconds per case(default 15)> <[OPTIONAL]loss in %, ...
+(default 0 2 5)>
+"""
+import heapq
+import itertools
+import os
+import random
+import selectors
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Protocol import HEADER, CLIENT_FRAME_LENGTH, SERVER_FRAME_LENGTH, POSITION, FrameBuffer
+from Transport import DatagramChannel, RESEND_INTERVAL, MAX_DATAGRAM, hasMessages
+
+HOST = '127.0.0.1'
+DELAY = 0.02  # One way delay of the shim(s)
+RECOVERY = 0.2  # Time(s) before TCP delivers a lost segment
+FRAMES_S = 30
+
+
+class ImpairmentShim():
+    """
+    Relay between the client and the peer that delays and loses packets. The relay runs in its own thread, the packets
+    that are on their way are kept in a heap of (release time, sequence number, send function, data).
+    """
+    def __init__(self, transport, loss):
+        self.transport = transport
+        self.loss = loss
+        self.selector = selectors.DefaultSelector()
+        self.queue = []
+        self.counter = itertools.count()
+        self.last_release = {}  # TCP: release time of the last chunk per direction, to keep the stream in order
+        self.running = True
+        if transport == 'udp':
+            self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        else:
+            self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.bind((HOST, 0))
+        self.address = self.socket.getsockname()
+
+    def start(self, peer_address):
+        self.peer_address = peer_address
+        self.client_address = None
+        if self.transport == 'tcp':
+            self.socket.listen()
+        threading.Thread(target=self.run, daemon=True).start()
+        return
+
+    def releaseTime(self, direction):
+        now = time.monotonic()
+        if self.transport == 'udp':
+            return None if random.random() < self.loss else now + DELAY
+        release = now + DELAY
+        timeout = RECOVERY
+        while random.random() < self.loss:
+            release += timeout
+            timeout *= 2
+        release = max(release, self.last_release.get(direction, 0))
+        self.last_release[direction] = release
+        return release
+
+    def forward(self, direction, send, data):
+        release = self.releaseTime(direction)
+        if release is not None:
+            heapq.heappush(self.queue, (release, next(self.counter), send, data))
+        return
+
+    def run(self):
+        if self.transport == 'udp':
+            self.selector.register(self.socket, selectors.EVENT_READ, data='udp')
+        else:
+            client, _ = self.socket.accept()
+            peer = socket.create_connection(self.peer_address)
+            for connection in (client, peer):
+                connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.selector.register(client, selectors.EVENT_READ, data=('up', peer))
+            self.selector.register(peer, selectors.EVENT_READ, data=('down', client))
+        while self.running:
+            timeout = max(self.queue[0][0] - time.monotonic(), 0) if self.queue else 0.05
+            for key, _ in self.selector.select(timeout=timeout):
+                if key.data == 'udp':
+                    data, address = self.socket.recvfrom(MAX_DATAGRAM)
+                    if address == self.peer_address:
+                        self.forward('down', lambda data: self.socket.sendto(data, self.client_address), data)
+                    else:
+                        self.client_address = address
+                        self.forward('up', lambda data: self.socket.sendto(data, self.peer_address), data)
+                else:
+                    direction, target = key.data
+                    data = key.fileobj.recv(4096)
+                    if not data:
+                        self.running = False
+                        break
+                    self.forward(direction, target.sendall, data)
+            now = time.monotonic()
+            while self.queue and self.queue[0][0] <= now:
+                _, _, send, data = heapq.heappop(self.queue)
+                send(data)
+        return
+
+
+def tcpPeer(listening_socket):
+    """
+    Echoing every move, like the server does.
+    """
+    connection, _ = listening_socket.accept()
+    connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    mailbox = FrameBuffer(CLIENT_FRAME_LENGTH)
+    while mailbox.receiveFrom(connection):
+        for frame in mailbox.frames():
+            connection.sendall(frame)
+    return
+
+
+def udpPeer(peer_socket):
+    """
+    Echoing every move, like the server does with --udp.
+    """
+    channel = DatagramChannel(CLIENT_FRAME_LENGTH, 0)
+    peer_socket.settimeout(RESEND_INTERVAL)
+    address = None
+    while True:
+        try:
+            datagram, address = peer_socket.recvfrom(MAX_DATAGRAM)
+            messages = channel.receive(datagram)
+            if hasMessages(datagram):
+                peer_socket.sendto(channel.acknowledgement(), address)
+            for message in messages:
+                peer_socket.sendto(channel.pack(message), address)
+        except socket.timeout:
+            pass
+        except OSError:
+            return
+        datagram = channel.resend()
+        if datagram and address:
+            try:
+                peer_socket.sendto(datagram, address)
+            except OSError:
+                return
+
+
+def measure(transport, loss, seconds):
+    """
+    Returns the round trip times(ms) of the moves that came back, and the number of moves that did not.
+    """
+    if transport == 'udp':
+        peer_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        peer_socket.bind((HOST, 0))
+        threading.Thread(target=udpPeer, args=(peer_socket,), daemon=True).start()
+    else:
+        peer_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        peer_socket.bind((HOST, 0))
+        peer_socket.listen()
+        threading.Thread(target=tcpPeer, args=(peer_socket,), daemon=True).start()
+    shim = ImpairmentShim(transport, loss)
+    shim.start(peer_socket.getsockname())
+
+    if transport == 'udp':
+        connection = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        connection.connect(shim.address)
+        channel = DatagramChannel(SERVER_FRAME_LENGTH, 0)
+    else:
+        connection = socket.create_connection(shim.address)
+        connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        mailbox = FrameBuffer(SERVER_FRAME_LENGTH)
+
+    send_time = {}
+    round_trips = []
+    start = time.monotonic()
+    next_send = start
+    end = start + seconds
+    while time.monotonic() < end or (time.monotonic() < end + 2 and len(round_trips) < len(send_time)):
+        now = time.monotonic()
+        if now >= next_send and now < end:
+            move = POSITION.pack(HEADER[3][0][0], len(send_time), 0)
+            send_time[len(send_time)] = now
+            if transport == 'udp':
+                connection.send(channel.pack(move))
+            else:
+                connection.sendall(move)
+            next_send += 1 / FRAMES_S
+        timeout = max(min(next_send, end) - time.monotonic(), 0.001)
+        if transport == 'udp':
+            connection.settimeout(min(timeout, RESEND_INTERVAL))
+            try:
+                datagram = connection.recv(MAX_DATAGRAM)
+                frames = channel.receive(datagram)
+                if hasMessages(datagram):
+                    connection.send(channel.acknowledgement())
+            except socket.timeout:
+                frames = []
+            datagram = channel.resend()
+            if datagram:
+                connection.send(datagram)
+        else:
+            connection.settimeout(timeout)
+            try:
+                mailbox.receiveFrom(connection)
+                frames = list(mailbox.frames())
+            except socket.timeout:
+                frames = []
+        received = time.monotonic()
+        for frame in frames:
+            _, index, _ = POSITION.unpack(frame)
+            round_trips.append((received - send_time[index]) * 1000)
+
+    shim.running = False
+    connection.close()
+    peer_socket.close()
+    return round_trips, len(send_time) - len(round_trips)
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
+
+
+if __name__ == "__main__":
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 15
+    losses = [float(loss) / 100 for loss in sys.argv[2:]] or [0, 0.02, 0.05]
+    print(f"one way delay {DELAY * 1000:.0f} ms, {FRAMES_S} moves/s, {seconds:.0f} s per case")
+    print(f"{'transport':<11}{'loss':>6}{'p50(ms)':>10}{'p99(ms)':>10}{'max(ms)':>10}{'lost':>6}")
+    for loss in losses:
+        for transport in ('tcp', 'udp'):
+            round_trips, n_of_lost = measure(transport, loss, seconds)
+            print(f"{transport:<11}{loss * 100:>5.0f}%{percentile(round_trips, 0.5):>10.1f}"
+                  f"{percentile(round_trips, 0.99):>10.1f}{max(round_trips):>10.1f}{n_of_lost:>6}")
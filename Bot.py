@@ -0,0 +1,413 @@
+"""
+Headless bot clients, to load test the server(Server.py) with many more players than can be found by hand.
+
+A bot speaks the same protocol as the pygame client(network_game.py): it gets its ID(msg ID 1), answers the pings(msg
+ID 5), waits for the start(msg ID 2), and then moves: an absolute position(msg ID 3, direction 0) each time it changes
+direction, and only the direction while it keeps on going in the same direction. If it comes close to the fruit, it
+sends msg ID 6. Like the client, a bot only sends its next move once the server echoed back the previous one, unless
+it is started with --predict.
+
+All bots run in one process, on one selector. Each bot can get an artificial latency, in the same way as
+Client.simulated_ping: every message of the server is only handled after this latency, for which the bots share one
+DeliveryScheduler(Scheduler.py).
+
+Usage: python Bot.py <port> <host> <n_of_bots> <[OPTIONAL]seconds(default 60)>
+    <[OPTIONAL]--latency=<ms> or <min ms>-<max ms>(default 0)> <[OPTIONAL]--script=<directions, e.g. 2223>(default
+    random)> <[OPTIONAL]--predict(do not wait for the echo)> <[OPTIONAL]--rejoin(join a new game once the game ended)>
+    <[OPTIONAL]--players=<n_of_players per room of the server>(to also measure the latency to the other players, and
+    the arrival skew)> <[OPTIONAL]--receipts=<file>(log the time each move is received, needs --players, see Fairness.py)>
+"""
+import random
+import selectors
+import socket
+import sys
+import time
+from Scheduler import DeliveryScheduler
+from Fairness import FairnessLog, RECEIPT_COLUMNS
+from Protocol import HEADER, HEADER_BYTES, HEADER_DECODE, SERVER_FRAME_LENGTH, POSITION, FrameBuffer, decodeFrame, \
+    splitBatch, pingReply, timestamp, STEPS_S, STEP_PIXELS
+
+X_DIRECTION = {5: 0, 1: 0, 2: 1, 3: 0, 4: -1}
+Y_DIRECTION = {5: 0, 1: -1, 2: 0, 3: 1, 4: 0}
+
+
+def printUsage():
+    print("Usage: python", sys.argv[0], "<port>", "<host>", "<n_of_bots>", "<[OPTIONAL]seconds(default 60)>",
+          "<[OPTIONAL]--latency=<ms> or <min ms>-<max ms>(default 0)>",
+          "<[OPTIONAL]--script=<directions, e.g. 2223>(default random)>", "<[OPTIONAL]--predict>", "<[OPTIONAL]--rejoin>",
+          "<[OPTIONAL]--players=<n_of_players per room>>", "<[OPTIONAL]--receipts=<file>(needs --players)>")
+    return
+
+
+def percentile(values, fraction):
+    """
+    The value below which the given fraction of the values lies, None if there are no values.
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
+
+
+class Bot():
+    """
+    One headless player. The fleet owns the selector and the scheduler, a bot only keeps the state of its own game.
+    """
+    def __init__(self, fleet, simulated_ping, script):
+        self.fleet = fleet
+        self.simulated_ping = simulated_ping  # Artificial latency(ms) on every message of the server
+        self.script = script  # Directions that are played one after the other, None for random movement
+        self.socket_connection = None
+        self.mailbox = None
+        self.room = None  # The bots that play in the same room(only known if the fleet is given the room size)
+        self.room_index = None  # The number of the room, in the order the rooms are filled
+        self.reset()
+
+    def reset(self):
+        self.player_id = None
+        self.started = False
+        self.end_time = None  # Time(monotonic) at which the game ends, known once the game started
+        self.move_speed = STEP_PIXELS[0]  # Pixels per step
+        self.x = random.randrange(100, 1100)
+        self.y = random.randrange(100, 400)
+        self.direction = 5
+        self.n_of_moves = 0
+        self.waiting_move = False
+        self.move_sent = []  # Time(monotonic) of each move that is not echoed back yet, the oldest first
+        self.sent_times = []  # Time(monotonic) of every move sent in this game, if the room is known
+        self.n_of_received_from = {}  # Number of moves received per player id, the own echoes included
+        self.fruit_x = None
+        self.fruit_y = None
+        return
+
+    def connect(self):
+        self.socket_connection = socket.create_connection((self.fleet.HOST, self.fleet.PORT))
+        self.socket_connection.settimeout(1)
+        self.socket_connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)  # Moves are sent right away
+        self.mailbox = FrameBuffer(SERVER_FRAME_LENGTH)
+        self.fleet.selector.register(self.socket_connection, selectors.EVENT_READ, data=self)
+        return
+
+    def close(self):
+        if self.socket_connection is None:
+            return
+        self.fleet.selector.unregister(self.socket_connection)
+        self.socket_connection.close()
+        self.socket_connection = None
+        return
+
+    def leave(self):
+        """
+        Sending the leaving message(msg ID 4), like the client does when the player quits.
+        """
+        try:
+            self.socket_connection.sendall(HEADER_BYTES[HEADER[4][0][0]])
+        except OSError:
+            pass
+        self.close()
+        return
+
+    def receive(self):
+        """
+        Called by the fleet when the socket is readable. The messages are only handled after the artificial latency.
+        Returns False if the connection is closed.
+        """
+        try:
+            if not self.mailbox.receiveFrom(self.socket_connection):
+                return False
+            for frame in self.mailbox.frames():
+                if HEADER_DECODE[frame[0]][0] == 7:
+                    # A batch(server in tick mode) holds all moves of one tick
+                    for message in splitBatch(frame):
+                        self.fleet.scheduler.schedule(self, (self.socket_connection, bytes(message)),
+                                                      self.simulated_ping)
+                    continue
+                self.fleet.scheduler.schedule(self, (self.socket_connection, bytes(frame)), self.simulated_ping)
+        except (OSError, ValueError):
+            return False
+        return True
+
+    def handleMessage(self, connection, frame):
+        """
+        Handling one message of the server, once its artificial latency has passed.
+        """
+        if connection is not self.socket_connection:
+            # The bot has left(or joined a new game) in the meantime.
+            return
+        self.fleet.n_of_received += 1
+        msg_id, contestant_id, direction, data = decodeFrame(frame)
+        if msg_id == 1:
+            self.player_id = contestant_id
+
+        elif msg_id == 2:
+            time_left, self.fruit_x, self.fruit_y = data
+            self.move_speed = STEP_PIXELS.get(direction, STEP_PIXELS[0])
+            self.started = True
+            self.end_time = time.monotonic() + time_left / 1000
+            self.fleet.n_of_started += 1
+
+        elif msg_id == 3 or msg_id == 6:
+            if msg_id == 6:
+                # The fruit position is always in the last 4 bytes
+                self.fruit_x, self.fruit_y = data[-2], data[-1]
+            self.fleet.n_of_relayed += 1
+            if contestant_id == self.player_id:
+                self.waiting_move = False
+                if self.move_sent:
+                    self.fleet.echo_latencies.append((time.monotonic() - self.move_sent.pop(0)) * 1000)
+            if self.room:
+                self.receivedFrom(contestant_id)
+
+        elif msg_id == 5:
+            # The ping is received now(after the artificial latency), and answered right away.
+            try:
+                self.socket_connection.sendall(pingReply(frame, timestamp()))
+            except OSError:
+                pass
+            # Like the client: a move that is not echoed back(lost over UDP) does not block the bot forever.
+            self.waiting_move = False
+        return
+
+    def receivedFrom(self, contestant_id):
+        """
+        The server relays the moves of a player to each player in the order they were sent, so the n-th move received
+        from a player is its n-th move sent. The time between both is the peer latency, and the time between the first
+        and the last bot of the room receiving it is the arrival skew.
+        """
+        now = time.monotonic()
+        n_of_moves = self.n_of_received_from.get(contestant_id, 0)
+        self.n_of_received_from[contestant_id] = n_of_moves + 1
+        if contestant_id != self.player_id:
+            for sender in self.room:
+                if sender is not self and sender.player_id == contestant_id and n_of_moves < len(sender.sent_times):
+                    self.fleet.peer_latencies.append((now - sender.sent_times[n_of_moves]) * 1000)
+        self.fleet.received(self, contestant_id, n_of_moves, now)
+        return
+
+    def nextDirection(self):
+        if self.script:
+            direction = self.script[self.n_of_moves % len(self.script)]
+        elif random.random() < 0.1:
+            direction = random.randrange(1, 6)
+        else:
+            direction = self.direction
+        # Turning back at the borders of the map
+        if self.x < 60:
+            direction = 2
+        elif self.x > 1200:
+            direction = 4
+        elif self.y < 60:
+            direction = 3
+        elif self.y > 500:
+            direction = 1
+        return direction
+
+    def move(self):
+        """
+        Called by the fleet once per simulation step(like the client, see STEPS_S in Protocol.py): sending the next
+        move, if the bot may.
+        """
+        if not self.started or self.socket_connection is None or (self.waiting_move and not self.fleet.predict):
+            return
+        direction = self.nextDirection()
+        self.x += self.move_speed * X_DIRECTION[direction]
+        self.y += self.move_speed * Y_DIRECTION[direction]
+        msg_id = 3
+        if self.fruit_x is not None and abs(self.x - self.fruit_x) <= 30 and abs(self.y - self.fruit_y) <= 30:
+            msg_id = 6
+            self.fruit_x = None
+        if direction != self.direction:
+            request = POSITION.pack(HEADER[msg_id][self.player_id][0], round(self.x), round(self.y))
+        else:
+            request = HEADER_BYTES[HEADER[msg_id][self.player_id][direction]]
+        self.direction = direction
+        self.n_of_moves += 1
+        try:
+            self.socket_connection.sendall(request)
+        except OSError:
+            self.fleet.disconnected(self)
+            return
+        self.waiting_move = True
+        self.move_sent.append(time.monotonic())
+        if self.room:
+            self.sent_times.append(self.move_sent[-1])
+        self.fleet.n_of_sent += 1
+        return
+
+
+class Fleet():
+    """
+    Launcher of the bots: one selector for all bot sockets, and one delivery scheduler for the artificial latencies.
+    If room_size is given(the number of players per room of the server), the bots know which other bots play in their
+    room: the server fills one room after the other, and the bots connect one after the other. This is needed for the
+    peer latency and the arrival skew, and only holds for a single process server without --rejoin.
+    If receipts is given(a file name), the time each bot received each move is logged to it(see Fairness.py).
+    """
+    def __init__(self, HOST, PORT, n_of_bots, latency=(0, 0), script=None, predict=False, rejoin=False, room_size=None,
+                 receipts=None):
+        self.HOST = HOST
+        self.PORT = PORT
+        self.selector = selectors.DefaultSelector()
+        self.scheduler = DeliveryScheduler()
+        self.predict = predict
+        self.rejoin = rejoin
+        self.bots = [Bot(self, random.randint(*latency), script) for _ in range(n_of_bots)]
+        if room_size:
+            for first in range(0, n_of_bots, room_size):
+                for bot in self.bots[first:first + room_size]:
+                    bot.room = self.bots[first:first + room_size]
+                    bot.room_index = first // room_size
+        self.receipts_log = FairnessLog(receipts, RECEIPT_COLUMNS) if receipts else None
+        self.n_of_started = 0  # Number of games started(counted per bot)
+        self.resetStatistics()
+
+    def resetStatistics(self):
+        """
+        Starting the counting again, e.g. once all games have started.
+        """
+        self.n_of_sent = 0  # Number of moves sent by all bots
+        self.n_of_received = 0  # Number of messages received by all bots
+        self.n_of_relayed = 0  # Number of moves(msg ID 3/6) received by all bots
+        self.n_of_disconnects = 0  # Number of times a bot lost its connection without leaving
+        self.echo_latencies = []  # Time(ms) between sending a move, and handling its echo
+        self.peer_latencies = []  # Time(ms) between sending a move, and handling it by another bot of the room
+        self.arrivals = {}  # (room, sender id, move number): times the move was received, until all bots of the room have
+        self.arrival_skews = []  # Time(ms) between the first and the last bot of the room receiving a move
+        return
+
+    def received(self, bot, sender_id, move_number, now):
+        """
+        Bookkeeping of the arrival skew: once every bot of the room received a move, its skew is known.
+        """
+        if self.receipts_log:
+            self.receipts_log.record(bot.room_index, sender_id, move_number, bot.player_id, now)
+        key = (bot.room_index, sender_id, move_number)
+        arrivals = self.arrivals.setdefault(key, [])
+        arrivals.append(now)
+        if len(arrivals) == len(bot.room):
+            self.arrival_skews.append((max(arrivals) - min(arrivals)) * 1000)
+            del self.arrivals[key]
+        return
+
+    def disconnected(self, bot):
+        bot.close()
+        self.n_of_disconnects += 1
+        if self.rejoin:
+            bot.reset()
+            bot.connect()
+        return
+
+    def run(self, seconds, report_interval=5):
+        """
+        Running the bots for the given number of seconds, and returning the statistics of the run(see statistics).
+        """
+        self.connect()
+        start = time.monotonic()
+        self.runFor(seconds, report_interval)
+        self.leave()
+        if self.receipts_log:
+            self.receipts_log.close()
+        return self.statistics(time.monotonic() - start)
+
+    def connect(self):
+        for bot in self.bots:
+            bot.connect()
+        return
+
+    def leave(self):
+        for bot in self.bots:
+            if bot.socket_connection:
+                bot.leave()
+        return
+
+    def runFor(self, seconds, report_interval=None, until=None):
+        """
+        Event loop of the bots, for the given number of seconds, or until until() is True.
+        """
+        start = time.monotonic()
+        next_frame = start
+        last_report = start
+        while time.monotonic() - start < seconds and not (until and until()):
+            timeout = self.scheduler.timeUntilNext(max(next_frame - time.monotonic(), 0))
+            for key, _ in self.selector.select(timeout=timeout):
+                bot = key.data
+                if not bot.receive():
+                    self.disconnected(bot)
+            self.scheduler.fireDue(lambda bot, message: bot.handleMessage(*message))
+
+            now = time.monotonic()
+            if now >= next_frame:
+                next_frame += 1 / STEPS_S
+                for bot in self.bots:
+                    if bot.end_time is not None and now > bot.end_time:
+                        # The game has ended.
+                        bot.leave()
+                        bot.reset()
+                        if self.rejoin:
+                            bot.connect()
+                    bot.move()
+            if report_interval and now - last_report >= report_interval:
+                self.printReport(now - start)
+                last_report = now
+        return
+
+    def statistics(self, elapsed):
+        return {
+            'bots': len(self.bots),
+            'seconds': elapsed,
+            'games_started': self.n_of_started,
+            'sent_per_s': self.n_of_sent / elapsed,
+            'received_per_s': self.n_of_received / elapsed,
+            'relayed_per_s': self.n_of_relayed / elapsed,
+            'echo_p50_ms': percentile(self.echo_latencies, 0.5),
+            'echo_p90_ms': percentile(self.echo_latencies, 0.9),
+            'echo_p99_ms': percentile(self.echo_latencies, 0.99),
+            'echo_max_ms': max(self.echo_latencies) if self.echo_latencies else None,
+            'peer_p50_ms': percentile(self.peer_latencies, 0.5),
+            'peer_p99_ms': percentile(self.peer_latencies, 0.99),
+            'skew_p50_ms': percentile(self.arrival_skews, 0.5),
+            'skew_p99_ms': percentile(self.arrival_skews, 0.99),
+            'disconnects': self.n_of_disconnects,
+        }
+
+    def printReport(self, elapsed):
+        connected = sum(1 for bot in self.bots if bot.socket_connection)
+        playing = sum(1 for bot in self.bots if bot.started)
+        print(f"[{elapsed:5.0f} s] {connected} connected, {playing} playing, {self.n_of_sent / elapsed:.0f} moves/s sent, "
+              f"{self.n_of_received / elapsed:.0f} msg/s received, {self.n_of_disconnects} disconnects")
+        return
+
+
+def main():
+    arguments = [argument for argument in sys.argv if not argument.startswith('--')]
+    options = dict(argument[2:].partition('=')[::2] for argument in sys.argv if argument.startswith('--'))
+    try:
+        PORT = int(arguments[1])
+        HOST = str(arguments[2])
+        n_of_bots = int(arguments[3])
+        seconds = float(arguments[4]) if len(arguments) > 4 else 60
+        low, _, high = options.get('latency', '0').partition('-')
+        latency = (int(low), int(high or low))
+        script = [int(direction) for direction in options['script']] if options.get('script') else None
+        if script and not all(direction in X_DIRECTION for direction in script):
+            raise ValueError
+        room_size = int(options['players']) if options.get('players') else None
+        if options.get('receipts') and not room_size:
+            raise ValueError
+    except (IndexError, ValueError):
+        printUsage()
+        sys.exit(1)
+
+    fleet = Fleet(HOST, PORT, n_of_bots, latency, script, 'predict' in options, 'rejoin' in options, room_size,
+                  options.get('receipts'))
+    statistics = fleet.run(seconds)
+    print("[BOTS STOPPED]")
+    for name, value in statistics.items():
+        print(f"{name:<16}{value:.1f}" if isinstance(value, float) else f"{name:<16}{value}")
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        sys.exit()
@@ -0,0 +1,99 @@
+"""
+Clock synchronization of one client, in the way of NTP, so that the server knows the one way delays to and from the
+client, instead of taking both as RTT/2.
+
+The ping of the server(msg ID 5) carries the time stamp it was sent(T1). The client answers with T1, the time stamp it
+received the ping(T2) and the time stamp it sent the answer(T3), on its own clock; the server notes the time stamp the
+answer came in(T4). With theta the offset of the clock of the client to the clock of the server:
+
+    RTT = (T4 - T1) - (T3 - T2)             the time the client held the ping is left out
+    theta = ((T2 - T1) + (T3 - T4)) / 2     if both ways take equally long
+    down = T2 - T1 - theta                  server to client
+    up = T4 - T3 + theta                    client to server
+
+One exchange can not tell an offset apart from a difference between both ways. Therefore, the offset is taken from the
+exchange with the lowest RTT of the last FILTER_SIZE(the clock filter of NTP): that one waited the least in queues, and
+queuing is what makes the ways differ. The offset drifts with the difference in rate of both clocks(the skew), which
+is fitted by least squares on the offsets the filter selected. The asymmetry of the link is then the median of
+(down - RTT/2) over the exchanges in the filter.
+NOTE: a constant difference between both ways(e.g. an uplink that is always slower) shifts the offset, not the
+asymmetry, and no exchange of time stamps can measure it. What is measured, is the asymmetry that changes: the queue
+of one way filling up. If the clients run on the host of the server(Server.py --shared-clock), their clock is the one
+of the server, the offset is known to be 0, and the one way delays are measured as they are.
+
+The time stamps are time.monotonic() in microseconds, modulo 2^32(see timestamp in Protocol.py).
+"""
+import collections
+from statistics import median
+from Protocol import TIMESTAMP_MODULO
+
+FILTER_SIZE = 8  # Number of exchanges of which the one with the lowest RTT gives the offset
+SKEW_POINTS = 32  # Number of selected offsets the skew is fitted on
+MIN_SKEW_SPAN = 10_000_000  # µs the selected offsets have to span before the skew is fitted
+MAX_SKEW = 500e-6  # Largest skew(500 ppm) taken as real, a clock that drifts faster is broken(as in NTP)
+
+
+def wrap(difference):
+    """
+    A difference of two time stamps(µs), modulo 2^32, as the value closest to 0.
+    """
+    return (difference + TIMESTAMP_MODULO // 2) % TIMESTAMP_MODULO - TIMESTAMP_MODULO // 2
+
+
+class ClockEstimator():
+    def __init__(self, shared_clock=False):
+        self.shared_clock = shared_clock  # True if the client has the same clock as the server(offset 0, no skew)
+        self.exchanges = collections.deque(maxlen=FILTER_SIZE)  # (RTT, offset, T1, T2 - T1) of the last exchanges(µs)
+        self.offsets = collections.deque(maxlen=SKEW_POINTS)  # (T1, offset) of the exchanges selected by the filter
+        self.offset = 0  # µs, offset of the selected exchange
+        self.reference_time = 0  # T1 of the selected exchange
+        self.skew = 0.0  # µs of offset per µs
+
+    def addExchange(self, T1, T2, T3, T4):
+        """
+        Adding the time stamps of an answered ping. Returns the RTT(ms) of the exchange.
+        """
+        RTT = wrap(T4 - T1) - wrap(T3 - T2)
+        forward = wrap(T2 - T1)  # theta + down
+        offset = 0 if self.shared_clock else forward + wrap(T3 - T4 - forward) / 2
+        self.exchanges.append((RTT, offset, T1, forward))
+        _, best_offset, best_time, _ = min(self.exchanges)
+        if not self.shared_clock and best_time != self.reference_time:
+            self.offset = best_offset
+            self.reference_time = best_time
+            self.offsets.append((best_time, best_offset))
+            self.fitSkew()
+        return RTT / 1000
+
+    def fitSkew(self):
+        """
+        Least squares slope of the selected offsets over time, once they span MIN_SKEW_SPAN.
+        """
+        first_time, first_offset = self.offsets[0]
+        times = [wrap(time - first_time) for time, _ in self.offsets]
+        offsets = [wrap(offset - first_offset) for _, offset in self.offsets]
+        if len(times) < 3 or max(times) - min(times) < MIN_SKEW_SPAN:
+            return
+        mean_time = sum(times) / len(times)
+        mean_offset = sum(offsets) / len(offsets)
+        variance = sum((time - mean_time) ** 2 for time in times)
+        covariance = sum((time - mean_time) * (offset - mean_offset) for time, offset in zip(times, offsets))
+        self.skew = min(max(covariance / variance, -MAX_SKEW), MAX_SKEW)
+        return
+
+    def offsetAt(self, time_stamp):
+        """
+        The offset(µs) of the clock of the client at time_stamp of the server.
+        """
+        return self.offset + self.skew * wrap(time_stamp - self.reference_time)
+
+    def downDelay(self, RTT):
+        """
+        The delay(ms) from the server to the client, for the given RTT(ms) of the client: RTT/2 plus the asymmetry of
+        the exchanges in the filter, never below 0 nor above RTT.
+        """
+        if not self.exchanges:
+            return RTT / 2
+        asymmetry = median(wrap(forward - self.offsetAt(T1)) - exchange_RTT / 2
+                           for exchange_RTT, _, T1, forward in self.exchanges) / 1000
+        return min(max(RTT / 2 + asymmetry, 0), RTT)
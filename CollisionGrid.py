@@ -0,0 +1,67 @@
+"""
+Uniform grid index of the tiles of a level(network_game.py), for the collision and fruit checks of the player.
+
+The level is a grid of tiles, so the index has one cell per tile: each wall is in exactly one cell, and a query only
+looks at the cells the rectangle overlaps(at most 4 for a rectangle of one tile), instead of at every tile of the map.
+The cost of a query does thus not depend on the size of the level. A tile that is not aligned on the grid(the fruit)
+is put in every cell it overlaps.
+
+A rectangle(partly) outside the level is clamped to the cells on its border: the tiles of these cells are only
+candidates, the caller still checks them with colliderect.
+"""
+
+
+class CollisionGrid():
+    def __init__(self, n_of_columns, n_of_rows, cell_size):
+        self.n_of_columns = max(n_of_columns, 1)
+        self.n_of_rows = max(n_of_rows, 1)
+        self.cell_size = cell_size  # Width(and height) of a cell in pixels, the width of a tile
+        self.cells = [[] for _ in range(self.n_of_columns * self.n_of_rows)]  # The tiles of each cell, row after row
+
+    def cellsOf(self, rect):
+        """
+        Indices of the cells the rectangle overlaps(the right and bottom edge of a Rect are not part of it).
+        """
+        size = self.cell_size
+        first_x, last_x = rect.left // size, (rect.right - 1) // size
+        first_y, last_y = rect.top // size, (rect.bottom - 1) // size
+        if first_x < 0 or first_y < 0 or last_x >= self.n_of_columns or last_y >= self.n_of_rows or \
+                last_x < first_x or last_y < first_y:
+            first_x = min(max(first_x, 0), self.n_of_columns - 1)
+            last_x = min(max(last_x, first_x), self.n_of_columns - 1)
+            first_y = min(max(first_y, 0), self.n_of_rows - 1)
+            last_y = min(max(last_y, first_y), self.n_of_rows - 1)
+        columns = range(first_x, last_x + 1)
+        cells = []
+        for row_start in range(first_y * self.n_of_columns, last_y * self.n_of_columns + 1, self.n_of_columns):
+            for column in columns:
+                cells.append(row_start + column)
+        return cells
+
+    def insert(self, tile):
+        for cell in self.cellsOf(tile.rect):
+            self.cells[cell].append(tile)
+        return
+
+    def remove(self, tile):
+        """
+        Removing a tile that was inserted, with the rectangle it had when it was inserted.
+        """
+        for cell in self.cellsOf(tile.rect):
+            self.cells[cell].remove(tile)
+        return
+
+    def query(self, rect):
+        """
+        The tiles in the cells rect overlaps, in the order they were inserted per cell. A tile in more than one of these
+        cells is given once.
+        """
+        cells = self.cellsOf(rect)
+        if len(cells) == 1:
+            return self.cells[cells[0]]
+        tiles = []
+        for cell in cells:
+            for tile in self.cells[cell]:
+                if tile not in tiles:
+                    tiles.append(tile)
+        return tiles
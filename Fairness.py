@@ -0,0 +1,151 @@
+"""
+Fairness of the RTT-equalized fan-out: do all players really get a move at the same instant?
+
+Two logs, both CSV with one line per (move, recipient), are joined on (room, sender, move, recipient):
+    -the server(Server.py --fairness=<file>) logs the intended deadline of every copy of a move it relays: the time it
+    queues the copy for, plus the estimated one way delay down(server to client, see ClockSync.py) of the recipient.
+    This is the instant at which the server expects the recipient to get it.
+    -the bots(Bot.py --receipts=<file>) log the time each bot handled each move(after its artificial latency), the
+    echo of its own moves included.
+A move is identified by the player ID of its sender and its number: the server relays the moves of a player to every
+recipient in the order they were sent, so the n-th move a recipient gets from a player is the n-th move the server
+relayed of that player. The room of the bots is their group number(see Fleet in Bot.py), which is the room ID of the
+server if the bots are the first clients of a single process server.
+All times are time.monotonic() in seconds, thus the server and the bots have to run on the same machine.
+
+From the logs, two histograms are made:
+    -arrival skew: per move, the time between the first and the last recipient getting it. 0 if the equalization is
+    perfect.
+    -deadline error: per copy, the time it was received minus its intended deadline. A constant error is harmless,
+    a spread in the error means that the RTT estimates are off.
+
+Usage: python Fairness.py <receipts file of the bots> <[OPTIONAL]deadlines file of the server>
+    <[OPTIONAL]--bin=<ms>(default 1)> <[OPTIONAL]--output=<prefix of the histogram files>(default fairness)>
+"""
+import math
+import sys
+
+DEADLINE_COLUMNS = ('room', 'sender', 'move', 'recipient', 'deadline')  # Written by the server
+RECEIPT_COLUMNS = ('room', 'sender', 'move', 'recipient', 'received')  # Written by the bots
+
+
+def printUsage():
+    print("Usage: python", sys.argv[0], "<receipts file of the bots>", "<[OPTIONAL]deadlines file of the server>",
+          "<[OPTIONAL]--bin=<ms>(default 1)>", "<[OPTIONAL]--output=<prefix>(default fairness)>")
+    return
+
+
+class FairnessLog():
+    """
+    Appending the lines of a deadlines or receipts file. The lines are buffered by the file object, so logging a line
+    is cheap enough for the event loop of the server.
+    """
+    def __init__(self, path, columns):
+        self.file = open(path, 'w', buffering=1 << 16)
+        self.file.write(",".join(columns) + "\n")
+
+    def record(self, room, sender, move, recipient, time):
+        self.file.write(f"{room},{sender},{move},{recipient},{time:.6f}\n")
+        return
+
+    def flush(self):
+        self.file.flush()
+        return
+
+    def close(self):
+        self.file.close()
+        return
+
+
+def readLog(path):
+    """
+    {(room, sender, move, recipient): time} of a deadlines or receipts file.
+    """
+    times = {}
+    with open(path) as file:
+        next(file)  # Column names
+        for line in file:
+            room, sender, move, recipient, time = line.rstrip("\n").split(",")
+            times[(int(room), int(sender), int(move), int(recipient))] = float(time)
+    return times
+
+
+def arrivalSkews(receipts):
+    """
+    Time(ms) between the first and the last recipient of each move, for the moves that reached more than 1 recipient.
+    """
+    arrivals = {}
+    for (room, sender, move, _), received in receipts.items():
+        arrivals.setdefault((room, sender, move), []).append(received)
+    return [(max(times) - min(times)) * 1000 for times in arrivals.values() if len(times) > 1]
+
+
+def deadlineErrors(receipts, deadlines):
+    """
+    Time(ms) each copy was received after its intended deadline(negative if it came early).
+    """
+    return [(received - deadlines[key]) * 1000 for key, received in receipts.items() if key in deadlines]
+
+
+def histogram(values, bin_width):
+    """
+    [(lower bound of the bin(ms), number of values in the bin)], without leaving out the empty bins in between.
+    """
+    if not values:
+        return []
+    first = math.floor(min(values) / bin_width)
+    counts = [0] * (math.floor(max(values) / bin_width) - first + 1)
+    for value in values:
+        counts[math.floor(value / bin_width) - first] += 1
+    return [((first + index) * bin_width, count) for index, count in enumerate(counts)]
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
+
+
+def report(name, values, bin_width, path):
+    """
+    Printing the percentiles and a text histogram, and writing the histogram as CSV to path.
+    """
+    if not values:
+        print(f"[{name}] no values")
+        return
+    print(f"[{name}] {len(values)} values, p50 {percentile(values, 0.5):.2f} ms, p90 {percentile(values, 0.9):.2f} ms, "
+          f"p99 {percentile(values, 0.99):.2f} ms, max {max(values):.2f} ms")
+    bins = histogram(values, bin_width)
+    largest = max(count for _, count in bins)
+    with open(path, 'w') as file:
+        file.write("bin_ms,count\n")
+        for lower, count in bins:
+            file.write(f"{lower:g},{count}\n")
+            if count:
+                print(f"{lower:>9g} ms {count:>8} {'#' * math.ceil(count / largest * 50)}")
+    print("Histogram written to", path)
+    return
+
+
+def main():
+    arguments = [argument for argument in sys.argv if not argument.startswith('--')]
+    options = dict(argument[2:].partition('=')[::2] for argument in sys.argv if argument.startswith('--'))
+    try:
+        receipts = readLog(arguments[1])
+        deadlines = readLog(arguments[2]) if len(arguments) > 2 else None
+        bin_width = float(options.get('bin') or 1)
+        if bin_width <= 0:
+            raise ValueError
+    except (IndexError, ValueError, OSError):
+        printUsage()
+        sys.exit(1)
+    prefix = options.get('output') or 'fairness'
+
+    report("ARRIVAL SKEW", arrivalSkews(receipts), bin_width, prefix + "_skew.csv")
+    if deadlines is not None:
+        errors = deadlineErrors(receipts, deadlines)
+        print(f"{len(errors)} of {len(receipts)} receipts matched a deadline of the server")
+        report("DEADLINE ERROR", errors, bin_width, prefix + "_error.csv")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,24 @@
-import matplotlib
-matplotlib.use('TkAgg')
-import matplotlib.pyplot as plt
+"""
+Plots of the statistics of a match, made out of the file the server saved at the end of the match(Statistics.py). The
+server starts this script in its own process, so that the plotting stack is never loaded by the server itself. The
+plots can also be made later on:
+
+Usage: python HelperFunctions.py <statistics file>
+"""
+import sys
 import numpy as np
+from Statistics import loadStatistics
+
+
+def pyplot():
+    """"
+    matplotlib is only loaded once a plot is made, so that the analysis without plots(e.g. MetricsAnalysis.py) does not
+    need it.
+    """
+    import matplotlib
+    matplotlib.use('TkAgg')
+    import matplotlib.pyplot as plt
+    return plt
 
 
 def moving_average(data, window_size):
@@ -13,22 +30,23 @@ def moving_average(data, window_size):
     return np.convolve(data, weights, 'valid')
 
 
-def HistogramBitSend(bytes_dict):
+def HistogramBitSend(statistics):
     """
     Shows histogram of the frequency of messages send, classified by number of bytes. The histogram is made
-    for each player
+    for each player, out of the size histogram of his ClientStatistics(Statistics.py).
     """
+    plt = pyplot()
     # Create subplots for each client
-    fig, axs = plt.subplots(len(bytes_dict), 1, figsize=(10, 5 * len(bytes_dict)), sharex=False)
+    fig, axs = plt.subplots(len(statistics), 1, figsize=(10, 5 * len(statistics)), sharex=False, squeeze=False)
+    axs = axs[:, 0]
 
     # Iterating over each client
-    for i, (player_id, rtt_values) in enumerate(bytes_dict.items()):
-        bin_edges = np.arange(min(rtt_values) - 0.5, max(rtt_values) + 1.5, 1)
-
-        n, bins, patches = axs[i].hist(rtt_values, bins=bin_edges, edgecolor='black')
+    for i, (player_id, client_statistics) in enumerate(statistics.items()):
+        buckets = client_statistics.size_histogram.nonEmptyBuckets()
+        n = list(buckets.values())
+        bin_centers = list(buckets.keys())  # The message sizes are small enough to each have their own bucket
 
-        # Calculating bin centers
-        bin_centers = 0.5 * (bin_edges[:-1] + bin_edges[1:])
+        axs[i].bar(bin_centers, n, width=1, edgecolor='black')
 
         # Adding counts as text annotations at the center of each bin
         for count, bin_center in zip(n, bin_centers):
@@ -43,17 +61,20 @@ def HistogramBitSend(bytes_dict):
     plt.show()
     return
 
-def PlotCombined(num_rtt_dict, rtt_dict, bytes_dict, window_size, total_bytes):
+def PlotCombined(statistics, window_size):
     """"
-    Combined plot of:
+    Combined plot of, out of the ClientStatistics(Statistics.py) of each player:
         -RTT of each client in function the index/number of the ping message.
         -Plot of average byte send/received from client<->server(smoothed with window size 10).
+    Only the last messages and pings are kept, thus on a long game only the last part is plotted.
     """
+    plt = pyplot()
     # Creating a single figure with two subplots
     fig, axs = plt.subplots(2, 1, figsize=(10, 8), sharex=False)
 
-    for player_id, rtt_values in rtt_dict.items():
-        num_rtt_values = num_rtt_dict[player_id]
+    for player_id, client_statistics in statistics.items():
+        num_rtt_values = [n_of_ping for n_of_ping, _ in client_statistics.recent_RTTs]
+        rtt_values = [RTT for _, RTT in client_statistics.recent_RTTs]
         axs[0].plot(num_rtt_values, rtt_values, label=f"PLAYER {player_id}")
 
     axs[0].set_ylabel('RTT values(ms)')
@@ -61,9 +82,9 @@ def PlotCombined(num_rtt_dict, rtt_dict, bytes_dict, window_size, total_bytes):
     axs[0].legend()
 
     # Plotting smoothed, window size 10, byte values
-    for player_id, byte_values in bytes_dict.items():
-        smoothed_data = moving_average(byte_values, window_size)
-        axs[1].plot(smoothed_data, label=f'PLAYER {player_id} (total data transfer: {round(total_bytes[player_id]/1000, 2)} KB)')
+    for player_id, client_statistics in statistics.items():
+        smoothed_data = moving_average(client_statistics.averageBytes(), window_size)
+        axs[1].plot(smoothed_data, label=f'PLAYER {player_id} (total data transfer: {round(client_statistics.total_bytes/1000, 2)} KB)')
 
     axs[1].set_xlabel('Message number')
     axs[1].set_ylabel('AVERAGE byte values')
@@ -78,3 +99,19 @@ def PlotCombined(num_rtt_dict, rtt_dict, bytes_dict, window_size, total_bytes):
     plt.show()
 
     return
+
+
+def main():
+    if len(sys.argv) != 2:
+        print("Usage: python", sys.argv[0], "<statistics file>")
+        sys.exit(1)
+    statistics = loadStatistics(sys.argv[1])
+    try:
+        PlotCombined(statistics, 10)
+        HistogramBitSend(statistics)
+    except RuntimeError:
+        print('the plotting did not work')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+Compiling a level file(e.g. 1-1.txt) of the client(network_game.py) into a compact form: the size of the level in
+tiles, a bitmap of the walls(1 bit per tile, row after row), and the spawn tiles of the players in the order they are
+in the file(the n-th spawn tile is the one of player ID n).
+
+The compiled level is cached in CACHE_DIRECTORY, in a file named after the SHA-256 hash of the level file: a level is
+only parsed once, and again only if the file changed. A cache file is:
+
+    +-------------+------------+-------------+-------------+---------------+----------------------------+----------+
+    | magic(32)   | version(16)| columns(16) | rows(16)    | n_of_spawns(8)| spawns(column(16), row(16))| walls    |
+    +-------------+------------+-------------+-------------+---------------+----------------------------+----------+
+
+A cache file that can not be read, or of another FORMAT_VERSION, is compiled again.
+
+Usage: python LevelCompiler.py <level file>
+"""
+import hashlib
+import os
+import struct
+import sys
+
+WALL_TILE = '#'
+PLAYER_TILES = ('A', 'B', 'C', 'D')
+CACHE_DIRECTORY = 'LevelCache'  # The compiled levels are cached here
+FORMAT_VERSION = 1  # Version of the cache files, a cache file of another version is compiled again
+CACHE_HEADER = struct.Struct('<4sHHHB')  # magic, version, columns, rows, number of spawns
+SPAWN = struct.Struct('<HH')  # column, row
+MAGIC = b'SGPL'
+
+
+def printUsage():
+    print("Usage: python", sys.argv[0], "<level file>")
+    return
+
+
+class CompiledLevel():
+    def __init__(self, n_of_columns, n_of_rows, walls, spawns):
+        self.n_of_columns = n_of_columns
+        self.n_of_rows = n_of_rows
+        self.walls = walls  # bytes, bit(row * n_of_columns + column) is 1 if the tile is a wall
+        self.spawns = spawns  # (column, row) of the spawn tile of each player ID
+
+    def isWall(self, column, row):
+        cell = row * self.n_of_columns + column
+        return self.walls[cell >> 3] >> (cell & 7) & 1 == 1
+
+    def wallTiles(self):
+        """
+        (column, row) of every wall, row after row.
+        """
+        return [(column, row) for row in range(self.n_of_rows) for column in range(self.n_of_columns)
+                if self.isWall(column, row)]
+
+    def toBytes(self):
+        return CACHE_HEADER.pack(MAGIC, FORMAT_VERSION, self.n_of_columns, self.n_of_rows, len(self.spawns)) + \
+            b''.join(SPAWN.pack(column, row) for column, row in self.spawns) + self.walls
+
+    @classmethod
+    def fromBytes(cls, data):
+        """
+        The compiled level of a cache file, ValueError if it is not a valid cache file of this FORMAT_VERSION.
+        """
+        try:
+            magic, version, n_of_columns, n_of_rows, n_of_spawns = CACHE_HEADER.unpack_from(data)
+        except struct.error:
+            raise ValueError("Cache file is too short")
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError("Not a cache file of version " + str(FORMAT_VERSION))
+        start = CACHE_HEADER.size + n_of_spawns * SPAWN.size
+        walls = data[start:]
+        if len(walls) != (n_of_columns * n_of_rows + 7) // 8:
+            raise ValueError("Wall bitmap does not match the size of the level")
+        spawns = [SPAWN.unpack_from(data, CACHE_HEADER.size + index * SPAWN.size) for index in range(n_of_spawns)]
+        return cls(n_of_columns, n_of_rows, bytes(walls), spawns)
+
+
+def compileLevel(text):
+    """
+    Parsing the text of a level file: every character is one tile.
+    """
+    rows = text.splitlines()
+    n_of_columns = max((len(row) for row in rows), default=0)
+    walls = bytearray((n_of_columns * len(rows) + 7) // 8)
+    spawns = []
+    for row, tiles in enumerate(rows):
+        for column, tile in enumerate(tiles):
+            if tile == WALL_TILE:
+                cell = row * n_of_columns + column
+                walls[cell >> 3] |= 1 << (cell & 7)
+            elif tile in PLAYER_TILES:
+                spawns.append((column, row))
+    return CompiledLevel(n_of_columns, len(rows), bytes(walls), spawns)
+
+
+def cachePath(data):
+    return os.path.join(CACHE_DIRECTORY, hashlib.sha256(data).hexdigest() + '.level')
+
+
+def loadLevel(path):
+    """
+    The compiled level of the level file at path, from the cache if it was compiled before. A level that is compiled
+    is written to the cache; if that fails, the level is still returned.
+    """
+    with open(path, 'rb') as file:
+        data = file.read()
+    cache_path = cachePath(data)
+    try:
+        with open(cache_path, 'rb') as file:
+            return CompiledLevel.fromBytes(file.read())
+    except (OSError, ValueError):
+        pass
+    compiled = compileLevel(data.decode())
+    try:
+        os.makedirs(CACHE_DIRECTORY, exist_ok=True)
+        # Written under another name first, so that a client that starts at the same time never reads half a file.
+        temporary_path = cache_path + '.' + str(os.getpid())
+        with open(temporary_path, 'wb') as file:
+            file.write(compiled.toBytes())
+        os.replace(temporary_path, cache_path)
+    except OSError:
+        pass
+    return compiled
+
+
+def main():
+    if len(sys.argv) != 2:
+        printUsage()
+        sys.exit(1)
+    try:
+        compiled = loadLevel(sys.argv[1])
+    except (OSError, UnicodeDecodeError):
+        printUsage()
+        sys.exit(1)
+    print(f"{compiled.n_of_columns} x {compiled.n_of_rows} tiles, {len(compiled.wallTiles())} walls, "
+          f"{len(compiled.spawns)} spawns, {len(compiled.toBytes())} bytes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+Offline analysis of a metrics log of the server(MetricsLog.py). The file is memory-mapped as a NumPy array, and gone
+over chunk by chunk: only the aggregates are kept in memory, so the logs of a whole day of matches can be analysed
+without reading them in at once.
+
+Usage: python MetricsAnalysis.py <metrics file> <[OPTIONAL]--chunk=<records per chunk>(default 1000000)>
+    <[OPTIONAL]--plot(plot the traffic per second, the message sizes and the RTTs)>
+"""
+import os
+import sys
+import time
+import numpy as np
+from HelperFunctions import moving_average, pyplot
+from MetricsLog import RECORD_FIELDS, RECEIVED, SENT
+from Statistics import MAX_MESSAGE_BYTES, MAX_RTT
+
+RECORD_DTYPE = np.dtype(RECORD_FIELDS)
+MAX_MSG_ID = 7
+
+
+def printUsage():
+    print("Usage: python", sys.argv[0], "<metrics file>", "<[OPTIONAL]--chunk=<records per chunk>(default 1000000)>",
+          "<[OPTIONAL]--plot>")
+    return
+
+
+def countsPercentile(counts, fraction):
+    """
+    The value below which the given fraction of the values lies, counts[value] being the number of times value occurs.
+    """
+    cumulative = np.cumsum(counts)
+    if not cumulative[-1]:
+        return None
+    return int(np.searchsorted(cumulative, fraction * cumulative[-1], side='right'))
+
+
+def analyse(path, chunk):
+    """
+    Going once over the records, chunk records at a time. Only the aggregates are kept:
+        -the number of messages and bytes per (direction, msg ID),
+        -the number of messages per size(bytes), and per RTT(ms) of the pings received,
+        -the number of messages and bytes per second, per direction.
+    """
+    n_of_records = os.path.getsize(path) // RECORD_DTYPE.itemsize  # A record that is only half written is left out
+    if n_of_records == 0:
+        return None
+    records = np.memmap(path, dtype=RECORD_DTYPE, mode='r', shape=(n_of_records,))
+    start_time = float(records[0]['timestamp'])
+    keys = 2 * (MAX_MSG_ID + 1)
+    messages = np.zeros(keys, dtype=np.int64)
+    bytes_per_key = np.zeros(keys, dtype=np.int64)
+    sizes = np.zeros(MAX_MESSAGE_BYTES + 1, dtype=np.int64)
+    RTTs = np.zeros(MAX_RTT + 1, dtype=np.int64)
+    messages_s = [np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)]  # Per direction
+    bytes_s = [np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)]
+
+    for first in range(0, n_of_records, chunk):
+        block = records[first:first + chunk]
+        n_of_bytes = block['bytes'].astype(np.int64)
+        key = block['direction'].astype(np.int64) * (MAX_MSG_ID + 1) + np.minimum(block['msg_id'], MAX_MSG_ID)
+        messages += np.bincount(key, minlength=keys)
+        bytes_per_key += np.bincount(key, weights=n_of_bytes, minlength=keys).astype(np.int64)
+        sizes += np.bincount(np.minimum(n_of_bytes, MAX_MESSAGE_BYTES), minlength=MAX_MESSAGE_BYTES + 1)
+        pings = block['RTT'][(block['msg_id'] == 5) & (block['direction'] == RECEIVED)]
+        RTTs += np.bincount(np.clip(np.rint(pings), 0, MAX_RTT).astype(np.int64), minlength=MAX_RTT + 1)
+        second = np.maximum(block['timestamp'] - start_time, 0).astype(np.int64)
+        for direction in (RECEIVED, SENT):
+            selected = block['direction'] == direction
+            counts = np.bincount(second[selected])
+            weights = np.bincount(second[selected], weights=n_of_bytes[selected]).astype(np.int64)
+            if len(counts) > len(messages_s[direction]):
+                messages_s[direction] = np.pad(messages_s[direction], (0, len(counts) - len(messages_s[direction])))
+                bytes_s[direction] = np.pad(bytes_s[direction], (0, len(counts) - len(bytes_s[direction])))
+            messages_s[direction][:len(counts)] += counts
+            bytes_s[direction][:len(weights)] += weights
+
+    return {'n_of_records': n_of_records, 'start_time': start_time,
+            'end_time': float(records[n_of_records - 1]['timestamp']), 'messages': messages,
+            'bytes': bytes_per_key, 'sizes': sizes, 'RTTs': RTTs, 'messages_s': messages_s, 'bytes_s': bytes_s}
+
+
+def printAnalysis(analysis):
+    duration = max(analysis['end_time'] - analysis['start_time'], 1e-9)
+    print(f"{analysis['n_of_records']} records, {duration:.1f} s, from "
+          f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(analysis['start_time']))}")
+    print(f"{'direction':<11}{'msg ID':>7}{'messages':>12}{'bytes':>14}{'bytes/msg':>11}")
+    for direction, name in ((RECEIVED, 'received'), (SENT, 'sent')):
+        for msg_id in range(MAX_MSG_ID + 1):
+            key = direction * (MAX_MSG_ID + 1) + msg_id
+            n_of_messages = int(analysis['messages'][key])
+            if n_of_messages:
+                n_of_bytes = int(analysis['bytes'][key])
+                print(f"{name:<11}{msg_id:>7}{n_of_messages:>12}{n_of_bytes:>14}{n_of_bytes / n_of_messages:>11.2f}")
+    for direction, name in ((RECEIVED, 'received'), (SENT, 'sent')):
+        per_second = analysis['messages_s'][direction]
+        if len(per_second):
+            print(f"{name}: {per_second.sum() / duration:.0f} messages/s on average, {per_second.max()} in the busiest "
+                  f"second, {analysis['bytes_s'][direction].sum() / duration / 1000:.1f} KB/s")
+    print(f"message size(bytes): p50 {countsPercentile(analysis['sizes'], 0.5)}, "
+          f"p99 {countsPercentile(analysis['sizes'], 0.99)}")
+    if analysis['RTTs'].any():
+        print(f"RTT of the pings(ms): p50 {countsPercentile(analysis['RTTs'], 0.5)}, "
+              f"p90 {countsPercentile(analysis['RTTs'], 0.9)}, p99 {countsPercentile(analysis['RTTs'], 0.99)}")
+    return
+
+
+def plotAnalysis(analysis, window_size=10):
+    """
+    Traffic per second(smoothed with moving_average), and the histograms of the message sizes and of the RTTs.
+    """
+    plt = pyplot()
+    fig, axs = plt.subplots(3, 1, figsize=(10, 12), sharex=False)
+    for direction, name in ((RECEIVED, 'received'), (SENT, 'sent')):
+        bytes_s = analysis['bytes_s'][direction]
+        if len(bytes_s) >= window_size:
+            axs[0].plot(moving_average(bytes_s, window_size) / 1000, label=f"{name}(smoothed, window {window_size} s)")
+    axs[0].set_xlabel('Time(s)')
+    axs[0].set_ylabel('KB/s')
+    axs[0].legend()
+
+    sizes = np.nonzero(analysis['sizes'])[0]
+    axs[1].bar(sizes, analysis['sizes'][sizes], width=1, edgecolor='black')
+    axs[1].set_xlabel('Number of bytes')
+    axs[1].set_ylabel('Frequency')
+
+    RTTs = np.nonzero(analysis['RTTs'])[0]
+    axs[2].bar(RTTs, analysis['RTTs'][RTTs], width=1)
+    axs[2].set_xlabel('RTT of the pings(ms)')
+    axs[2].set_ylabel('Frequency')
+
+    plt.tight_layout()
+    plt.show()
+    return
+
+
+def main():
+    arguments = [argument for argument in sys.argv if not argument.startswith('--')]
+    options = dict(argument[2:].partition('=')[::2] for argument in sys.argv if argument.startswith('--'))
+    try:
+        path = arguments[1]
+        chunk = int(options.get('chunk') or 1_000_000)
+        if chunk < 1:
+            raise ValueError
+        analysis = analyse(path, chunk)
+    except (IndexError, ValueError, OSError):
+        printUsage()
+        sys.exit(1)
+    if analysis is None:
+        print("No records in", path)
+        return
+    printAnalysis(analysis)
+    if 'plot' in options:
+        plotAnalysis(analysis)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Streaming metrics log of the server(Server.py --metrics=<file>): one fixed-width binary record per message the server
+sends or receives, appended to the file by a background thread, so that the event loop never waits for the disk.
+
+Each record is RECORD(22 bytes, little endian, no header in the file):
+
+    +----------------+----------+-----------+----------+-------------+---------+----------+--------------+
+    | timestamp(64)  | room(32) | client(8) | msg ID(8)| direction(8)| pad(8)  | bytes(16)| RTT(32)      |
+    +----------------+----------+-----------+----------+-------------+---------+----------+--------------+
+
+    -timestamp: time.time() in seconds(double), so that the logs of several runs can be put next to each other.
+    -room: the room ID, client: the player ID in the room.
+    -direction: RECEIVED(from the client) or SENT(to the client).
+    -bytes: the size of the message, RTT: the RTT estimate(ms, float) of the client at that moment.
+
+As all records have the same width, the file can be memory-mapped as a NumPy array, and analysed chunk by chunk by
+MetricsAnalysis.py. This module does not import NumPy itself, so that the server does not load it.
+"""
+import queue
+import struct
+import threading
+import time
+
+RECORD = struct.Struct('<dIBBBxHf')
+RECORD_FIELDS = [('timestamp', '<f8'), ('room', '<u4'), ('client', 'u1'), ('msg_id', 'u1'), ('direction', 'u1'),
+                 ('pad', 'u1'), ('bytes', '<u2'), ('RTT', '<f4')]  # The same layout, as a NumPy dtype
+RECEIVED = 0
+SENT = 1
+WRITE_INTERVAL = 0.1  # Seconds between two writes of the writer thread, the records of that time are written at once
+
+
+class MetricsWriter():
+    """
+    Appending records to the metrics file. record only puts the values in a queue; every WRITE_INTERVAL, the writer
+    thread packs all records that are waiting, and writes them at once.
+    """
+    def __init__(self, path):
+        self.file = open(path, 'ab')
+        self.records = queue.SimpleQueue()
+        self.thread = threading.Thread(target=self.write, daemon=True)
+        self.thread.start()
+
+    def record(self, room, client, msg_id, direction, n_of_bytes, RTT):
+        self.records.put((time.time(), room, client, msg_id, direction, n_of_bytes, RTT))
+        return
+
+    def write(self):
+        while True:
+            records = [self.records.get()]
+            while True:
+                try:
+                    records.append(self.records.get_nowait())
+                except queue.Empty:
+                    break
+            closing = records[-1] is None
+            self.file.write(b''.join(RECORD.pack(*values) for values in records if values is not None))
+            self.file.flush()
+            if closing:
+                return
+            time.sleep(WRITE_INTERVAL)
+
+    def close(self):
+        """
+        Writing the records that are still waiting, and closing the file.
+        """
+        self.records.put(None)
+        self.thread.join()
+        self.file.close()
+        return
@@ -0,0 +1,170 @@
+"""
+Live metrics of the server(Server.py --monitor=<port>), in the plain text format of Prometheus, over HTTP on the local
+host:
+
+    curl http://127.0.0.1:<port>/metrics
+
+The counters are plain integers and floats on the server(Counters), updated by the event loop itself: the server is
+single threaded, so the hot path needs no lock, only an addition. The endpoint is served by the same event loop, and
+never blocks it: a scrape is a non-blocking accept, one recv and a non-blocking send. What does not fit in the send
+buffer is kept, and sent once the selector reports the connection of the scraper writable. The rates(messages/s) are
+computed from the counters once per second, also in the event loop, so that a scrape does not depend on when the
+previous one was.
+"""
+import socket
+import selectors
+import time
+
+N_OF_MSG_IDS = 8  # Message IDs 0 to 7, the index of the counters per message ID
+DIRECTIONS = ('received', 'sent')
+
+
+class Counters():
+    """
+    Counters the server updates on the hot path.
+    """
+    def __init__(self):
+        self.messages = {'received': [0] * N_OF_MSG_IDS, 'sent': [0] * N_OF_MSG_IDS}  # Per direction, per msg ID
+        self.bytes = {'received': 0, 'sent': 0}
+        self.fan_out_seconds = 0.0  # Time spent computing the delays of the fan-out, and queuing the responses
+        self.delivery_seconds = 0.0  # Time spent sending the responses of which the delay has passed
+        self.start_time = time.monotonic()
+
+
+class MetricsEndpoint():
+    """
+    The listening socket of the metrics, and the connections of the scrapers, all on the selector of the server.
+    """
+    def __init__(self, server, port, host='127.0.0.1'):
+        self.server = server
+        self.listening_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listening_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listening_socket.bind((host, port))
+        self.listening_socket.listen()
+        self.listening_socket.setblocking(False)
+        self.server.selector.register(self.listening_socket, selectors.EVENT_READ, data=self)
+        self.last_sample = time.monotonic()
+        self.last_messages = {direction: [0] * N_OF_MSG_IDS for direction in DIRECTIONS}
+        self.rates = {direction: [0.0] * N_OF_MSG_IDS for direction in DIRECTIONS}  # Messages/s of the last second
+        self.responses = {}  # The part of the response that is not sent yet, of each scraper that waits for writable
+
+    def handle(self, fileobj):
+        """
+        Called by the event loop if the listening socket, or the connection of a scraper is readable. Once the request
+        of a scraper is read, the connection is only registered for writable, until the whole response is sent.
+        """
+        if fileobj is self.listening_socket:
+            try:
+                connection, _ = self.listening_socket.accept()
+            except BlockingIOError:
+                return
+            connection.setblocking(False)
+            self.server.selector.register(connection, selectors.EVENT_READ, data=self)
+            return
+        if fileobj in self.responses:
+            self.send(fileobj, self.responses[fileobj])
+            return
+        try:
+            request = fileobj.recv(4096)
+        except BlockingIOError:
+            return
+        except OSError:
+            request = b''
+        if not request:
+            # The scraper closed the connection(or it broke).
+            self.close(fileobj)
+            return
+        body = self.render().encode()
+        self.send(fileobj, memoryview(b"HTTP/1.0 200 OK\r\nContent-Type: text/plain; version=0.0.4\r\n"
+                                      b"Content-Length: " + str(len(body)).encode() + b"\r\n\r\n" + body))
+        return
+
+    def send(self, fileobj, response):
+        """
+        Sending as much of the response as the send buffer takes. The rest is sent once the connection is writable.
+        """
+        try:
+            response = response[fileobj.send(response):]
+        except BlockingIOError:
+            pass
+        except OSError:
+            self.close(fileobj)
+            return
+        if not response:
+            self.close(fileobj)
+            return
+        if fileobj not in self.responses:
+            self.server.selector.modify(fileobj, selectors.EVENT_WRITE, data=self)
+        self.responses[fileobj] = response
+        return
+
+    def close(self, fileobj):
+        self.responses.pop(fileobj, None)
+        self.server.selector.unregister(fileobj)
+        fileobj.close()
+        return
+
+    def sample(self):
+        """
+        Called every pass of the event loop: once per second, the rates are computed out of the counters.
+        """
+        now = time.monotonic()
+        elapsed = now - self.last_sample
+        if elapsed < 1:
+            return
+        for direction in DIRECTIONS:
+            messages = self.server.counters.messages[direction]
+            self.rates[direction] = [(n_of_messages - last) / elapsed
+                                     for n_of_messages, last in zip(messages, self.last_messages[direction])]
+            self.last_messages[direction] = list(messages)
+        self.last_sample = now
+        return
+
+    def render(self):
+        server = self.server
+        counters = server.counters
+        lines = [
+            "# TYPE sgp_uptime_seconds gauge",
+            f"sgp_uptime_seconds {time.monotonic() - counters.start_time:.3f}",
+            "# TYPE sgp_connected_sockets gauge",
+            f"sgp_connected_sockets {len(server.room_of)}",
+            "# TYPE sgp_rooms gauge",
+            f"sgp_rooms {len(server.rooms)}",
+            "# TYPE sgp_rooms_playing gauge",
+            f"sgp_rooms_playing {sum(1 for room in server.rooms if room.game_started)}",
+            "# TYPE sgp_messages_total counter",
+        ]
+        for direction in DIRECTIONS:
+            for msg_id, n_of_messages in enumerate(counters.messages[direction]):
+                if n_of_messages:
+                    lines.append(f'sgp_messages_total{{direction="{direction}",msg_id="{msg_id}"}} {n_of_messages}')
+        lines.append("# TYPE sgp_messages_per_second gauge")
+        for direction in DIRECTIONS:
+            for msg_id, rate in enumerate(self.rates[direction]):
+                if counters.messages[direction][msg_id]:
+                    lines.append(f'sgp_messages_per_second{{direction="{direction}",msg_id="{msg_id}"}} {rate:.1f}')
+        lines.append("# TYPE sgp_bytes_total counter")
+        for direction in DIRECTIONS:
+            lines.append(f'sgp_bytes_total{{direction="{direction}"}} {counters.bytes[direction]}')
+        lines += [
+            "# TYPE sgp_fan_out_queue_depth gauge",
+            f"sgp_fan_out_queue_depth {len(server.scheduler)}",
+            "# TYPE sgp_tick_inputs_waiting gauge",
+            f"sgp_tick_inputs_waiting {sum(len(room.tick_inputs) for room in server.rooms)}",
+            "# TYPE sgp_fan_out_seconds_total counter",
+            f"sgp_fan_out_seconds_total {counters.fan_out_seconds:.6f}",
+            "# TYPE sgp_delivery_seconds_total counter",
+            f"sgp_delivery_seconds_total {counters.delivery_seconds:.6f}",
+            "# TYPE sgp_rtt_ms gauge",
+        ]
+        for room in server.rooms:
+            for connection_socket, RTT in room.RTT_clients.items():
+                lines.append(f'sgp_rtt_ms{{room="{room.room_id}",player="{room.assigned_id[connection_socket]}"}} '
+                             f'{RTT:.2f}')
+        lines.append("# TYPE sgp_one_way_delay_ms gauge")
+        for room in server.rooms:
+            for connection_socket, down in room.down_clients.items():
+                labels = f'room="{room.room_id}",player="{room.assigned_id[connection_socket]}"'
+                lines.append(f'sgp_one_way_delay_ms{{{labels},way="down"}} {down:.2f}')
+                lines.append(f'sgp_one_way_delay_ms{{{labels},way="up"}} {room.up_clients[connection_socket]:.2f}')
+        return "\n".join(lines) + "\n"
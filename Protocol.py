@@ -0,0 +1,210 @@
+"""
+Codec of the SGP messages, shared by the server(Server.py) and the client(network_game.py).
+
+Every message starts with the 1 byte header:
+
+       0     1     2     3     4     5     6     7
+    +-----+-----+-----+-----+-----+-----+-----+-----+
+    |    Message ID   | Player ID |    Direction    |
+    +-----+-----+-----+-----+-----+-----+-----+-----+
+
+Instead of building the header bit by bit out of '0'/'1' strings, all 256 headers are computed once when this module
+is imported:
+    -HEADER[msg_id][player_id][direction] gives the header as integer(to pack it with a struct)
+    -HEADER_BYTES[header] gives the header as 1 byte message(for the messages that only consist of a header)
+    -HEADER_DECODE[header] gives back (msg_id, player_id, direction)
+The data after the header is a sequence of 16-bit big-endian numbers, so every message layout is one precompiled
+struct. There are three exceptions:
+    -the batch(msg ID 7), which has a 1 byte length after the header, followed by that many bytes of complete messages.
+    -the ping(msg ID 5), of which the time stamps are 32-bit(see timestamp). The ping of the server and the answer of
+    the client have a different length(see ClockSync.py).
+    -the ID assignment(msg ID 1) of a server started with --udp, which has direction 1 and the 32-bit session of the
+    client after the header(see Transport.py).
+"""
+import struct
+import time
+
+HEADER = [[[(msg_id << 5) | (player_id << 3) | direction for direction in range(8)]
+           for player_id in range(4)] for msg_id in range(8)]
+HEADER_BYTES = [bytes([header]) for header in range(256)]
+HEADER_DECODE = [(header >> 5, (header >> 3) & 0b11, header & 0b111) for header in range(256)]
+
+PING = struct.Struct('>BI')  # 5 bytes: header + time stamp of the server(msg ID 5, server to client)
+SESSION = struct.Struct('>BI')  # 5 bytes: header + UDP session of the client(msg ID 1 with direction 1, only --udp)
+PING_REPLY = struct.Struct('>BIII')  # 13 bytes: header + time stamp of the server + time stamps the client received the
+# ping and sent the answer(msg ID 5, client to server)
+TIMESTAMP_MODULO = 1 << 32
+POSITION = struct.Struct('>BHH')  # 5 bytes: header + x + y(msg ID 3/6 with absolute position, msg ID 6(s) relative)
+START = struct.Struct('>BHHH')  # 7 bytes: header + time left + fruit x + fruit y(msg ID 2)
+POSITION_FRUIT = struct.Struct('>BHHHH')  # 9 bytes: header + x + y + fruit x + fruit y(msg ID 6(s) absolute)
+COORDINATES = struct.Struct('>HH')  # 4 bytes: x + y, without header
+MAX_BATCH = 255  # A batch(msg ID 7) holds at most 255 bytes of messages, because its length is 1 byte
+VARIABLE_LENGTH = -1  # Frame length of a batch: the length follows from the byte after the header
+STEPS_S = 30  # Simulation steps per second of every client, whatever the FPS it renders with
+STEP_PIXELS = {0: 13, 1: 20, 2: 27}  # Pixels a player moves per step(msg ID 3/6 with a direction), per speed field of
+# the start message(msg ID 2): 0.4, 0.6 and 0.8 pixels per ms, rounded. These are integers, so that a direction moves a
+# player exactly as far on every client.
+
+
+def _clientFrameLength(header):
+    """
+    Length(in bytes) of a message sent by a client to the server, 0 if the message ID is unknown.
+    """
+    msg_id, _, direction = HEADER_DECODE[header]
+    if msg_id == 3 or msg_id == 6:
+        return POSITION.size if direction == 0 else 1
+    if msg_id == 5:
+        return PING_REPLY.size
+    if msg_id == 4:
+        return 1
+    return 0
+
+
+def _serverFrameLength(header):
+    """
+    Length(in bytes) of a message sent by the server to a client, 0 if the message ID is unknown. A message with ID 6
+    is 4 bytes longer than the one the client sent, because the server adds the new fruit position.
+    """
+    msg_id, _, direction = HEADER_DECODE[header]
+    if msg_id == 1:
+        return SESSION.size if direction == 1 else 1
+    if msg_id == 4:
+        return 1
+    if msg_id == 2:
+        return START.size
+    if msg_id == 3:
+        return POSITION.size if direction == 0 else 1
+    if msg_id == 5:
+        return PING.size
+    if msg_id == 6:
+        return POSITION_FRUIT.size if direction == 0 else POSITION.size
+    if msg_id == 7:
+        return VARIABLE_LENGTH
+    return 0
+
+
+CLIENT_FRAME_LENGTH = [_clientFrameLength(header) for header in range(256)]
+SERVER_FRAME_LENGTH = [_serverFrameLength(header) for header in range(256)]
+
+LAYOUT = {layout.size: layout for layout in (POSITION, START, POSITION_FRUIT)}  # The layout of each message length
+PING_LAYOUT = {layout.size: layout for layout in (PING, PING_REPLY)}  # A ping has the length of a position
+
+
+def timestamp():
+    """
+    The time stamp of the pings: time.monotonic() in microseconds, modulo 2^32. A monotonic clock does not jump when
+    the clock of the system is set. It wraps every 71 minutes, which is harmless: only differences of time stamps are
+    used, and these are taken modulo 2^32 as well.
+    """
+    return int(time.monotonic() * 1_000_000) % TIMESTAMP_MODULO
+
+
+def pingReply(ping, received):
+    """
+    The answer of a client to a ping of the server: the header(with the sequence number) and the time stamp of the
+    server unchanged, the time stamp the client received the ping, and the one it sends the answer(now).
+    """
+    header, server_time = PING.unpack(ping)
+    return PING_REPLY.pack(header, server_time, received, timestamp())
+
+
+def decodeFrame(frame):
+    """
+    Decoding one complete message into (msg_id, player_id, direction, data), where data is the tuple of the 16-bit
+    values that follow the header(empty if the message is only a header), or of the 32-bit time stamps of a ping, or
+    of the 32-bit session of an ID assignment.
+    A batch(msg ID 7) is not decoded itself, but split into its messages with splitBatch.
+    """
+    msg_id, player_id, direction = HEADER_DECODE[frame[0]]
+    if len(frame) == 1:
+        return msg_id, player_id, direction, ()
+    if msg_id == 5:
+        return msg_id, player_id, direction, PING_LAYOUT[len(frame)].unpack(frame)[1:]
+    if msg_id == 1:
+        return msg_id, player_id, direction, SESSION.unpack(frame)[1:]
+    return msg_id, player_id, direction, LAYOUT[len(frame)].unpack(frame)[1:]
+
+
+def encodeBatches(frames):
+    """
+    Packing a list of complete messages into as few batches(msg ID 7) as possible. A message is never split over two
+    batches.
+    """
+    batches = []
+    content = b''
+    for frame in frames:
+        if len(content) + len(frame) > MAX_BATCH:
+            batches.append(HEADER_BYTES[HEADER[7][0][0]] + HEADER_BYTES[len(content)] + content)
+            content = b''
+        content += frame
+    if content:
+        batches.append(HEADER_BYTES[HEADER[7][0][0]] + HEADER_BYTES[len(content)] + content)
+    return batches
+
+
+def splitBatch(batch):
+    """
+    Generator of the messages in a batch(msg ID 7).
+    """
+    start = 2
+    while start < len(batch):
+        n_of_bytes = SERVER_FRAME_LENGTH[batch[start]]
+        yield batch[start:start + n_of_bytes]
+        start += n_of_bytes
+
+
+class FrameBuffer():
+    """
+    Receive buffer of one TCP connection. TCP is stream-oriented, so a recv can hold several messages, or only a part
+    of one. The bytes are received with recv_into in one preallocated bytearray, and every complete message is handed
+    out as a memoryview on this bytearray, thus without copying. Only the (at most 12 bytes of the) last incomplete
+    message are moved to the front of the buffer, once all complete messages are handled.
+
+    NOTE: a frame is only valid until the next receiveFrom; a frame that needs to be kept must be copied with bytes().
+    """
+    def __init__(self, frame_length, size=4096):
+        self.frame_length = frame_length  # CLIENT_FRAME_LENGTH or SERVER_FRAME_LENGTH, depending on the receiver
+        self.buffer = bytearray(size)
+        self.view = memoryview(self.buffer)
+        self.start = 0  # Index of the first byte that is not handled yet
+        self.end = 0  # Index after the last received byte
+
+    def receiveFrom(self, connection_socket):
+        """
+        Receiving as many bytes as there is place for. Returns the number of received bytes(0 if the peer closed the
+        connection).
+        """
+        n_of_bytes = connection_socket.recv_into(self.view[self.end:])
+        self.end += n_of_bytes
+        return n_of_bytes
+
+    def frames(self):
+        """
+        Generator of all complete messages in the buffer, in the order they were received.
+        """
+        while self.start < self.end:
+            n_of_bytes = self.frame_length[self.buffer[self.start]]
+            if n_of_bytes == 0:
+                raise ValueError("Unknown message ID in header " + str(self.buffer[self.start]))
+            if n_of_bytes == VARIABLE_LENGTH:
+                if self.end - self.start < 2:
+                    break
+                n_of_bytes = 2 + self.buffer[self.start + 1]
+            if self.end - self.start < n_of_bytes:
+                # In case data has come partially in, the rest will come with the next receive.
+                break
+            self.start += n_of_bytes
+            yield self.view[self.start - n_of_bytes:self.start]
+        self.compact()
+
+    def compact(self):
+        """
+        Moving the incomplete message to the front, so that the whole buffer is free for the next receive.
+        """
+        if self.start == 0:
+            return
+        remaining = self.end - self.start
+        self.buffer[0:remaining] = self.buffer[self.start:self.end]
+        self.start = 0
+        self.end = remaining
+        return
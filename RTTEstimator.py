@@ -0,0 +1,87 @@
+"""
+RTT estimate of one client, with the estimator of Jacobson/Karels(the one TCP uses for its retransmission timeout):
+a smoothed RTT(SRTT), and a smoothed mean deviation(RTTVAR) of the samples from it.
+
+    RTTVAR = (1 - BETA) * RTTVAR + BETA * |SRTT - sample|
+    SRTT = (1 - ALPHA) * SRTT + ALPHA * sample
+
+A sample that is more than OUTLIER_FACTOR deviations above SRTT(e.g. a ping that waited behind a retransmission) is
+left out, unless MAX_REJECTED samples in a row are: then the RTT itself has changed, and the sample is used.
+
+The server does not equalize on SRTT itself, but on a quantile of the RTT, assuming the samples are normally
+distributed around SRTT: estimate = SRTT + z(quantile) * sigma, the standard deviation sigma being about 1.25 * RTTVAR
+(the mean deviation of a normal distribution is sigma * sqrt(2/pi)). The quantile 0.5 gives SRTT.
+
+Before the game, the server probes each client with a burst of pings. Once the samples of a client have converged(see
+hasConverged), the estimator is seeded with their median and median deviation, which an outlier does not pull away
+like it does the smoothed values of a few samples.
+"""
+import math
+from statistics import NormalDist, median, stdev
+
+ALPHA = 1 / 8
+BETA = 1 / 4
+OUTLIER_FACTOR = 4
+MAX_REJECTED = 3
+MIN_RTTVAR = 2  # ms, a smaller deviation is the jitter of the event loops, not of the connection
+SIGMA_PER_RTTVAR = 1.25
+RTTVAR_PER_MAD = 1.18  # The mean deviation of a normal distribution is about 1.18 times its median absolute deviation
+MIN_PROBING_SAMPLES = 5  # Number of probing samples of a client before its probing may stop
+CONVERGED_MS = 1  # The probing stops once the standard error of the mean of the samples is below this(ms), or below
+CONVERGED_FRACTION = 0.02  # this fraction of the mean
+
+
+def hasConverged(samples):
+    """
+    True if the probing samples(ms) of a client are enough to start the game with: at least MIN_PROBING_SAMPLES, and
+    their mean is known to within CONVERGED_MS(or CONVERGED_FRACTION of it). A jittery connection is probed longer.
+    """
+    if len(samples) < MIN_PROBING_SAMPLES:
+        return False
+    mean = sum(samples) / len(samples)
+    return stdev(samples) / math.sqrt(len(samples)) <= max(CONVERGED_MS, CONVERGED_FRACTION * mean)
+
+
+class RTTEstimator():
+    def __init__(self, quantile=0.5):
+        self.z = NormalDist().inv_cdf(quantile)
+        self.SRTT = None  # ms, None until the first sample
+        self.RTTVAR = 0
+        self.n_of_samples = 0  # Samples that were used
+        self.n_of_outliers = 0  # Samples that were left out
+        self.n_of_rejected = 0  # Samples left out in a row
+
+    def addSample(self, RTT):
+        """
+        Updating the estimate with a new sample(ms). Returns False if the sample was left out as an outlier.
+        """
+        if self.SRTT is None:
+            self.SRTT = RTT
+            self.RTTVAR = RTT / 2
+        elif RTT > self.SRTT + OUTLIER_FACTOR * max(self.RTTVAR, MIN_RTTVAR) and self.n_of_rejected < MAX_REJECTED:
+            self.n_of_rejected += 1
+            self.n_of_outliers += 1
+            return False
+        else:
+            self.RTTVAR = (1 - BETA) * self.RTTVAR + BETA * abs(self.SRTT - RTT)
+            self.SRTT = (1 - ALPHA) * self.SRTT + ALPHA * RTT
+        self.n_of_rejected = 0
+        self.n_of_samples += 1
+        return True
+
+    def seed(self, samples):
+        """
+        Starting the estimate over from the probing samples(ms): SRTT is their median, RTTVAR their median deviation.
+        """
+        self.SRTT = median(samples)
+        self.RTTVAR = RTTVAR_PER_MAD * median(abs(sample - self.SRTT) for sample in samples)
+        self.n_of_rejected = 0
+        return
+
+    def estimate(self):
+        """
+        The RTT(ms) on the configured quantile, 0 before the first sample.
+        """
+        if self.SRTT is None:
+            return 0
+        return max(self.SRTT + self.z * SIGMA_PER_RTTVAR * self.RTTVAR, 0)
@@ -0,0 +1,54 @@
+import heapq
+import itertools
+import time
+
+
+class DeliveryScheduler():
+    """
+    Timer heap for delayed sends. Instead of sleeping until a message may leave, the message is queued together with
+    its due time, and the event loop fires it once this time has passed. In this way, delaying the message of one
+    client never blocks the handling of the input of any other client.
+    """
+    def __init__(self):
+        self.queue = []  # Heap of (due_time, sequence number, target, payload)
+        self.counter = itertools.count()  # Sequence number keeps messages with the same due time in FIFO order
+
+    def schedule(self, target, payload, delay):
+        """
+        Queuing payload for target, to be sent after delay(in ms). Returns the due time(monotonic clock, in seconds).
+        """
+        due_time = time.monotonic() + delay / 1000
+        heapq.heappush(self.queue, (due_time, next(self.counter), target, payload))
+        return due_time
+
+    def scheduleAt(self, target, payload, due_time):
+        """
+        Same as schedule, but with an absolute due time(monotonic clock, in seconds).
+        """
+        heapq.heappush(self.queue, (due_time, next(self.counter), target, payload))
+        return due_time
+
+    def timeUntilNext(self, default):
+        """
+        Seconds until the first queued message is due(0 if it is already due). If nothing is queued, default is
+        returned. The event loop uses this as its select timeout.
+        """
+        if not self.queue:
+            return default
+        return min(max(self.queue[0][0] - time.monotonic(), 0), default)
+
+    def fireDue(self, send):
+        """
+        Sending every message of which the due time has passed, with send(target, payload). Returns the number of
+        messages sent.
+        """
+        now = time.monotonic()
+        n_of_fired = 0
+        while self.queue and self.queue[0][0] <= now:
+            _, _, target, payload = heapq.heappop(self.queue)
+            send(target, payload)
+            n_of_fired += 1
+        return n_of_fired
+
+    def __len__(self):
+        return len(self.queue)
@@ -1,202 +1,206 @@
+import os
 import random
 import time
 import sys
 import socket
-import threading
-from HelperFunctions import HistogramBitSend, PlotCombined
+import selectors
+import multiprocessing
+import traceback
+import subprocess
+from Scheduler import DeliveryScheduler
+from Protocol import HEADER, HEADER_BYTES, HEADER_DECODE, CLIENT_FRAME_LENGTH, PING, PING_REPLY, START, COORDINATES, \
+    SESSION, FrameBuffer, encodeBatches, timestamp
+from Transport import DatagramChannel, UDP_MESSAGE_IDS, MAX_DATAGRAM, RESEND_INTERVAL, newSession, sessionOf, \
+    hasMessages
+from Fairness import FairnessLog, DEADLINE_COLUMNS
+from Statistics import ClientStatistics, saveStatistics
+from MetricsLog import MetricsWriter, RECEIVED, SENT
+from Monitor import Counters, MetricsEndpoint
+from RTTEstimator import RTTEstimator, hasConverged
+from ClockSync import ClockEstimator
 
 total_game_time = 40_000
 FRAMES_S = 30
-TIME_FRAME_MODULO = 65536  # Because we know that our game is 40 seconds long, we can work modulo 2^{16}. The more precision
-# is not needed. If we get a negative remainder in Modulo 2^{16}, then we simply add this number to get a pos remainder.
+PROBE_WINDOW = 4  # Number of probing pings a client can have on its way at once, the sequence number being 2 bits
+PROBE_SPACING = 0.005  # Seconds between two probing pings to the same client, so that they do not queue behind each other
+
+
+def printUsage():
+    print("Usage: python", sys.argv[0], "<port>", "<host>", "<[OPTIONAL]n_of_player>(default 2) <[OPTIONAL]plot? (y/n)>(default: 'n')",
+          "<[OPTIONAL]--workers=<n_of_worker_processes>(default 1)> <[OPTIONAL]--tick(batch inputs per tick)>",
+          "<[OPTIONAL]--udp(moves over UDP, only with 1 worker)>",
+          "<[OPTIONAL]--fairness=<file>(log the intended deadline of every relayed move, see Fairness.py)>",
+          "<[OPTIONAL]--metrics=<file>(append a binary record of every message, see MetricsLog.py)>",
+          "<[OPTIONAL]--monitor=<port>(live metrics over HTTP on 127.0.0.1, worker i on port + i, see Monitor.py)>",
+          "<[OPTIONAL]--ping-interval=<ms>(time between the pings during the game, default 1000)>",
+          "<[OPTIONAL]--rtt-quantile=<0..1>(quantile of the RTT the moves are synchronized on, default 0.5)>",
+          "<[OPTIONAL]--shared-clock(the clients run on this host: measure the one way delays, see ClockSync.py)>")
+    return
+
+
+def splitArguments(argv):
+    """
+    Optional settings are given as --name=value, anywhere after the script name. These are split from the positional
+    arguments, so that the positional usage stays as it was.
+    """
+    arguments = []
+    options = {}
+    for argument in argv:
+        if argument.startswith('--'):
+            name, _, value = argument[2:].partition('=')
+            options[name] = value
+        else:
+            arguments.append(argument)
+    return arguments, options
 
 
-class Server():
-    def __init__(self):
-        self.running = True # Server is running
-        self.server_socket = None  # Socket of server
+def bindListeningSocket(host, port):
+    server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server_socket.bind((host, port))
+    server_socket.listen()
+    return server_socket
+
+
+class Room():
+    """
+    A room holds exactly one match: its own ID pool, RTT table, fruit state and start/end lifecycle. The server hosts
+    as many rooms as there are matches, every room being independent of the others.
+    """
+    def __init__(self, server, room_id, n_of_players):
+        self.server = server  # The server owns the sockets, the selector and the delivery scheduler
+        self.room_id = room_id  # Only used to identify the room in the logs of the server
         self.connected_sockets = []  # List of connected sockets
-        self.N_OF_PLAYERS = 2
+        self.N_OF_PLAYERS = n_of_players
         self.assignable_ids = list(range(0, self.N_OF_PLAYERS))  # Each player gets an ID assigned by the server
         self.assigned_id = {}  # The server also keeps track of the id that is assigned to each client(socket)
         self.assigned_id_history = {}  # To make the plot of the RTT etc. we need to identify each player by his id
         self.all_players_active = False  # True: if all players' clock, assigned id etc., False if not.
-        self.messages = {}  # To avoid that messages are getting 'mixed' from other clients, each client socket has
-        # his 'mailbox'
-        self.RTT_clients = {}  # The RTT(ping time) of each client is saved by the server.
+        self.RTT_clients = {}  # The RTT(ping time) of each client is saved by the server, on the configured quantile
+        self.RTT_estimators = {}  # The RTTEstimator(RTTEstimator.py) of each client, of which RTT_clients is the estimate
         self.n_of_RTT_clients = {}  # The number of client is too saved.
-        self.alpha = 0.125  # Updating rate of the RTT by the new RTT value
+        self.clocks = {}  # The ClockEstimator(ClockSync.py) of each client, from the time stamps of its pings
+        self.down_clients = {}  # The estimated delay(ms) from the server to each client, RTT/2 on a symmetric link
+        self.up_clients = {}  # The estimated delay(ms) from each client to the server, RTT minus the delay down
         self.game_started = False  # If every client has gotten the 'start shot', the server enters another 'phase'
-        self.waiting_ping = {}  # For each client, it is saved if there are waiting for a ping or not. If waiting,
-        # they don't send a new ping.
-        self.n_of_message = {}  # The number of message is needed for updating the ping.
+        self.waiting_ping = {}  # For each client, the sequence numbers of the pings it did not answer yet. During the
+        # game, a client that did not answer its last ping does not get a new one.
+        self.next_ping_sequence = {}  # Sequence number(0-3, in the player ID bits) of the next ping of each client
+        self.probe_samples = {}  # The RTT samples of each client that is being probed
+        self.last_probe = {}  # Time(monotonic) of the last probing ping of each client
+        self.probed = set()  # The clients of which the probing has converged
         self.fruit_x = random.randrange(45, 78 * 15)  # Fruit position is given by server to clients.
         self.fruit_y = random.randrange(60, 28 * 15)
-        self.RTT_SAVED_DICT = {}  # To make the plot of the RTTs after the game, these needs to be saved per client.
-        self.N_RTT_SAVED_DICT = {}  # To make the plot of the RTTs after the game, the 'sequence' number of the
-        # RTT is needed per client
-        self.ping_update_rate = {}  # Each client updates his ping according to his rate
-        self.average_bits_send = {} # Keeps track of the LIST of each client, representing the AVERAGE bytes send per message
-        self.n_of_probing_ping = 20  # The number of pings sent before the game starts. This is done to probe the connections
-        self.totalBytesSend = {}  # Keeps track of the number of total bytes per client.
-        self.ByteSend = {}  # Keeps track of the LIST of each client, representing the bytes send per message
-        self.plot = False  # True if server will give plot of the average bytes send, the RTT values, and a message-bit distribution
-                            # False if server won't give any plot
-
+        self.statistics = {}  # To make the plots after the game, the RTTs and the bytes send/received are saved per
+        # player id, in a ClientStatistics(Statistics.py) of which the memory does not grow with the number of messages
+        self.pinged_sockets = set()  # The clients of which the next ping during the game is scheduled
+        self.n_of_probing_ping = 20  # The maximum number of pings sent before the game starts, to probe the connections.
+        # The probing of a client stops earlier once its RTT has converged.
+        self.last_due_time = {}  # Due time of the last queued response per (sending socket, receiving socket)
+        self.tick_inputs = []  # In tick mode: (release time, sending socket, response, (sender id, move number)) of the
+        # inputs not yet broadcast
+        self.n_of_relayed = {}  # Number of moves relayed per sending socket, the number of the next move(Fairness.py)
+
+    def isOpen(self):
+        """
+        New players can only join a room of which the match did not start yet, and that still has an id to assign.
+        """
+        return not self.game_started and len(self.assignable_ids) > 0
 
     def CreateResponse(self, msg_id, connection_socket, client_msg=bytes(), total_game_time=40000,
-                       leaving_id=0):
-        leading_zeros_2_bit = {1: '0', 2: ''} # Leading zeros fall of if number is too small, but assigned id, and msg_id
-        leading_zeros_3_bit = {1: '00', 2: '0', 3: ''} # Leading zeros fall of if number is too small, but assigned id, and msg_id
-        # both have a fixed bit length.
-        response = ''
+                       leaving_id=0, ping_sequence=0):
+        """
+        Building the message with the given msg_id for connection_socket. The headers and the layouts of the data are
+        precomputed in Protocol.py.
+        """
+        response = b''
         if msg_id == 1:
-            assigned_id = self.assigned_id[connection_socket]
-            assigned_id = leading_zeros_2_bit[len(bin(assigned_id)[2:])] + bin(assigned_id)[2:]
-            msg_id = leading_zeros_3_bit[len(bin(msg_id)[2:])] + bin(msg_id)[2:]
-
-            header = str(msg_id + assigned_id + '000')
-            response = int(header, 2).to_bytes(1, byteorder='big')  # There is no data send, thus only the header is needed in this case.
-
+            if connection_socket in self.server.udp_channels:
+                # With --udp, direction 1 tells the client that its UDP session follows.
+                response = SESSION.pack(HEADER[1][self.assigned_id[connection_socket]][1],
+                                        self.server.udp_channels[connection_socket].session)
+            else:
+                # There is no data send, thus only the header is needed in this case.
+                response = HEADER_BYTES[HEADER[1][self.assigned_id[connection_socket]][0]]
 
         elif msg_id == 2:
-
-            assigned_id = {2: '01', 3: '10', 4: '11'}[self.N_OF_PLAYERS]  # To start game, the assigned ID will be used to notify the clients how many OPPONENTS there
-            # will be active.
-            msg_id = leading_zeros_3_bit[len(bin(msg_id)[2:])] + bin(msg_id)[2:]
+            # To start game, the player ID field will be used to notify the clients how many OPPONENTS there will be
+            # active.
+            n_of_opponents = self.N_OF_PLAYERS - 1
 
             # Making game faster in case of high RTT values
             if max(self.RTT_clients.values()) < 40:
-                direction = '000'
+                direction = 0
             elif 40 <= max(self.RTT_clients.values()) < 80:
-                direction = '001'
+                direction = 1
             else:
-                direction = '010'
+                direction = 2
 
-            header = str(msg_id + assigned_id + direction)
-            header = int(header, 2).to_bytes(1, byteorder='big')  # There is no data send, thus only the header is needed in this case.
-
-            total_time = round(total_game_time).to_bytes(2, byteorder='big')
-            fruit_x_pos = round(self.fruit_x).to_bytes(2, byteorder='big')
-            fruit_y_pos = round(self.fruit_y).to_bytes(2, byteorder='big')
-            data = total_time + fruit_x_pos + fruit_y_pos
-            response = header + data
+            response = START.pack(HEADER[2][n_of_opponents][direction], round(total_game_time), round(self.fruit_x),
+                                  round(self.fruit_y))
 
         elif msg_id == 3:
             response = client_msg
 
-
         elif msg_id == 4:
-            msg_id = leading_zeros_3_bit[len(bin(msg_id)[2:])] + bin(msg_id)[2:]
-            leaving_id = leading_zeros_2_bit[len(bin(leaving_id)[2:])] + bin(leaving_id)[2:]
-            header = str(msg_id + leaving_id + '000')
-            response = int(header, 2).to_bytes(1, byteorder='big')  # There is no data send, thus only the header is needed in this case.
-
+            # There is no data send, thus only the header is needed in this case.
+            response = HEADER_BYTES[HEADER[4][leaving_id][0]]
 
         elif msg_id == 5:
-            msg_id = leading_zeros_3_bit[len(bin(msg_id)[2:])] + bin(msg_id)[2:]
-
-            header = str(msg_id + '00' + '000')
-            header = int(header, 2).to_bytes(1, byteorder='big')
-
-            time_stamp = int(time.time()*1000)%TIME_FRAME_MODULO
-            time_stamp = round(time_stamp).to_bytes(2, byteorder='big')
-
-            data = time_stamp
-
-            response = header + data
-
+            # The player ID field holds the sequence number of the ping, the client echoes it back unchanged.
+            response = PING.pack(HEADER[5][ping_sequence][0], timestamp())
 
         elif msg_id == 6:
-            header_plus_data = client_msg
-            fruit_x_pos = round(self.fruit_x).to_bytes(2, byteorder='big')
-            fruit_y_pos = round(self.fruit_y).to_bytes(2, byteorder='big')
-            extra_data = fruit_x_pos + fruit_y_pos
-            response = header_plus_data + extra_data
+            response = client_msg + COORDINATES.pack(round(self.fruit_x), round(self.fruit_y))
 
-        self.totalBytesSend[self.assigned_id[connection_socket]] += len(response)
-        self.ByteSend[self.assigned_id[connection_socket]].append(len(response))
+        elif msg_id == 7:
+            # The batch of a tick is already packed by encodeBatches(Protocol.py)
+            response = client_msg
 
-        self.average_bits_send[self.assigned_id[connection_socket]].append(round(
-            (self.totalBytesSend[self.assigned_id[connection_socket]]) / (
-                        len(self.average_bits_send[self.assigned_id[connection_socket]]) + 1), 4))
+        self.statistics[self.assigned_id[connection_socket]].recordMessage(len(response))
+        self.server.counters.messages['sent'][msg_id] += 1
+        self.server.counters.bytes['sent'] += len(response)
+        if self.server.metrics_log:
+            self.server.metrics_log.record(self.room_id, self.assigned_id[connection_socket], msg_id, SENT, len(response),
+                                           self.RTT_clients[connection_socket])
 
 
         return response
 
-    def initialize(self):
-        if len(sys.argv) == 4:
-            try:
-                if int(sys.argv[3]) in [2, 3, 4]:
-                    self.N_OF_PLAYERS = int(sys.argv[3])
-                    self.assignable_ids = list(
-                        range(0, self.N_OF_PLAYERS))  # Each player gets an ID assigned by the server
-                else:
-                    print("Max 4 players! Usage: python", sys.argv[0], "<port>", "<host>", "<[OPTIONAL]n_of_player>(default 2) <[OPTIONAL]plot? (y/n)>(default: 'n')")
-                    sys.exit(1)
-            except:
-                print("Usage: python", sys.argv[0], "<port>", "<host>", "<[OPTIONAL]n_of_player>(default 2) <[OPTIONAL]plot? (y/n)>(default: 'n')")
-                sys.exit(1)
-
-        if len(sys.argv) == 5:
-            try:
-                if int(sys.argv[3]) in [2, 3, 4]:
-                    self.N_OF_PLAYERS = int(sys.argv[3])
-                    self.assignable_ids = list(
-                        range(0, self.N_OF_PLAYERS))  # Each player gets an ID assigned by the server
-                else:
-                    print("Max 4 players! Usage: python", sys.argv[0], "<port>", "<host>",
-                          "<[OPTIONAL]n_of_player>(default 2) <[OPTIONAL]plot? (y/n)>(default: 'n')")
-                    sys.exit(1)
-            except:
-                print("Usage: python", sys.argv[0], "<port>", "<host>",
-                      "<[OPTIONAL]n_of_player>(default 2) <[OPTIONAL]plot? (y/n)>(default: 'n')")
-                sys.exit(1)
-
-            if sys.argv[4] == "y":
-                self.plot = True
-            elif sys.argv[4] == "n":
-                self.plot = False
-            else:
-                print("Usage: python", sys.argv[0], "<port>", "<host>", "<[OPTIONAL]n_of_player>(default 2) <[OPTIONAL]plot? (y/n)>(default: 'n')")
-                sys.exit(1)
-
-        elif len(sys.argv) > 5 or len(sys.argv) < 2:
-            print("Usage: python", sys.argv[0], "<port>", "<host>", "<[OPTIONAL]n_of_player>(default 2) <[OPTIONAL]plot? (y/n)>(default: 'n')")
-            sys.exit(1)
-
-        PORT = int(sys.argv[1])
-
-        HOST = str(sys.argv[2])
-        self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.server_socket.bind((HOST, PORT))
-        self.server_socket.settimeout(1)
-        print("[SERVER RUNNING]")
-        return
-
     def initializeClient(self, client_socket):
         """
         Initializing parameters that will be needed for each client.
         """
         self.connected_sockets += [client_socket]
         self.RTT_clients[client_socket] = 0
+        self.RTT_estimators[client_socket] = RTTEstimator(self.server.rtt_quantile)
         self.n_of_RTT_clients[client_socket] = 0
-        self.waiting_ping[client_socket] = False
-        self.n_of_message[client_socket] = 1
-        self.ping_update_rate[client_socket] = self.n_of_probing_ping*2  # the ping update rate is chosen
+        self.clocks[client_socket] = ClockEstimator(self.server.shared_clock)
+        self.down_clients[client_socket] = 0
+        self.up_clients[client_socket] = 0
+        self.waiting_ping[client_socket] = set()
+        self.next_ping_sequence[client_socket] = 0
+        self.probe_samples[client_socket] = []
+        self.last_probe[client_socket] = 0
+        self.n_of_relayed[client_socket] = 0
         assigned_id = self.assignable_ids[0]
         self.assignable_ids.remove(assigned_id)
         self.assigned_id[client_socket] = assigned_id
 
-        self.RTT_SAVED_DICT[self.assigned_id[client_socket]] = []
-        self.N_RTT_SAVED_DICT[self.assigned_id[client_socket]] = []
-        self.totalBytesSend[self.assigned_id[client_socket]] = 0
-        self.ByteSend[self.assigned_id[client_socket]] = []
-        self.average_bits_send[self.assigned_id[client_socket]] = []
+        self.statistics[self.assigned_id[client_socket]] = ClientStatistics()
+
+        self.server.registerClient(client_socket, self)
 
         response = self.CreateResponse(1, connection_socket=client_socket)
         client_socket.sendall(response)  # Sending client his assigned id
-        client_socket.settimeout(0.1)
+        client_socket.settimeout(0.1)  # Only bounds sendall, recv is only called once the selector reports data
+        # The messages are only a few bytes: without TCP_NODELAY, Nagle holds each one back until the previous one is
+        # acknowledged, which the client delays(delayed ACK) until it sends something itself.
+        client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        if len(self.connected_sockets) == self.N_OF_PLAYERS:
+            # All players are active.
+            self.all_players_active = True
+            self.server.probing_rooms.add(self)
         return
 
 
@@ -204,92 +208,187 @@ class Server():
         """"
         Handling the disconnect of client
         """
-        assigned_id = self.assigned_id[connection_socket]  # Assigned of leaving player
+        assigned_id = self.assigned_id.pop(connection_socket)  # Assigned of leaving player
         self.assignable_ids.append(assigned_id)
         self.assigned_id_history[connection_socket] = assigned_id  # This needs to be done, to be able to name each player
                                                                     # on the plots that will follow later on.
-        try:
-            self.connected_sockets.remove(connection_socket)
-            connection_socket.close()
-            del self.messages[connection_socket]
-            del self.RTT_clients[connection_socket]
-            del self.n_of_RTT_clients[connection_socket]
-            del self.n_of_message[connection_socket]
-        except:
-            # If socket is closed, then the keys won't match anymore.
-            for con in self.connected_sockets:
-                con.close()
-            self.connected_sockets = {}
-
+        self.connected_sockets.remove(connection_socket)
+        self.server.unregisterClient(connection_socket)
+        del self.RTT_clients[connection_socket]
+        del self.RTT_estimators[connection_socket]
+        del self.n_of_RTT_clients[connection_socket]
+        del self.clocks[connection_socket]
+        del self.down_clients[connection_socket]
+        del self.up_clients[connection_socket]
+        del self.waiting_ping[connection_socket]
+        del self.next_ping_sequence[connection_socket]
+        del self.probe_samples[connection_socket]
+        del self.last_probe[connection_socket]
+        self.probed.discard(connection_socket)
+        self.pinged_sockets.discard(connection_socket)
+        del self.n_of_relayed[connection_socket]
+        for sockets in list(self.last_due_time):
+            if connection_socket in sockets:
+                del self.last_due_time[sockets]
+
+        if not self.connected_sockets:
+            # Last player left, the room is not needed anymore.
+            self.all_players_active = False
+            self.game_started = False
+            self.server.closeRoom(self)
+            return
 
-        for con in self.connected_sockets:
+        failed_sockets = []  # The other clients that can not be notified, these are disconnected as well
+        for con in list(self.connected_sockets):
             # Notifying all other client of disconnect
             response = self.CreateResponse(4, con, leaving_id=assigned_id)
-            con.sendall(response)
-
+            try:
+                con.sendall(response)
+            except OSError:
+                failed_sockets.append(con)
 
         if len(self.connected_sockets) == 1:
             self.all_players_active = False
             self.game_started = False
+            self.server.probing_rooms.discard(self)
             # If there is only one player left, game ends.
-            if self.plot:
-                try:
-                    PlotCombined(self.N_RTT_SAVED_DICT, self.RTT_SAVED_DICT, self.average_bits_send, 10, self.totalBytesSend)
-                    time.sleep(1)
-                    HistogramBitSend(self.ByteSend)
-                except RuntimeError:
-                    print('the plotting did not work')
+            if self.server.plot:
+                self.saveStatistics()
 
             # The already obtained values for the left socket must be reset
             left_socket = self.connected_sockets[0]
-            self.RTT_SAVED_DICT[self.assigned_id[left_socket]] = []
-            self.N_RTT_SAVED_DICT[self.assigned_id[left_socket]] = []
-            self.totalBytesSend[self.assigned_id[left_socket]] = 0
-            self.average_bits_send[self.assigned_id[left_socket]] = []
+            self.statistics[self.assigned_id[left_socket]] = ClientStatistics()
+
+        self.disconnectFailed(failed_sockets)
+        return
+
+    def disconnectFailed(self, failed_sockets):
+        """
+        Disconnecting the clients a message could not be sent to, once the loop over connected_sockets is done.
+        """
+        for con in failed_sockets:
+            if con in self.connected_sockets:
+                self.disconnectClient(con)
         return
 
 
+    def saveStatistics(self):
+        """
+        Saving the statistics of the match to a file, and plotting them in another process(HelperFunctions.py): the
+        plots block until they are closed, which would stall the event loop, and thereby every other room.
+        """
+        try:
+            path = saveStatistics(self.statistics, f"room{self.room_id}_{time.strftime('%Y%m%d_%H%M%S')}_{os.getpid()}")
+        except OSError as error:
+            print("[STATISTICS NOT SAVED]", error)
+            return
+        print("[STATISTICS SAVED]", path)
+        try:
+            subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                           'HelperFunctions.py'), path])
+        except OSError:
+            print('the plotting did not work, plot later with: python HelperFunctions.py', path)
+        return
+
     def sendingPing(self, connection_socket):
         """"
         Ping is sent:
         -before the game start
-        -during the game, after every 20 messages
+        -during the game, every ping interval(see pingDue)
         """
-        self.waiting_ping[connection_socket] = True
-        response = self.CreateResponse(5, connection_socket)
+        sequence = self.next_ping_sequence[connection_socket]
+        self.next_ping_sequence[connection_socket] = (sequence + 1) % PROBE_WINDOW
+        self.waiting_ping[connection_socket].add(sequence)
+        response = self.CreateResponse(5, connection_socket, ping_sequence=sequence)
         connection_socket.sendall(response)
-        self.n_of_message[connection_socket] = 1  # Resetting number of messages till next ping.
+        return
+
+    def probe(self, now):
+        """
+        Before the game: the clients are probed all at once, each with up to PROBE_WINDOW pings on their way, at least
+        PROBE_SPACING apart. The probing of a client stops once its RTT has converged, or it got n_of_probing_ping pings.
+        """
+        for con in list(self.connected_sockets):
+            if con in self.probed or len(self.waiting_ping[con]) >= PROBE_WINDOW or \
+                    now - self.last_probe[con] < PROBE_SPACING or \
+                    len(self.probe_samples[con]) + len(self.waiting_ping[con]) >= self.n_of_probing_ping:
+                continue
+            try:
+                self.sendingPing(con)
+            except OSError:
+                self.disconnectClient(con)
+                continue
+            self.last_probe[con] = now
+        return
+
+    def isProbed(self):
+        """
+        True if the probing of every client of the full room has converged, so the game can start.
+        """
+        return self.all_players_active and len(self.probed) == len(self.connected_sockets)
+
+    def schedulePing(self, connection_socket):
+        """
+        Scheduling the next ping of connection_socket during the game. The pings go by the clock, not by the number of
+        messages: an idle client is measured as often as a busy one. The interval is at least 2 RTTs, so that a client
+        with a slow connection is not flooded with pings.
+        """
+        interval = max(self.server.ping_interval, 2 * self.RTT_clients[connection_socket])
+        self.server.ping_scheduler.schedule(connection_socket, self, interval)
+        self.pinged_sockets.add(connection_socket)
+        return
+
+    def pingDue(self, connection_socket):
+        """
+        Called by the ping scheduler of the server once the next ping of connection_socket is due. The pings stop once
+        the client has left, or the game has ended.
+        """
+        if connection_socket not in self.connected_sockets or not self.game_started:
+            self.pinged_sockets.discard(connection_socket)
+            return
+        if not self.waiting_ping[connection_socket]:
+            try:
+                self.sendingPing(connection_socket)
+            except OSError:
+                self.pinged_sockets.discard(connection_socket)
+                self.disconnectClient(connection_socket)
+                return
+        self.schedulePing(connection_socket)
         return
 
 
     def receivingPing(self, connection_socket, msg, time_received):
         """"
-        Handling ping. The RTT is handled in two different manners:
-            1. Before the game starts: the average of RTT is taken
-            2. Once the game starts, we follow a similar trend as done in the congestion control, where the RTT
-                estimated is done by considering estimatedRTT + alpha*estimatedRTT. Here alpha is too chosen to be
-                0.125
-        """
-
-        time_stamp = int.from_bytes(msg[1:3], byteorder='big', signed=False)
-        self.waiting_ping[connection_socket] = False  # This connection socket could handle a new ping message.
-        RTT = (time_received - time_stamp)
-        if RTT < 0:
-            # If remainder is negative(remember we work in module 655356!)
-            RTT += TIME_FRAME_MODULO
-        if not self.game_started:
+        Handling ping. Before and during the game, the RTT is estimated in the same way as done in the congestion
+        control of TCP(Jacobson/Karels): a smoothed RTT, and its smoothed deviation, leaving out the outliers(see
+        RTTEstimator.py). The RTT the moves are synchronized on is the configured quantile of this estimate.
+        The answer also holds the time stamps of the client, from which the RTT is split into the delay down(server to
+        client) and up(client to server), in the way of NTP(see ClockSync.py).
+        """
 
-            total_RTT = (self.RTT_clients[connection_socket] * self.n_of_RTT_clients[connection_socket] + RTT)
-            n_of_total_RTT = self.n_of_RTT_clients[connection_socket] + 1
-            self.RTT_clients[connection_socket] = total_RTT / n_of_total_RTT
-        else:
-            self.RTT_clients[connection_socket] = (1 - self.alpha) * self.RTT_clients[
-                connection_socket] + self.alpha * RTT
+        header, server_time, client_received, client_sent = PING_REPLY.unpack_from(msg)
+        sequence = HEADER_DECODE[header][1]
+        if sequence not in self.waiting_ping[connection_socket]:
+            # Not a ping of this room(e.g. sent before the client was moved), or answered twice.
+            return
+        self.waiting_ping[connection_socket].discard(sequence)
+        RTT = self.clocks[connection_socket].addExchange(server_time, client_received, client_sent, time_received)
+        self.RTT_estimators[connection_socket].addSample(RTT)
+        if connection_socket not in self.probed:
+            samples = self.probe_samples[connection_socket]
+            samples.append(RTT)
+            if hasConverged(samples) or len(samples) >= self.n_of_probing_ping:
+                self.RTT_estimators[connection_socket].seed(samples)
+                self.probed.add(connection_socket)
+        self.RTT_clients[connection_socket] = self.RTT_estimators[connection_socket].estimate()
+        self.down_clients[connection_socket] = \
+            self.clocks[connection_socket].downDelay(self.RTT_clients[connection_socket])
+        self.up_clients[connection_socket] = self.RTT_clients[connection_socket] - self.down_clients[connection_socket]
         self.n_of_RTT_clients[connection_socket] += 1
 
         # Saving number of RTT, together with RTT for later plotting:
-        self.N_RTT_SAVED_DICT[self.assigned_id[connection_socket]].append(self.n_of_RTT_clients[connection_socket])
-        self.RTT_SAVED_DICT[self.assigned_id[connection_socket]].append(self.RTT_clients[connection_socket])
+        self.statistics[self.assigned_id[connection_socket]].recordRTT(self.n_of_RTT_clients[connection_socket],
+                                                                       self.RTT_clients[connection_socket])
         return
 
     def startGame(self):
@@ -297,14 +396,24 @@ class Server():
         Game is started. The already calculated ping is incorporated so that the clients start with the same amount of
         time.
         """
+        failed_sockets = []
         for con in self.connected_sockets:
-            self.ping_update_rate[con] = max(100//self.RTT_clients[con], 70)  # We would like to update the ping every 200 ms
-
-            time_delay = self.RTT_clients[con]/2  # Estimated time it takes the message from server, to reach client.
+            time_delay = self.down_clients[con]  # Estimated time it takes the message from server, to reach client.
             response = self.CreateResponse(2, con, total_game_time=round(total_game_time - time_delay))
-            con.sendall(response)
-            self.game_started = True
-            print("[GAME STARTS]")
+            try:
+                con.sendall(response)
+            except OSError:
+                failed_sockets.append(con)
+        self.game_started = True
+        self.server.probing_rooms.discard(self)
+        self.disconnectFailed(failed_sockets)
+        if not self.game_started:
+            # Only one player is left.
+            return
+        for con in self.connected_sockets:
+            if con not in self.pinged_sockets:
+                self.schedulePing(con)
+        print("[GAME STARTS]", "room", self.room_id)
         return
 
     def MovementAndFruitUpdate(self, msg, connection_socket, msg_id):
@@ -339,177 +448,862 @@ class Server():
 
         NOTE: in the 2-player case, there time_delay = time_wait always, but this gets more interesting in the n-player
         implementation. For which this protocol is designed.
+
+        The waiting is not done by sleeping, but by queuing each message in the delivery scheduler with its due time:
+        time_delay plus the sum of the time_waits of the clients before it. The event loop fires the message once it is
+        due, so handling the input of other clients(or the next input of the same client) is never blocked. Messages
+        from one client to another are never reordered, even if their RTT estimates changed in between.
+
+        The halves of the RTTs above are the one way delays of a symmetric link. The server estimates the delay down
+        (server to client) and up(client to server) of each client from the time stamps of the pings(ClockSync.py), and
+        uses those instead: the clients are sorted on their delay down, the echo delay is (max up - up of the sender),
+        and the wait of a client is (down of the previous client - down of the client). On a symmetric link, this is the
+        same as above.
+
+        With --fairness, the intended deadline of every copy(due time + delay down of the recipient) is logged, so that
+        it can be compared with the time the clients really got it(see Fairness.py).
         """
-        sorted_clients_on_RTT = sorted(self.RTT_clients, key=self.RTT_clients.get, reverse=True)
-        client_with_highest_RTT = sorted_clients_on_RTT[0]
-        max_RTT = max(self.RTT_clients.values())  # Taking out the highest RTT out of the list.
+        msg = bytes(msg)  # The message is kept in the scheduler, thus it can not stay a view on the mailbox
+        if self.server.tick_broadcast:
+            self.queueTickInput(msg, connection_socket, msg_id)
+            return
+        sorted_clients_on_delay = sorted(self.down_clients, key=self.down_clients.get, reverse=True)
+        client_with_highest_delay = sorted_clients_on_delay[0]
+        max_up = max(self.up_clients.values())  # Taking out the highest delay up out of the list.
 
         if msg_id == 6:
             self.fruit_x = random.randrange(45, 78 * 15)
             self.fruit_y = random.randrange(60, 28 * 15)
 
         # Delay, to ensure that each client has the same 'echo' position update.
-        time_delay = (max_RTT - self.RTT_clients[connection_socket]) / 2
-        time.sleep(time_delay / 1000)
-
-        previous_connection = client_with_highest_RTT
-        for con in sorted_clients_on_RTT:
-            time_wait = (self.RTT_clients[previous_connection] - self.RTT_clients[con])/2
-            time.sleep(time_wait / 1000)
+        time_delay = max_up - self.up_clients[connection_socket]
+        sender_id = self.assigned_id[connection_socket]
+        move_number = self.n_of_relayed[connection_socket]
+        self.n_of_relayed[connection_socket] += 1
+        fairness_log = self.server.fairness_log
+
+        previous_connection = client_with_highest_delay
+        for con in sorted_clients_on_delay:
+            time_wait = self.down_clients[previous_connection] - self.down_clients[con]
+            time_delay += time_wait
             response = self.CreateResponse(msg_id, con, client_msg=msg)
-            con.sendall(response)
+            due_time = time.monotonic() + time_delay / 1000
+            # Keeping the order of the messages of connection_socket on con.
+            due_time = max(due_time, self.last_due_time.get((connection_socket, con), 0))
+            self.last_due_time[(connection_socket, con)] = due_time
+            self.server.scheduler.scheduleAt(con, response, due_time)
+            if fairness_log:
+                fairness_log.record(self.room_id, sender_id, move_number, self.assigned_id[con],
+                                    due_time + self.down_clients[con] / 1000)
             previous_connection = con
         return
 
-    def identifyTypeOfMessage(self, msg):
-        """
-        Because TCP is stream-oriented, and we work with bytes, there is no 'endpoint' indication. This can only be done
-        with looking at the msg_id in the header, look up how long the message would be with this msg_id, and cut it off
-        the message coming in. If the message is missing a part, we return False so that the server can continue to take
-        the next part. If there is no missing part, then we return the extracted message.
-
-        Server only gets three type of messages from the client:
-            -message with ID equal to 3: this is position change. In this id, there are two variants:
-                1. The absolute position. This one contains the header, AND the x and y position, which are 4 bytes.
-                2. The relative position difference(direction). This one has only the header, no data
-            -message with ID equal to 6. This message is apart from the message ID, identical to the ID 3. The only
-            difference is that his id notifies the server that a fruit was taken.
-            -message ID equal to 5: this is the ping message. This contains the header(1 byte), and the timestamp.
-            This timestamp is 16-bit, thus 2 byte long.
-            -message ID 4; the client leaves the game. This has only the header(1 byte)
-
-        :return:
-        1.The length of the message, in bytes
-        2.The message ID
-        """
-        header_string = ''
-        header = msg[0]
-        for bit in range(7, -1, -1):
-            header_string += str((header & (1 << bit)) >> bit)
-        msg_id = int(header_string[0:3], 2)
-        direction = int(header_string[5:8], 2)
-
-        if msg_id == 3 or msg_id == 6:
-            if direction == 0:
-                # If direction is 0, thus absolute pos is sent, then the msg is 1(header) + 4(data) = 5 bytes long
-                if len(msg) < 5:
-                    # In case data has come partially in
-                    return -1, -1
-                return 5, msg_id
+    def queueTickInput(self, msg, connection_socket, msg_id):
+        """
+        Tick mode: instead of relaying each input on its own, all inputs are gathered, and every tick(1/FRAMES_S s) each
+        client gets one batch(msg ID 7) with all inputs of that tick.
+        The same synchronization algorithm is kept. An input is 'released' after the same delay as the echo delay
+        (time_delay) in MovementAndFruitUpdate, at which moment it would have been sent to the client with the highest
+        RTT. It is put in the batch of the first tick after its release. This batch is sent first to the client with the
+        highest delay down, and to each other client after (max down - down of the client), so that all clients still
+        get the batch at the same time. An input is thus delayed by at most one tick more than without tick mode.
+        """
+        if msg_id == 6:
+            self.fruit_x = random.randrange(45, 78 * 15)
+            self.fruit_y = random.randrange(60, 28 * 15)
+            response = msg + COORDINATES.pack(round(self.fruit_x), round(self.fruit_y))
+        else:
+            response = msg
+
+        max_up = max(self.up_clients.values())
+        release_time = time.monotonic() + (max_up - self.up_clients[connection_socket]) / 1000
+        # Keeping the order of the inputs of connection_socket, even if its RTT estimate changed in between.
+        release_time = max(release_time, self.last_due_time.get((connection_socket, connection_socket), 0))
+        self.last_due_time[(connection_socket, connection_socket)] = release_time
+        move = (self.assigned_id[connection_socket], self.n_of_relayed[connection_socket])
+        self.n_of_relayed[connection_socket] += 1
+        self.tick_inputs.append((release_time, connection_socket, response, move))
+        self.server.ticking_rooms.add(self)
+        return
+
+    def broadcastTick(self, tick_time):
+        """
+        Sending the batch with all inputs released before tick_time(see queueTickInput) to every client.
+        """
+        released = [tick_input for tick_input in self.tick_inputs if tick_input[0] <= tick_time]
+        if not released:
+            return
+        self.tick_inputs = [tick_input for tick_input in self.tick_inputs if tick_input[0] > tick_time]
+        if not self.tick_inputs:
+            self.server.ticking_rooms.discard(self)
+
+        released.sort(key=lambda tick_input: tick_input[0])  # Stable sort, so the order of each client is kept
+        batches = encodeBatches([response for _, _, response, _ in released])
+
+        max_down = max(self.down_clients.values())
+        for con in self.connected_sockets:
+            due_time = tick_time + (max_down - self.down_clients[con]) / 1000
+            for batch in batches:
+                self.server.scheduler.scheduleAt(con, self.CreateResponse(7, con, client_msg=batch), due_time)
+            if self.server.fairness_log:
+                for _, _, _, (sender_id, move_number) in released:
+                    self.server.fairness_log.record(self.room_id, sender_id, move_number, self.assigned_id[con],
+                                                    due_time + self.down_clients[con] / 1000)
+        return
+
+
+class Server():
+    """
+    The server owns the listening socket, the event loop(selector) and the delivery scheduler, and distributes the
+    connecting clients over the rooms. Each room hosts one match.
+    """
+    def __init__(self):
+        self.running = True # Server is running
+        self.server_socket = None  # Socket of server
+        self.selector = selectors.DefaultSelector()  # One event loop multiplexes the listening socket and all clients
+        self.N_OF_PLAYERS = 2  # Number of players in each room
+        self.rooms = []  # All rooms that have at least one connected client
+        self.next_room_id = 0  # Each room gets a new id, for the logs
+        self.room_of = {}  # The room each client(socket) plays in
+        self.probing_rooms = set()  # Rooms of which all players are active, but the game did not start yet
+        self.tick_broadcast = False  # True: inputs are broadcast in one batch per tick(1/FRAMES_S s) per client
+        self.ticking_rooms = set()  # In tick mode, the rooms that have inputs that are not broadcast yet
+        self.next_tick = time.monotonic()  # In tick mode, the time(monotonic) of the next tick
+        self.messages = {}  # To avoid that messages are getting 'mixed' from other clients, each client socket has
+        # his 'mailbox'(FrameBuffer)
+        self.scheduler = DeliveryScheduler()  # Queued responses of which the RTT-equalization delay did not pass yet
+        self.plot = False  # True if server will give plot of the average bytes send, the RTT values, and a message-bit distribution
+                            # False if server won't give any plot
+        self.n_of_workers = 1  # In supervisor mode(more than 1 worker), the rooms are spread over worker processes
+        self.channel = None  # In worker mode, the socket to the supervisor via which new clients are handed over
+        self.n_of_received = 0  # Number of messages received since the last load report to the supervisor
+        self.last_load_report = 0  # Time(monotonic) of the last load report to the supervisor
+        self.udp = False  # True: the moves go over UDP(Transport.py), the other messages stay on TCP
+        self.udp_socket = None  # With --udp, the socket on the same port as the listening socket
+        self.udp_sessions = {}  # The client socket of each session(the random number in the header of a datagram)
+        self.udp_channels = {}  # The DatagramChannel of each client socket
+        self.udp_address = {}  # The UDP address of each client socket, known once it sent a valid datagram
+        self.fairness_path = None  # With --fairness, the file to which the intended deadlines are logged
+        self.fairness_log = None  # FairnessLog(Fairness.py) of the intended deadlines, None if not logged
+        self.metrics_path = None  # With --metrics, the file to which a record of every message is appended
+        self.metrics_log = None  # MetricsWriter(MetricsLog.py), None if the messages are not logged
+        self.counters = Counters()  # Hot path counters(Monitor.py), always kept, only exposed with --monitor
+        self.monitor_port = None  # With --monitor, the port of the metrics endpoint(of the first worker)
+        self.monitor = None  # MetricsEndpoint(Monitor.py), None if there is no metrics endpoint
+        self.ping_scheduler = DeliveryScheduler()  # The next ping(room) of each playing client, by due time
+        self.ping_interval = 1000  # Time(ms) between the pings of a client during the game
+        self.rtt_quantile = 0.5  # The quantile of the RTT of each client the moves are synchronized on
+        self.shared_clock = False  # True: the clients have the clock of the server(same host), see ClockSync.py
+
+    def initialize(self):
+        """
+        Reading the settings given via the terminal. If there is only one worker, the listening socket is bound right
+        away, in supervisor mode the supervisor binds it.
+        """
+        arguments, options = splitArguments(sys.argv)
+        if len(arguments) == 4:
+            try:
+                if int(arguments[3]) in [2, 3, 4]:
+                    self.N_OF_PLAYERS = int(arguments[3])
+                else:
+                    print("Max 4 players!", end=" ")
+                    printUsage()
+                    sys.exit(1)
+            except:
+                printUsage()
+                sys.exit(1)
+
+        if len(arguments) == 5:
+            try:
+                if int(arguments[3]) in [2, 3, 4]:
+                    self.N_OF_PLAYERS = int(arguments[3])
+                else:
+                    print("Max 4 players!", end=" ")
+                    printUsage()
+                    sys.exit(1)
+            except:
+                printUsage()
+                sys.exit(1)
+
+            if arguments[4] == "y":
+                self.plot = True
+            elif arguments[4] == "n":
+                self.plot = False
             else:
-                # there is only a message sent, thus the header only.
-                return 1, msg_id
-        elif msg_id == 5:
-            # Ping only has the header, and time stamp(data), which in total has 3 bytes.
-            if len(msg) < 3:
-                # in case the data has come partially
-                return -1, -1
-            return 3, msg_id
-        elif msg_id == 4:
-            # If client is leaving game, then only the header is sent
-            return 1, msg_id
-def main():
-    server = Server()
-    server.initialize()
+                printUsage()
+                sys.exit(1)
+
+        elif len(arguments) > 5 or len(arguments) < 2:
+            printUsage()
+            sys.exit(1)
 
-    while server.running:
         try:
-            try:
-                server.server_socket.listen()
-                if len(server.assignable_ids) == 0:
-                    # If all ids are already distributed(meaning max players achieved) then newly coming in sockets
-                    # will need to wait.
-                    continue
+            self.n_of_workers = int(options.get('workers', 1))
+            if self.n_of_workers < 1:
+                raise ValueError
+        except ValueError:
+            printUsage()
+            sys.exit(1)
+        self.tick_broadcast = 'tick' in options
+        self.udp = 'udp' in options
+        self.shared_clock = 'shared-clock' in options
+        if self.udp and self.n_of_workers > 1:
+            print("--udp is not supported in supervisor mode, the datagrams can not be handed over to the workers.")
+            sys.exit(1)
+
+        self.fairness_path = options.get('fairness') or None
+        self.metrics_path = options.get('metrics') or None
+        if ('fairness' in options and not self.fairness_path) or ('metrics' in options and not self.metrics_path):
+            printUsage()
+            sys.exit(1)
+        try:
+            self.monitor_port = int(options['monitor']) if 'monitor' in options else None
+            self.ping_interval = float(options.get('ping-interval') or self.ping_interval)
+            self.rtt_quantile = float(options.get('rtt-quantile') or self.rtt_quantile)
+            if self.ping_interval <= 0 or not 0 < self.rtt_quantile < 1:
+                raise ValueError
+        except ValueError:
+            printUsage()
+            sys.exit(1)
 
-                connection, addr = server.server_socket.accept()
+        self.PORT = int(arguments[1])
+        self.HOST = str(arguments[2])
+        if self.n_of_workers == 1:
+            if self.fairness_path:
+                self.fairness_log = FairnessLog(self.fairness_path, DEADLINE_COLUMNS)
+            if self.metrics_path:
+                self.metrics_log = MetricsWriter(self.metrics_path)
+            if self.monitor_port:
+                self.monitor = MetricsEndpoint(self, self.monitor_port)
+            self.server_socket = bindListeningSocket(self.HOST, self.PORT)
+            self.server_socket.setblocking(False)
+            self.selector.register(self.server_socket, selectors.EVENT_READ)
+            if self.udp:
+                self.udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                self.udp_socket.bind((self.HOST, self.PORT))
+                self.udp_socket.setblocking(False)
+                self.selector.register(self.udp_socket, selectors.EVENT_READ)
+            print("[SERVER RUNNING]")
+        return
 
-                server.initializeClient(connection)
+    def settings(self):
+        """
+        The settings a worker process needs to serve the same kind of rooms as the supervisor was started with.
+        """
+        return {'N_OF_PLAYERS': self.N_OF_PLAYERS, 'plot': self.plot, 'tick_broadcast': self.tick_broadcast,
+                'fairness_path': self.fairness_path, 'metrics_path': self.metrics_path, 'monitor_port': self.monitor_port,
+                'ping_interval': self.ping_interval, 'rtt_quantile': self.rtt_quantile, 'shared_clock': self.shared_clock}
 
-                if len(server.connected_sockets) == server.N_OF_PLAYERS:
-                    # All players are active.
-                    server.all_players_active = True
-                threading.Thread(target=handleClient, args=(connection, server)).start()
+    def reportLoad(self):
+        """
+        In worker mode, the load of this worker is sent to the supervisor every second as one line of text:
+        "<number of rooms> <number of clients> <number of messages received since last report> <open slots>"
+        where the open slots are the free places in the rooms that did not start yet.
+        """
+        now = time.monotonic()
+        if self.channel is None or now - self.last_load_report < 1:
+            return
+        open_slots = sum(len(room.assignable_ids) for room in self.rooms if room.isOpen())
+        report = f"{len(self.rooms)} {len(self.room_of)} {self.n_of_received} {open_slots}\n"
+        self.channel.sendall(report.encode())
+        self.n_of_received = 0
+        self.last_load_report = now
+        return
 
-            except socket.timeout:
-                continue
-        except Exception as error:
-            server.server_socket.close()
-            break
+    def openRoom(self):
+        """
+        Returning the first room that is still open for new players. If every room is full(or playing), a new room
+        is created.
+        """
+        for room in self.rooms:
+            if room.isOpen():
+                return room
+        room = Room(self, self.next_room_id, self.N_OF_PLAYERS)
+        self.next_room_id += 1
+        self.rooms.append(room)
+        return room
+
+    def closeRoom(self, room):
+        """
+        Removing a room once its last player has left.
+        """
+        if room in self.rooms:
+            self.rooms.remove(room)
+        self.probing_rooms.discard(room)
+        self.ticking_rooms.discard(room)
+        if self.fairness_log:
+            self.fairness_log.flush()  # The deadlines of a match are complete in the file once it is over
+        return
 
-    server.running = False
-    server.server_socket.close()
+    def registerClient(self, client_socket, room):
+        self.room_of[client_socket] = room
+        self.messages[client_socket] = FrameBuffer(CLIENT_FRAME_LENGTH)
+        self.selector.register(client_socket, selectors.EVENT_READ)
+        if self.udp_socket:
+            # The session is handed out to the client in the ID assignment(see CreateResponse).
+            session = newSession(self.udp_sessions)
+            self.udp_sessions[session] = client_socket
+            self.udp_channels[client_socket] = DatagramChannel(CLIENT_FRAME_LENGTH, session)
+        return
 
+    def unregisterClient(self, client_socket):
+        """
+        Forgetting the socket, and closing it.
+        """
+        if client_socket in self.room_of:
+            del self.room_of[client_socket]
+            self.messages.pop(client_socket, None)
+            self.selector.unregister(client_socket)
+        if client_socket in self.udp_channels:
+            del self.udp_sessions[self.udp_channels.pop(client_socket).session]
+            self.udp_address.pop(client_socket, None)
+        client_socket.close()
+        return
 
+    def timeUntilNextEvent(self):
+        """
+        Timeout of the select of the event loop: at most 0.1 s, less if a queued response, a ping or(in tick mode) a tick
+        is due earlier. With --udp, the loop wakes up every RESEND_INTERVAL as long as there are moves that are not acknowledged.
+        """
+        timeout = self.ping_scheduler.timeUntilNext(self.scheduler.timeUntilNext(0.1))
+        if self.probing_rooms:
+            timeout = min(timeout, PROBE_SPACING)
+        if self.ticking_rooms:
+            timeout = min(timeout, max(self.next_tick - time.monotonic(), 0))
+        if any(channel.unacked for channel in self.udp_channels.values()):
+            timeout = min(timeout, RESEND_INTERVAL)
+        return timeout
+
+    def tick(self):
+        """
+        In tick mode, every 1/FRAMES_S s the rooms that got inputs broadcast their batch.
+        """
+        now = time.monotonic()
+        if now < self.next_tick:
+            return
+        start = time.perf_counter()
+        for room in list(self.ticking_rooms):
+            room.broadcastTick(self.next_tick)
+        self.counters.fan_out_seconds += time.perf_counter() - start
+        self.next_tick = max(self.next_tick + 1 / FRAMES_S, now)
+        return
 
+    def deliver(self, connection_socket, response):
+        """
+        Called by the delivery scheduler once a queued response is due. If the client has left in the meantime, the
+        response is dropped. With --udp, the moves go in a datagram, once the UDP address of the client is known.
+        """
+        room = self.room_of.get(connection_socket)
+        if room is None:
+            return
+        try:
+            if connection_socket in self.udp_address and HEADER_DECODE[response[0]][0] in UDP_MESSAGE_IDS:
+                datagram = self.udp_channels[connection_socket].pack(response)
+                self.udp_socket.sendto(datagram, self.udp_address[connection_socket])
+            else:
+                connection_socket.sendall(response)
+        except BlockingIOError:
+            # The datagram is dropped, it is repeated in the next one.
+            pass
+        except OSError:
+            room.disconnectClient(connection_socket)
+        except Exception:
+            logError("delivering to " + describeSocket(connection_socket))
+            dropClient(self, connection_socket)
+        return
 
-def handleClient(connection_socket, server):
-    server.messages[connection_socket] = b''
+    def firePing(self, connection_socket, room):
+        """
+        Called by the ping scheduler once the next ping of connection_socket is due(see Room.pingDue).
+        """
+        try:
+            room.pingDue(connection_socket)
+        except Exception:
+            logError("pinging " + describeSocket(connection_socket))
+            dropClient(self, connection_socket)
+        return
+
+    def resendDatagrams(self):
+        """
+        With --udp, sending the moves that are not acknowledged again(see DatagramChannel.resend in Transport.py).
+        """
+        for connection_socket, address in list(self.udp_address.items()):
+            datagram = self.udp_channels[connection_socket].resend()
+            if datagram:
+                try:
+                    self.udp_socket.sendto(datagram, address)
+                except OSError:
+                    pass
+        return
+
+
+def main():
+    server = Server()
+    server.initialize()
+    if server.n_of_workers > 1:
+        Supervisor(server).run()
+        return
+    serveForever(server)
+
+
+def serveForever(server):
+    """
+    Event-driven server core: one selector multiplexes the listening socket and every client socket, so there is no
+    thread per client and no socket needs to poll with a timeout. If no socket has become readable for 0.1 s, the
+    loop wakes up anyway to continue the probing process. The loop also wakes up as soon as the first queued response
+    of the delivery scheduler, or(in tick mode) the next tick is due.
+    In worker mode, there is no listening socket, but the channel to the supervisor, via which clients are handed over.
+
+    An error while handling one event only drops the client of that event(see dropClient), the loop goes on: all rooms
+    of the process share it, so one client may never stop the matches of the others.
+    """
     while server.running:
         try:
+            events = server.selector.select(timeout=server.timeUntilNextEvent())
+        except Exception:
+            logError("selecting")
+            break
+        for key, _ in events:
             try:
-                msg = connection_socket.recv(1024)
-                if msg:
-                    time_received = (time.time()*1000)%TIME_FRAME_MODULO
-                    server.messages[connection_socket] += msg  # In case message comes in parts(TCP is stream-oriented)
-                    server.n_of_message[connection_socket] += 1
+                handleEvent(server, key)
+            except Exception:
+                logError("handling an event of " + describeSocket(key.fileobj))
+                dropClient(server, key.fileobj)
+        try:
+            server.tick()
+            start = time.perf_counter()
+            server.scheduler.fireDue(server.deliver)
+            server.counters.delivery_seconds += time.perf_counter() - start
+            server.resendDatagrams()
+            server.ping_scheduler.fireDue(server.firePing)
+            probeClients(server)
+            server.reportLoad()
+            if server.monitor:
+                server.monitor.sample()
+        except Exception:
+            logError("running the timers")
 
-                    n_of_bytes, msg_id = server.identifyTypeOfMessage(server.messages[connection_socket])
+    server.running = False
+    server.selector.close()
+    if server.server_socket:
+        server.server_socket.close()
+    if server.udp_socket:
+        server.udp_socket.close()
+    if server.monitor:
+        server.monitor.listening_socket.close()
+    if server.channel:
+        server.channel.close()
+    if server.fairness_log:
+        server.fairness_log.close()
+    if server.metrics_log:
+        server.metrics_log.close()
+
+
+def handleEvent(server, key):
+    """
+    Handling one socket the selector reported as readable.
+    """
+    if key.fileobj is server.server_socket:
+        acceptClient(server)
+    elif key.fileobj is server.channel:
+        receiveClient(server)
+    elif key.fileobj is server.udp_socket:
+        receiveDatagram(server)
+    elif server.monitor and key.data is server.monitor:
+        server.monitor.handle(key.fileobj)
+    else:
+        handleClient(key.fileobj, server)
+    return
+
+
+def logError(context):
+    """
+    Printing an error that was not expected, with its traceback. The server keeps on running.
+    """
+    print("[ERROR]", context)
+    traceback.print_exc()
+    return
+
+
+def describeSocket(connection_socket):
+    try:
+        return str(connection_socket.getpeername())
+    except (OSError, AttributeError):
+        return repr(connection_socket)
+
+
+def dropClient(server, connection_socket):
+    """
+    Disconnecting the client of connection_socket after an unexpected error, if it is a client of this server(and not,
+    e.g., the listening socket).
+    """
+    room = server.room_of.get(connection_socket)
+    if room is None:
+        return
+    try:
+        if connection_socket in room.connected_sockets:
+            room.disconnectClient(connection_socket)
+        else:
+            server.unregisterClient(connection_socket)
+    except Exception:
+        logError("disconnecting " + describeSocket(connection_socket))
+        if connection_socket in server.room_of:
+            server.unregisterClient(connection_socket)
+    return
+
+
+def runWorker(settings, channel):
+    """
+    Entry point of a worker process in supervisor mode. The worker runs the same event loop as a single process
+    server, but gets its clients handed over by the supervisor instead of accepting them itself.
+    """
+    server = Server()
+    for name, value in settings.items():
+        setattr(server, name, value)
+    server.channel = channel
+    server.selector.register(channel, selectors.EVENT_READ)
+    # Each worker numbers its rooms from 0, thus each worker gets its own files.
+    if server.fairness_path:
+        server.fairness_log = FairnessLog(f"{server.fairness_path}.{os.getpid()}", DEADLINE_COLUMNS)
+    if server.metrics_path:
+        server.metrics_log = MetricsWriter(f"{server.metrics_path}.{os.getpid()}")
+    if server.monitor_port:
+        server.monitor = MetricsEndpoint(server, server.monitor_port)
+    try:
+        serveForever(server)
+    except KeyboardInterrupt:
+        pass
+    return
+
+
+class Supervisor():
+    """
+    Supervisor mode: the rooms are sharded over a number of worker processes, so that the server is not limited to one
+    core by the GIL. The supervisor only accepts the connections, and hands each of them over(fd passing) to a worker.
+    All players of one room are handed over to the same worker, thus each worker owns a disjoint set of rooms.
+    Every second, each worker reports its load, which is used to choose the worker for the next room.
+    """
+    def __init__(self, server):
+        self.server = server  # Holds the settings the supervisor was started with
+        self.selector = selectors.DefaultSelector()
+        self.listening_socket = None
+        self.processes = {}  # Worker process per worker id
+        self.channels = {}  # Socket to the worker per worker id
+        self.reports = {}  # Not yet complete report line per worker id
+        self.load = {}  # Last reported (rooms, clients, messages/s, open slots) per worker id
+        self.n_of_pending = {}  # Clients handed over to each worker since its last report
+        self.filling_worker = None  # The worker that gets the players of the room that is being filled
+        self.n_of_handed_over = 0  # The number of clients handed over to filling_worker for this room
+        self.report_interval = 5  # Every report_interval seconds, the load of the workers is printed
+        self.last_print = time.monotonic()
+
+    def startWorker(self, worker_id):
+        supervisor_end, worker_end = socket.socketpair()
+        # Spawned(not forked), so that a worker does not inherit the channels of the other workers, and notices when
+        # the supervisor stops.
+        settings = self.server.settings()
+        if settings['monitor_port']:
+            settings['monitor_port'] += worker_id  # Each worker has its own metrics endpoint
+        process = multiprocessing.get_context('spawn').Process(target=runWorker, args=(settings, worker_end),
+                                                               daemon=True)
+        process.start()
+        worker_end.close()
+        self.processes[worker_id] = process
+        self.channels[worker_id] = supervisor_end
+        self.reports[worker_id] = b''
+        self.load[worker_id] = (0, 0, 0, 0)
+        self.n_of_pending[worker_id] = 0
+        self.selector.register(supervisor_end, selectors.EVENT_READ, data=worker_id)
+        return
 
-                    if n_of_bytes < 0:
-                        # If message is not complete, then we need to look if new has come in.
-                        continue
-                    number_of_bytes = n_of_bytes
-                    server.totalBytesSend[server.assigned_id[connection_socket]] += number_of_bytes
-                    server.ByteSend[server.assigned_id[connection_socket]].append(number_of_bytes)
+    def stopWorker(self, worker_id):
+        channel = self.channels.pop(worker_id)
+        self.selector.unregister(channel)
+        channel.close()
+        del self.processes[worker_id]
+        del self.reports[worker_id]
+        del self.load[worker_id]
+        del self.n_of_pending[worker_id]
+        if self.filling_worker == worker_id:
+            self.filling_worker = None
+        return
 
-                    server.average_bits_send[server.assigned_id[connection_socket]].append(round(server.totalBytesSend[server.assigned_id[connection_socket]]/(len(server.average_bits_send[server.assigned_id[connection_socket]])+1), 4))
+    def run(self):
+        if not hasattr(socket, 'send_fds'):
+            print("Supervisor mode needs fd passing(Unix, Python 3.9+), use --workers=1 instead.")
+            sys.exit(1)
 
-                    msg = server.messages[connection_socket][:n_of_bytes]
-                    server.messages[connection_socket] = server.messages[connection_socket][n_of_bytes:]
-                    if msg_id == 4:  # Closing connection with player
-                        server.disconnectClient(connection_socket)
-                        break
+        # The workers are started before binding, so that they do not inherit the listening socket.
+        for worker_id in range(self.server.n_of_workers):
+            self.startWorker(worker_id)
+        self.listening_socket = bindListeningSocket(self.server.HOST, self.server.PORT)
+        self.listening_socket.setblocking(False)
+        self.selector.register(self.listening_socket, selectors.EVENT_READ, data=None)
+        print("[SERVER RUNNING]", self.server.n_of_workers, "workers")
 
-                    if server.all_players_active:  # Only sending position of Player through if server is initialized.
+        try:
+            while True:
+                for key, _ in self.selector.select(timeout=1):
+                    if key.data is None:
+                        self.handOver()
+                    else:
+                        self.readReport(key.data)
+                self.restartDeadWorkers()
+                self.printLoad()
+        finally:
+            self.listening_socket.close()
+            for process in self.processes.values():
+                process.terminate()
+
+    def chooseWorker(self):
+        """
+        A worker that still has an open room with free places is preferred, otherwise the one with the least clients.
+        The clients handed over since the last report of a worker are counted too, as many clients can connect within
+        one report interval.
+        """
+        return min(self.load, key=lambda worker_id: (self.load[worker_id][3] == 0,
+                                                     self.load[worker_id][1] + self.n_of_pending[worker_id]))
 
-                        if (server.n_of_message[connection_socket]) >= server.ping_update_rate[connection_socket] and not server.waiting_ping[connection_socket]:
-                            server.sendingPing(connection_socket)
-                            continue
+    def handOver(self):
+        try:
+            connection, addr = self.listening_socket.accept()
+        except BlockingIOError:
+            return
+
+        if self.filling_worker is None or self.n_of_handed_over >= self.server.N_OF_PLAYERS:
+            self.filling_worker = self.chooseWorker()
+            self.n_of_handed_over = 0
+        try:
+            socket.send_fds(self.channels[self.filling_worker], [b'c'], [connection.fileno()])
+            self.n_of_handed_over += 1
+            self.n_of_pending[self.filling_worker] += 1
+        except OSError:
+            # The worker died, the client needs to reconnect.
+            pass
+        connection.close()  # The worker has its own copy of the socket now
+        return
+
+    def readReport(self, worker_id):
+        data = self.channels[worker_id].recv(1024)
+        if not data:
+            return
+        self.reports[worker_id] += data
+        while b'\n' in self.reports[worker_id]:
+            line, self.reports[worker_id] = self.reports[worker_id].split(b'\n', 1)
+            self.load[worker_id] = tuple(int(value) for value in line.split())
+            self.n_of_pending[worker_id] = 0
+        return
 
-                        if server.waiting_ping[connection_socket]:
-                            if msg_id == 5:
-                                server.receivingPing(connection_socket, msg, time_received)
+    def restartDeadWorkers(self):
+        for worker_id, process in list(self.processes.items()):
+            if not process.is_alive():
+                print("[WORKER", worker_id, "DIED] restarting")
+                self.stopWorker(worker_id)
+                self.startWorker(worker_id)
+        return
 
-                            if min(list(server.n_of_RTT_clients.values())) == server.n_of_probing_ping and not server.game_started:
-                                time.sleep(0.2)
-                                server.startGame()
+    def printLoad(self):
+        now = time.monotonic()
+        if now - self.last_print < self.report_interval:
+            return
+        self.last_print = now
+        for worker_id in sorted(self.load):
+            rooms, clients, messages, _ = self.load[worker_id]
+            print(f"[WORKER {worker_id}] pid {self.processes[worker_id].pid}: {rooms} rooms, {clients} clients, "
+                  f"{messages} msg/s")
+        return
 
 
-                        elif min(list(server.n_of_RTT_clients.values())) >= server.n_of_probing_ping:
-                            # Handling other messages, if the probing is finished.
-                            server.MovementAndFruitUpdate(msg, connection_socket, msg_id)
+def acceptClient(server):
+    """
+    The listening socket is readable, thus a new client is waiting to be accepted.
+    """
+    try:
+        connection, addr = server.server_socket.accept()
+    except OSError:
+        # Client gave up between the select and the accept(or no file descriptor is left, the client is accepted once
+        # one is free again).
+        return
 
+    joinRoom(server, connection)
+    return
 
-            except socket.timeout:
-                """"
-                To not create another thread, the ping before the game(thus game_started = False)
-                is done one by one, by each time looking at
-                the client which has the smallest number of RTTs gotten. This way the server builds it way up to the
-                probing number of RTTs.
-                """
 
-                if not server.game_started:
-                    min_RTT_client = min(server.n_of_RTT_clients, key=server.n_of_RTT_clients.get)
-                    if (server.n_of_RTT_clients[min_RTT_client]) < server.n_of_probing_ping and not server.waiting_ping[min_RTT_client] and server.all_players_active:
-                        server.sendingPing(min_RTT_client)
-                continue
+def joinRoom(server, connection):
+    """
+    The client joins the first room that is still open. If the client has already gone(e.g. its first message, the
+    assigned id, can not be sent), only its connection is closed.
+    """
+    room = server.openRoom()
+    try:
+        room.initializeClient(connection)
+    except OSError:
+        if connection in room.assigned_id:
+            room.disconnectClient(connection)
+        else:
+            connection.close()
+    return
+
+
+def receiveClient(server):
+    """
+    In worker mode: the supervisor handed over the socket of a new client.
+    """
+    msg, fds, _, _ = socket.recv_fds(server.channel, 1, 1)
+    if not msg:
+        # The supervisor has stopped.
+        server.running = False
+        return
+    for fd in fds:
+        joinRoom(server, socket.socket(fileno=fd))
+    return
+
 
+def probeClients(server):
+    """"
+    The ping before the game(thus game_started = False) is done for all clients at once, pipelined(see Room.probe).
+    Only the rooms that are full, but did not start their game yet, are probed.
+    """
+    now = time.monotonic()
+    for room in list(server.probing_rooms):
+        room.probe(now)
+    return
 
 
-        except Exception as e:
-            server.disconnectClient(connection_socket)
+def handleClient(connection_socket, server):
+    """
+    Called by the event loop each time the selector reports that connection_socket has data waiting. All complete
+    messages that came in are handled at once, an incomplete message stays in the mailbox until the rest comes in.
+
+    Because TCP is stream-oriented, and we work with bytes, there is no 'endpoint' indication. This can only be done
+    with looking at the msg_id in the header, look up how long the message would be with this msg_id(in
+    CLIENT_FRAME_LENGTH of Protocol.py), and cut it off the message coming in. Server only gets these type of messages
+    from the client:
+        -message with ID equal to 3: this is position change. In this id, there are two variants:
+            1. The absolute position. This one contains the header, AND the x and y position, which are 4 bytes.
+            2. The relative position difference(direction). This one has only the header, no data
+        -message with ID equal to 6. This message is apart from the message ID, identical to the ID 3. The only
+        difference is that his id notifies the server that a fruit was taken.
+        -message ID equal to 5: this is the answer to a ping. This contains the header(1 byte), the time stamp of the
+        server, and the time stamps the client received the ping and sent the answer. These are 32-bit, thus 4 bytes
+        each.
+        -message ID 4; the client leaves the game. This has only the header(1 byte)
+    """
+    room = server.room_of.get(connection_socket)
+    if room is None:
+        # The client was disconnected by an earlier event of the same select.
+        return
+    try:
+        mailbox = server.messages[connection_socket]
+        if not mailbox.receiveFrom(connection_socket):
+            # Peer closed the connection without sending the leaving message.
+            room.disconnectClient(connection_socket)
             return
 
+        time_received = timestamp()
+        for msg in mailbox.frames():
+            if not handleFrame(server, room, connection_socket, msg, time_received):
+                return
+
+    except OSError:
+        if connection_socket in room.connected_sockets:
+            room.disconnectClient(connection_socket)
+    except Exception:
+        logError("handling a message of " + describeSocket(connection_socket))
+        dropClient(server, connection_socket)
+    return
+
+
+def handleFrame(server, room, connection_socket, msg, time_received):
+    """
+    Handling one complete message of connection_socket, whether it came in over TCP or(with --udp) in a datagram.
+    Returns False if the client has left.
+    """
+    server.n_of_received += 1
+    number_of_bytes = len(msg)
+    msg_id = HEADER_DECODE[msg[0]][0]
+
+    room.statistics[room.assigned_id[connection_socket]].recordMessage(number_of_bytes)
+    server.counters.messages['received'][msg_id] += 1
+    server.counters.bytes['received'] += number_of_bytes
+    if server.metrics_log:
+        server.metrics_log.record(room.room_id, room.assigned_id[connection_socket], msg_id, RECEIVED, number_of_bytes,
+                                  room.RTT_clients[connection_socket])
+
+    if msg_id == 4:  # Closing connection with player
+        room.disconnectClient(connection_socket)
+        return False
+
+    if not room.all_players_active:  # Only sending position of Player through if server is initialized.
+        return True
+
+    if msg_id == 5:
+        if room.waiting_ping[connection_socket]:
+            room.receivingPing(connection_socket, msg, time_received)
+
+        if not room.game_started and room.isProbed():
+            room.startGame()
+        return True
+
+    if room.game_started:
+        # Handling other messages, if the probing is finished. A move is never dropped(also not while a ping is on its
+        # way), so that every move of a client is echoed back to it, in order.
+        start = time.perf_counter()
+        room.MovementAndFruitUpdate(msg, connection_socket, msg_id)
+        server.counters.fan_out_seconds += time.perf_counter() - start
+    return True
+
+
+def receiveDatagram(server):
+    """
+    With --udp: the UDP socket is readable, a datagram of one of the clients came in. The session in its header tells
+    to which client(TCP connection) it belongs. The first valid datagram of a session fixes the address the moves of
+    the client are sent to, a datagram of the session from another address is dropped. A datagram without messages
+    from a client that did not send any move yet, is the 'hello' of the client: it is answered, so that the client
+    knows the UDP path works.
+    """
+    try:
+        datagram, address = server.udp_socket.recvfrom(MAX_DATAGRAM)
+    except OSError:
+        # Nothing to receive anymore, or an error of an earlier send(port of a client that has left).
+        return
+    connection_socket = server.udp_sessions.get(sessionOf(datagram))
+    if connection_socket is None:
+        # Not(or not anymore) a client of this server.
+        return
+    room = server.room_of.get(connection_socket)
+    if room is None:
+        return
+    if server.udp_address.get(connection_socket, address) != address:
+        # Not sent by the client that sent the first datagram of the session.
+        return
+    channel = server.udp_channels[connection_socket]
+    try:
+        messages = channel.receive(datagram)
+    except ValueError:
+        # Malformed datagram, it is dropped.
+        return
+    server.udp_address[connection_socket] = address
+    if hasMessages(datagram) or channel.highest_received is None:
+        try:
+            server.udp_socket.sendto(channel.acknowledgement(), address)
+        except OSError:
+            # The acknowledgement is dropped, the next datagram acknowledges as well.
+            pass
+
+    time_received = timestamp()
+    try:
+        for msg in messages:
+            if not handleFrame(server, room, connection_socket, msg, time_received):
+                return
+    except OSError:
+        if connection_socket in room.connected_sockets:
+            room.disconnectClient(connection_socket)
+    except Exception:
+        logError("handling a datagram of " + describeSocket(connection_socket))
+        dropClient(server, connection_socket)
+    return
+
 
 if __name__ == "__main__":
     try:
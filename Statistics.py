@@ -0,0 +1,167 @@
+"""
+Traffic statistics the server keeps per client, for the plots after the game(HelperFunctions.py).
+
+The memory of the statistics does not grow with the number of messages: only the last RECENT_SAMPLES message sizes and
+RTTs are kept(ring buffer), next to running totals and a histogram of all values. The histogram has log-linear
+buckets, like HdrHistogram: the small values each have their own bucket, and every power of two above them is split in
+a fixed number of buckets, so the relative error of a bucket is bounded, whatever the range of the values.
+
+At the end of a match, the server saves the statistics of its players to a JSON file in STATISTICS_DIRECTORY(see
+saveStatistics), from which HelperFunctions.py makes the plots in another process.
+"""
+import collections
+import json
+import os
+
+RECENT_SAMPLES = 4096  # Number of message sizes and RTTs that are kept one by one, per client
+MAX_MESSAGE_BYTES = 1024  # Largest message size in the histogram, the batches of tick mode being the largest messages
+MAX_RTT = 65536  # Largest RTT(ms) in the histogram, a ping that took over a minute is counted as 65536 ms
+STATISTICS_DIRECTORY = 'Statistics'  # The statistics files of the matches are saved here
+
+
+class Histogram():
+    """
+    Log-linear histogram of non-negative integers up to highest_value. The values below 2^sub_bucket_bits each have
+    their own bucket, above that each power of two has 2^(sub_bucket_bits - 1) buckets: the relative error is at most
+    1/2^(sub_bucket_bits - 1). Larger values are counted in the last bucket.
+    """
+    def __init__(self, highest_value, sub_bucket_bits=5):
+        self.sub_bucket_bits = sub_bucket_bits
+        self.highest_value = highest_value
+        self.counts = [0] * (self.bucketOf(highest_value) + 1)
+        self.n_of_values = 0
+        self.total = 0
+
+    def bucketOf(self, value):
+        shift = value.bit_length() - self.sub_bucket_bits
+        if shift <= 0:
+            return value
+        half = 1 << (self.sub_bucket_bits - 1)
+        return (1 << self.sub_bucket_bits) + (shift - 1) * half + (value >> shift) - half
+
+    def lowestValueOf(self, bucket):
+        """
+        The lowest value that is counted in bucket.
+        """
+        if bucket < 1 << self.sub_bucket_bits:
+            return bucket
+        half = 1 << (self.sub_bucket_bits - 1)
+        shift, offset = divmod(bucket - (1 << self.sub_bucket_bits), half)
+        return (half + offset) << (shift + 1)
+
+    def record(self, value):
+        value = min(max(int(round(value)), 0), self.highest_value)
+        self.counts[self.bucketOf(value)] += 1
+        self.n_of_values += 1
+        self.total += value
+        return
+
+    def mean(self):
+        return self.total / self.n_of_values if self.n_of_values else None
+
+    def valueAt(self, fraction):
+        """
+        The (lowest value of the bucket of the) value below which the given fraction of the values lies, None if there
+        are no values.
+        """
+        if not self.n_of_values:
+            return None
+        rank = min(int(fraction * self.n_of_values), self.n_of_values - 1)
+        for bucket, count in enumerate(self.counts):
+            rank -= count
+            if rank < 0:
+                return self.lowestValueOf(bucket)
+
+    def nonEmptyBuckets(self):
+        """
+        {lowest value of the bucket: number of values} of the buckets that are not empty.
+        """
+        return {self.lowestValueOf(bucket): count for bucket, count in enumerate(self.counts) if count}
+
+    def toDict(self):
+        return {'highest_value': self.highest_value, 'sub_bucket_bits': self.sub_bucket_bits, 'total': self.total,
+                'counts': {bucket: count for bucket, count in enumerate(self.counts) if count}}
+
+    @classmethod
+    def fromDict(cls, values):
+        histogram = cls(values['highest_value'], values['sub_bucket_bits'])
+        for bucket, count in values['counts'].items():
+            histogram.counts[int(bucket)] = count
+        histogram.n_of_values = sum(histogram.counts)
+        histogram.total = values['total']
+        return histogram
+
+
+class ClientStatistics():
+    """
+    The messages(both directions) and the RTTs of one client.
+    """
+    def __init__(self):
+        self.n_of_messages = 0
+        self.total_bytes = 0  # Number of bytes of all messages, both sent and received
+        self.recent_bytes = collections.deque(maxlen=RECENT_SAMPLES)  # Size of each of the last messages
+        self.size_histogram = Histogram(MAX_MESSAGE_BYTES, sub_bucket_bits=11)  # Every size has its own bucket
+        self.recent_RTTs = collections.deque(maxlen=RECENT_SAMPLES)  # (number of the ping, RTT estimate) of the last pings
+        self.RTT_histogram = Histogram(MAX_RTT)
+
+    def recordMessage(self, n_of_bytes):
+        self.n_of_messages += 1
+        self.total_bytes += n_of_bytes
+        self.recent_bytes.append(n_of_bytes)
+        self.size_histogram.record(n_of_bytes)
+        return
+
+    def recordRTT(self, n_of_ping, RTT):
+        self.recent_RTTs.append((n_of_ping, RTT))
+        self.RTT_histogram.record(RTT)
+        return
+
+    def averageBytes(self):
+        """
+        The running average of the number of bytes per message, after each of the last messages. Only computed when it
+        is plotted.
+        """
+        n_of_messages = self.n_of_messages - len(self.recent_bytes)
+        total_bytes = self.total_bytes - sum(self.recent_bytes)
+        averages = []
+        for n_of_bytes in self.recent_bytes:
+            n_of_messages += 1
+            total_bytes += n_of_bytes
+            averages.append(total_bytes / n_of_messages)
+        return averages
+
+    def toDict(self):
+        return {'n_of_messages': self.n_of_messages, 'total_bytes': self.total_bytes,
+                'recent_bytes': list(self.recent_bytes), 'size_histogram': self.size_histogram.toDict(),
+                'recent_RTTs': list(self.recent_RTTs), 'RTT_histogram': self.RTT_histogram.toDict()}
+
+    @classmethod
+    def fromDict(cls, values):
+        client_statistics = cls()
+        client_statistics.n_of_messages = values['n_of_messages']
+        client_statistics.total_bytes = values['total_bytes']
+        client_statistics.recent_bytes.extend(values['recent_bytes'])
+        client_statistics.size_histogram = Histogram.fromDict(values['size_histogram'])
+        client_statistics.recent_RTTs.extend(tuple(sample) for sample in values['recent_RTTs'])
+        client_statistics.RTT_histogram = Histogram.fromDict(values['RTT_histogram'])
+        return client_statistics
+
+
+def saveStatistics(statistics, name):
+    """
+    Saving {player id: ClientStatistics} to STATISTICS_DIRECTORY/<name>.json, and returning the path of the file.
+    """
+    os.makedirs(STATISTICS_DIRECTORY, exist_ok=True)
+    path = os.path.join(STATISTICS_DIRECTORY, name + '.json')
+    with open(path, 'w') as file:
+        json.dump({player_id: client_statistics.toDict() for player_id, client_statistics in statistics.items()}, file)
+    return path
+
+
+def loadStatistics(path):
+    """
+    {player id: ClientStatistics} of a file saved by saveStatistics.
+    """
+    with open(path) as file:
+        values = json.load(file)
+    return {int(player_id): ClientStatistics.fromDict(client_values) for player_id, client_values in values.items()}
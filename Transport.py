@@ -0,0 +1,206 @@
+"""
+Optional UDP transport of the moves(msg ID 3, 6 and 7), used by the server and the client when started with --udp.
+The TCP connection stays, and still carries all other messages(ID assignment, start, leave, pings), but the moves do
+not go over it anymore: with TCP, one lost segment blocks every message after it until it is retransmitted, with UDP a
+lost datagram does not stall the ones after it.
+
+Every datagram starts with a 10 byte header, followed by zero or more entries:
+
+    +-----------------------------------+-----------------+-----------------------------------+
+    |           session(32)             |    ack(16)      |           ack bits(32)            |
+    +-----------------------------------+-----------------+-----------------------------------+
+    | sequence number(16) | message(same bytes as over TCP) | sequence number(16) | message | ...
+
+    -session: a random number the server picks for each client(see newSession), and hands out over TCP in the ID
+    assignment(msg ID 1). In this way, the server knows to which client a datagram belongs, also if the client is behind
+    a NAT(which changes its address and ports). Only who can read the TCP connection knows the session, thus no one else
+    can send moves for the client. The server answers to the address the first valid datagram of the session came from,
+    and drops the datagrams of the session from any other address.
+    -ack: the highest sequence number received from the other side, ack bits: bit i is set if ack - 1 - i is received
+    too. A message that is acknowledged is not repeated anymore.
+    -entries: the last REDUNDANCY messages that are not acknowledged yet, the oldest first. A message that got lost is
+    thus(most likely) still in one of the next datagrams, without waiting for a retransmission timeout. If there is no
+    next message to send, the not acknowledged messages are sent again after RESEND_INTERVAL. Each message is sent at
+    most REDUNDANCY times.
+
+The receiver hands out the messages in order of their sequence number(a move in direction mode is relative, so the
+order matters). A missing message is waited for until a message REDUNDANCY sequence numbers further has come in: from
+then on, it can not be in any datagram anymore, and it is skipped.
+"""
+import secrets
+import struct
+import threading
+import time
+from Protocol import VARIABLE_LENGTH
+
+DATAGRAM_HEADER = struct.Struct('>IHI')  # 10 bytes: session + ack + ack bits
+SEQUENCE = struct.Struct('>H')  # 2 bytes: sequence number in front of each message
+SEQUENCE_MODULO = 65536
+REDUNDANCY = 4  # Number of times a message is sent at most, and number of messages in one datagram at most
+RESEND_INTERVAL = 0.03  # Seconds after which not acknowledged messages are sent again, if nothing new was sent
+MAX_DATAGRAM = 2048
+UDP_MESSAGE_IDS = (3, 6, 7)  # The messages that go over UDP, all others stay on TCP
+
+
+def isNewer(sequence, than):
+    """
+    True if sequence number sequence comes after than, taking the wrap around of the 16-bit numbers into account.
+    """
+    return 0 < (sequence - than) % SEQUENCE_MODULO < SEQUENCE_MODULO // 2
+
+
+def frameLength(frame_length, data, start):
+    """
+    Length of the message that starts at data[start], with frame_length being CLIENT_FRAME_LENGTH or
+    SERVER_FRAME_LENGTH(Protocol.py). 0 if the message is unknown or incomplete.
+    """
+    n_of_bytes = frame_length[data[start]]
+    if n_of_bytes == VARIABLE_LENGTH:
+        n_of_bytes = 2 + data[start + 1] if start + 1 < len(data) else 0
+    if start + n_of_bytes > len(data):
+        return 0
+    return n_of_bytes
+
+
+class DatagramChannel():
+    """
+    Sequence numbers, acknowledgements and redundancy of the messages between one client and the server. The channel
+    does not own a socket: pack/resend/acknowledgement give the datagram to send, receive takes a received datagram.
+    The client uses it from two threads(the main loop sends, the receiver thread receives), hence the lock.
+    """
+    def __init__(self, frame_length, session):
+        self.frame_length = frame_length  # CLIENT_FRAME_LENGTH or SERVER_FRAME_LENGTH, depending on the receiver
+        self.session = session  # The random number the server handed out to the client over TCP
+        self.lock = threading.Lock()
+        self.next_sequence = 0  # Sequence number of the next message that is sent
+        self.unacked = []  # [sequence number, message, number of sends] of the messages that may be repeated
+        self.last_send = 0  # Time(monotonic) of the last datagram with entries
+        self.highest_received = None  # Highest sequence number received, None if nothing received yet
+        self.received_bits = 0  # Bit i set: highest_received - 1 - i is received
+        self.next_expected = 0  # Sequence number of the next message that is handed out
+        self.early = {}  # Messages that came in before a message with a lower sequence number
+        self.n_of_skipped = 0  # Number of messages that were lost in all their datagrams
+
+    def datagram(self):
+        """
+        Header and all repeatable messages, counting each message as sent once more.
+        """
+        ack = SEQUENCE_MODULO - 1 if self.highest_received is None else self.highest_received
+        datagram = [DATAGRAM_HEADER.pack(self.session, ack, self.received_bits)]
+        for entry in self.unacked:
+            datagram.append(SEQUENCE.pack(entry[0]))
+            datagram.append(entry[1])
+            entry[2] += 1
+        self.unacked = [entry for entry in self.unacked if entry[2] < REDUNDANCY]
+        self.last_send = time.monotonic()
+        return b''.join(datagram)
+
+    def pack(self, message):
+        """
+        Datagram with message, and the messages before it that are not acknowledged yet.
+        """
+        with self.lock:
+            self.unacked.append([self.next_sequence, bytes(message), 0])
+            self.unacked = self.unacked[-REDUNDANCY:]
+            self.next_sequence = (self.next_sequence + 1) % SEQUENCE_MODULO
+            return self.datagram()
+
+    def resend(self):
+        """
+        Datagram with the messages that are not acknowledged yet, if nothing was sent for RESEND_INTERVAL. None if
+        there is nothing to send again.
+        """
+        with self.lock:
+            if not self.unacked or time.monotonic() - self.last_send < RESEND_INTERVAL:
+                return None
+            return self.datagram()
+
+    def acknowledgement(self):
+        """
+        Datagram without messages, only acknowledging what is received.
+        """
+        with self.lock:
+            ack = SEQUENCE_MODULO - 1 if self.highest_received is None else self.highest_received
+            return DATAGRAM_HEADER.pack(self.session, ack, self.received_bits)
+
+    def markReceived(self, sequence):
+        if self.highest_received is None:
+            self.highest_received = sequence
+        elif isNewer(sequence, self.highest_received):
+            shift = (sequence - self.highest_received) % SEQUENCE_MODULO
+            self.received_bits = ((self.received_bits << shift) | (1 << (shift - 1))) & 0xFFFFFFFF
+            self.highest_received = sequence
+        else:
+            distance = (self.highest_received - sequence) % SEQUENCE_MODULO
+            if 1 <= distance <= 32:
+                self.received_bits |= 1 << (distance - 1)
+        return
+
+    def markAcknowledged(self, ack, ack_bits):
+        self.unacked = [entry for entry in self.unacked
+                        if not (entry[0] == ack or 1 <= (ack - entry[0]) % SEQUENCE_MODULO <= 32 and
+                                ack_bits >> ((ack - entry[0]) % SEQUENCE_MODULO - 1) & 1)]
+        return
+
+    def receive(self, datagram):
+        """
+        Handling a received datagram. Returns the list of messages that can be handed out now, in order. Raises
+        ValueError if the datagram can not be parsed.
+        """
+        if len(datagram) < DATAGRAM_HEADER.size:
+            raise ValueError("Datagram shorter than its header")
+        _, ack, ack_bits = DATAGRAM_HEADER.unpack_from(datagram)
+        with self.lock:
+            self.markAcknowledged(ack, ack_bits)
+
+            newest = None
+            start = DATAGRAM_HEADER.size
+            while start < len(datagram):
+                sequence, = SEQUENCE.unpack_from(datagram, start)
+                start += SEQUENCE.size
+                n_of_bytes = frameLength(self.frame_length, datagram, start) if start < len(datagram) else 0
+                if n_of_bytes == 0:
+                    raise ValueError("Unknown or incomplete message in datagram")
+                self.markReceived(sequence)
+                if sequence == self.next_expected or isNewer(sequence, self.next_expected):
+                    self.early[sequence] = bytes(datagram[start:start + n_of_bytes])
+                if newest is None or isNewer(sequence, newest):
+                    newest = sequence
+                start += n_of_bytes
+
+            messages = []
+            while True:
+                if self.next_expected in self.early:
+                    messages.append(self.early.pop(self.next_expected))
+                elif newest is not None and isNewer(newest, self.next_expected) and \
+                        (newest - self.next_expected) % SEQUENCE_MODULO >= REDUNDANCY:
+                    # Lost in every datagram it was in.
+                    self.n_of_skipped += 1
+                else:
+                    break
+                self.next_expected = (self.next_expected + 1) % SEQUENCE_MODULO
+            return messages
+
+
+def newSession(sessions):
+    """
+    A random 32-bit session that is not in sessions yet. It comes from the random source of the OS(secrets), so the
+    session of one client can not be guessed from the ones of the others.
+    """
+    session = secrets.randbits(32)
+    while session in sessions:
+        session = secrets.randbits(32)
+    return session
+
+
+def sessionOf(datagram):
+    """
+    The session(see newSession) a datagram belongs to, None if the datagram is too short.
+    """
+    if len(datagram) < DATAGRAM_HEADER.size:
+        return None
+    return DATAGRAM_HEADER.unpack_from(datagram)[0]
+
+
+def hasMessages(datagram):
+    return len(datagram) > DATAGRAM_HEADER.size
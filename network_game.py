@@ -1,9 +1,16 @@
 import sys
 import socket
 import threading
+import queue
+import collections
 import time
 import pygame
 from pygame.locals import *
+from Protocol import HEADER, HEADER_BYTES, HEADER_DECODE, SERVER_FRAME_LENGTH, POSITION, FrameBuffer, decodeFrame, \
+    splitBatch, pingReply, timestamp, STEPS_S, STEP_PIXELS
+from Transport import DatagramChannel, RESEND_INTERVAL, MAX_DATAGRAM, hasMessages
+from CollisionGrid import CollisionGrid
+from LevelCompiler import loadLevel
 
 ####################################
 # Constants
@@ -19,14 +26,16 @@ gold = [255, 215, 0]
 brown = [210, 105, 30]
 
 
-# Entity object.
+# Displacement of each direction(see Player.movement)
+xDirection = {5: 0, 1: 0, 2: 1, 3: 0, 4: -1}
+yDirection = {5: 0, 1: -1, 2: 0, 3: 1, 4: 0}
+keyDirection = {K_RIGHT: 2, K_LEFT: 4, K_UP: 1, K_DOWN: 3}  # If more keys are held, the last one in here counts
+
+
+# Entity object. The entities have __slots__: a level has a tile for each wall, an attribute that is not in __slots__
+# can thus not be set.
 class Entity(object):
-    x = 0
-    y = 0
-    w = 0
-    h = 0
-    rect = Rect(x, y, w, h)
-    color = [0, 0, 0]
+    __slots__ = ('x', 'y', 'w', 'h', 'color', 'rect', 'hasCollision', 'isCollectible')
 
     # Constructor
     def __init__(self, x, y, w, h, color):
@@ -41,31 +50,40 @@ class Entity(object):
         self.hasCollision = False
         self.isCollectible = False
 
-    # Update the rectangle used for collisions.
+    # Update the rectangle used for collisions. The rectangle is changed in place, not created again on every move.
     def updateRect(self):
-        self.rect = Rect(self.x, self.y, self.w, self.h)
+        self.rect.update(self.x, self.y, self.w, self.h)
 
-    def draw(self):
-        # Draw the object with a given color and position to the screen.
-        pygame.draw.rect(screen, self.color, [self.x, self.y, self.w+3, self.h+3], 0)
+    def draw(self, surface=None):
+        # Draw the object with a given color and position to the screen(or to surface). Returns the part drawn.
+        return pygame.draw.rect(screen if surface is None else surface, self.color, [self.x, self.y, self.w+3, self.h+3], 0)
 
 
 class Player(Entity):
     """"
     A player is a client, it is the block that the person plays on his own pc
     """
+    __slots__ = ('origX', 'origY', 'xOld', 'yOld', 'moveSpeed', 'active', 'score', 'ID', 'send_x', 'send_y',
+                 'confirmed_x', 'confirmed_y', 'pending_inputs', 'input_timeout')
+
     def __init__(self, x, y, w, h, color, identifier):
         Entity.__init__(self, x, y, w, h, color)
         self.origX = x
         self.origY = y
+        self.xOld = x  # Position before the last move(or fake move)
+        self.yOld = y
         self.hasCollision = True
-        self.moveSpeed = 0.5  # speed of the player
+        self.moveSpeed = STEP_PIXELS[0]  # speed of the player, in pixels per simulation step
         self.active = False
         self.score = 0
         self.ID = int(identifier)
         self.send_x = None  # x-position(absolute, or only direction) that is SENT to the server
         self.send_y = None  # y-position(absolute, or only direction) that is SENT to the server
-
+        self.confirmed_x = x  # Prediction mode: x-position after the last move that the server echoed back
+        self.confirmed_y = y  # Prediction mode: y-position after the last move that the server echoed back
+        self.pending_inputs = collections.deque()  # Prediction mode: (direction, x, y, time sent) of each move that is
+        # sent, but not echoed back yet, the oldest first
+        self.input_timeout = 1.5  # Prediction mode: seconds after which a move that is not echoed back counts as lost
 
 
     def reset(self):
@@ -76,11 +94,11 @@ class Player(Entity):
         # Keep the old positional x and y value.
         self.updateRect()
 
-    def movement(self, deltaTime, msg):
+    def movement(self, msg):
         """"
-        To spare on data being sent, only the direction is sent DURING a key is pressed. If a new key is pressed, then
-        the exact(absolute) position is sent to the server. This is done to ensure that each client gets the right
-        representation, and avoid that problems accumulate in case of high ping.
+        To spare on data being sent, only the direction is sent, also when a key is first pressed. A direction moves a
+        whole step, so the clients can not drift apart. The exact(absolute) position is only sent as a correction(see
+        the out of map check of the main loop).
 
         The following encoding is used for the directions:
         (x_direction_key, y_direction_key) : meaning
@@ -90,24 +108,72 @@ class Player(Entity):
             (3,3): the y-value INCREASES, while the x-value does NOT change
             (4,4): the x-value DECREASES, while the y-value does NOT change
 
+        A direction is one simulation step(see tick): the player moves moveSpeed pixels, a whole number. A direction is
+        thus played exactly the same on every client, whatever the FPS of the client.
         """
-        x_direction = {5: 0, 1: 0, 2: 1, 3: 0, 4: -1}
-        y_direction = {5: 0, 1: -1, 2: 0, 3: 1, 4: 0}
-        direction_x = x_direction[msg]
-        direction_y = y_direction[msg]
+        direction_x = xDirection[msg]
+        direction_y = yDirection[msg]
 
         # Keep the old positional x and y value.
         self.xOld = self.x
         self.yOld = self.y
 
-        self.x += self.moveSpeed * deltaTime*direction_x
-        self.y += self.moveSpeed * deltaTime*direction_y
+        self.x += self.moveSpeed * direction_x
+        self.y += self.moveSpeed * direction_y
 
         # Updating rectangle, as position changed
         self.updateRect()
 
+    def applyInput(self, direction, x, y):
+        """
+        Playing one move: a direction(1-5) is played with movement, direction 0 is the absolute position x, y.
+        """
+        if direction in [1, 2, 3, 4, 5]:
+            self.movement(direction)
+        else:
+            self.x, self.y = x, y
+            self.updateRect()
+
+    def predict(self, direction, x, y):
+        """
+        Prediction mode: the move is played right away, and kept until the server echoes it back. The moves of one client
+        are echoed back in the order they were sent, thus the position in pending_inputs is the input sequence number.
+        """
+        self.pending_inputs.append((direction, x, y, time.monotonic()))
+        self.applyInput(direction, x, y)
+
+    def reconcile(self, direction, data):
+        """
+        Prediction mode: the server echoed back the oldest pending move. The echo is authoritative: it is played on the
+        confirmed position, after which the moves that are not echoed back yet are replayed on top of it. A direction
+        moves a whole step, so the replay ends exactly where the prediction did.
+        """
+        if self.pending_inputs:
+            self.pending_inputs.popleft()
+        self.x, self.y = self.confirmed_x, self.confirmed_y
+        self.applyInput(direction, *(data[:2] if data else (0, 0)))
+        self.confirmed_x, self.confirmed_y = self.x, self.y
+        for pending_input in self.pending_inputs:
+            self.applyInput(*pending_input[:3])
+
+    def dropLostInputs(self):
+        """
+        Prediction mode: a move that is not echoed back within input_timeout got lost(UDP), it is not replayed anymore.
+        """
+        n_of_lost = 0
+        while self.pending_inputs and time.monotonic() - self.pending_inputs[0][3] > self.input_timeout:
+            self.pending_inputs.popleft()
+            n_of_lost += 1
+        if n_of_lost:
+            self.x, self.y = self.confirmed_x, self.confirmed_y
+            self.updateRect()
+            for pending_input in self.pending_inputs:
+                self.applyInput(*pending_input[:3])
+
 
 class CollisionBlock(Entity):
+    __slots__ = ()
+
     def __init__(self, x, y, w, h, color):
         Entity.__init__(self, x, y, w, h, color)
         self.hasCollision = True
@@ -119,13 +185,17 @@ class Opponent(Entity):
     With this, the number of players can be easily generalized to N-players, by which each identifies himself by his or
     her ID. This is distributed by the server
     """
+    __slots__ = ('origX', 'origY', 'xOld', 'yOld', 'score', 'moveSpeed', 'active', 'ID')
+
     def __init__(self, x, y, w, h, color, identifier):
         Entity.__init__(self, x, y, w, h, color)
         self.origX = x
         self.origY = y
+        self.xOld = x  # Position before the last move
+        self.yOld = y
         self.score = 0
         self.hasCollision = True
-        self.moveSpeed = 0.5  # Speed of movement
+        self.moveSpeed = STEP_PIXELS[0]  # Speed of movement, in pixels per simulation step
         self.active = False
         self.ID = identifier  # Each opponent has an id, so that the correct opponent should move
 
@@ -141,7 +211,7 @@ class Opponent(Entity):
         self.yOld = self.y
         self.updateRect()
 
-    def movement(self, deltaTime, msg):
+    def movement(self, msg):
         """"
         Similarly, if directions are sent, then these must be too parsed. This is done by this function; it 'reads' maps
         the given coding to the correct displacement pattern.
@@ -154,17 +224,16 @@ class Opponent(Entity):
             (3,3): the y-value INCREASES, while the x-value does NOT change
             (4,4): the x-value DECREASES, while the y-value does NOT change
 
+        Like the player, an opponent moves moveSpeed pixels per direction, the same as on the client of the opponent.
         """
-        x_direction = {5: 0, 1: 0, 2: 1, 3: 0, 4: -1}
-        y_direction = {5: 0, 1: -1, 2: 0, 3: 1, 4: 0}
-        direction_x = x_direction[msg]
-        direction_y = y_direction[msg]
+        direction_x = xDirection[msg]
+        direction_y = yDirection[msg]
         # Keep the old positional x and y value.
         self.xOld = self.x
         self.yOld = self.y
 
-        self.x += self.moveSpeed * deltaTime*direction_x
-        self.y += self.moveSpeed * deltaTime*direction_y
+        self.x += self.moveSpeed * direction_x
+        self.y += self.moveSpeed * direction_y
 
         self.updateRect()
 
@@ -174,6 +243,8 @@ class PickupBlock(Entity):
     of this, it can happen that the pickupblock is just too close to a wall, and one of the contestants/players cannot
     grab it.
     """
+    __slots__ = ()
+
     def __init__(self, x, y, w, h, color):
         Entity.__init__(self, x, y, w+8, h+8, color)
         self.hasCollision = False
@@ -184,10 +255,17 @@ class PickupBlock(Entity):
 class Level:
     # Constructor
     def __init__(self, fileHandle):
-        # Load level file and create objects. Not important for this assignment.
-        self.f = open(fileHandle)
-        self.tileRows = self.f.readlines()
-        self.map = []
+        # Load level file and create objects. The level is compiled once(and cached, see LevelCompiler.py), the walls
+        # are created once: a reset only takes the fruit out of the map.
+        self.compiled = loadLevel(fileHandle)
+        self.spawnPositions = [(column * tileWidth, row * tileWidth) for column, row in self.compiled.spawns]
+        self.map = [CollisionBlock(column * tileWidth, row * tileWidth, tileWidth, tileWidth, brown)
+                    for column, row in self.compiled.wallTiles()]
+        self.n_of_walls = len(self.map)  # The walls are the first tiles of the map, the fruit is added after them
+        self.grid = CollisionGrid(self.compiled.n_of_columns, self.compiled.n_of_rows, tileWidth)  # CollisionGrid of
+        # the tiles in the map(CollisionGrid.py), for the collision checks
+        for tile in self.map:
+            self.grid.insert(tile)
         self.entities = []
         self.player = None  # The player is predefined....
         self.opponents = {}  # Dictionary used to be able to set up multiple opponents, tested and works.
@@ -199,7 +277,8 @@ class Level:
         # to be able to eaten once, and not multiple times while server validates
         self.all_players_active = False  # This is used to check if the game can be started. All players must be ready.
         self.connected = False  # This attribute serves to check if the TCP connection is set and running.
-        self.deltaTime = 0
+        self.deltaTime = 0  # ms the last frame took
+        self.stepTime = 0  # Time that is not simulated yet, in 1/STEPS_S ms: every 1000 of it is one simulation step
         self.currentCollectible = ''
         self.reset()
         self.direction = 5  # There are absolute positions, but also directions in which there is movement.
@@ -207,24 +286,25 @@ class Level:
         self.waiting_move = False  # Due to the chosen configuration between server, and player, the player must
         # not give the possibility to send a new message, before getting a response from the server.
 
-        i = 0
-        for row in self.tileRows:
-            j = 0
-            for tile in row:
-                self.loadItem(tile, j, i)
-                j += 1
-            i += 1
 
+    def addTile(self, tile):
+        """
+        Adding a tile to the map, and to the collision grid.
+        """
+        self.map.append(tile)
+        self.grid.insert(tile)
 
-    def loadItem(self, tile, x, y):
-        xPos = x * tileWidth
-        yPos = y * tileWidth
-        # Place the object tiles in the map. Not important for this assignment.
-        if (tile == collisionTile):
-            self.map.append(CollisionBlock(xPos, yPos, tileWidth, tileWidth, brown))
-        elif (tile in playerTiles):
-            PositionTiles.append((xPos, yPos))
+    def removeTile(self, tile):
+        self.map.remove(tile)
+        self.grid.remove(tile)
 
+    def takeSteps(self):
+        """
+        The number of simulation steps that are due(see tick), these count as simulated.
+        """
+        n_of_steps = self.stepTime // 1000
+        self.stepTime -= n_of_steps * 1000
+        return n_of_steps
 
     def getTimeLeft(self):
         return self.timeLeft
@@ -245,20 +325,17 @@ class Level:
         self.all_players_active = False
         self.connected = False
         self.deltaTime = 0
+        self.stepTime = 0
+        self.tapped_direction = 5  # Direction of the last key that went down, until it is moved in a simulation step
         self.currentCollectible = ''
-        self.map = []
+        while len(self.map) > self.n_of_walls:
+            # Only the walls stay, these never change.
+            self.removeTile(self.map[-1])
         self.entities = []
         self.all_opponents_left = False
         self.deltaTime = 0
         self.currentCollectible = ''
         self.client = None
-        i = 0
-        for row in self.tileRows:
-            j = 0
-            for tile in row:
-                self.loadItem(tile, j, i)
-                j += 1
-            i += 1
 
     def update(self, deltaTime):
         """"
@@ -300,20 +377,21 @@ class Level:
         If there is a collision, the player does NOT send any data to the server, avoiding extra data being send.
         Beside the collision, there is also checked by the client itself if he has taken a fruit or not, if so
         he sets  self.fruit_eaten on True, and notifies, by specific msg id, the server that it has eaten a fruit.
+        Only the tiles in the cells of the collision grid that the player overlaps are checked, not the whole map. The
+        walls are checked before the fruit, like in the map, where the fruit is added after the walls.
         """
-        recollide = True
         illegal_move = False
         self.fruit_eaten = False
-        while recollide:
-            recollide = False
-            # Check collision of Player vs collectible objects(each client does it for himself, thus client does
-            # only need to look to his player!).
-            for tile in self.map:
-                # Does this tile have collision and its rectangle collides with the rectangle of player 1 ?
-                if tile.hasCollision and tile.rect.colliderect(self.player.rect):
-                    # Because player 1 has changed its position, we have to recalculate the collisions.
-                    illegal_move = True
-                    break
+        # Check collision of Player vs collectible objects(each client does it for himself, thus client does
+        # only need to look to his player!).
+        tiles = self.grid.query(self.player.rect)
+        for tile in tiles:
+            # Does this tile have collision and its rectangle collides with the rectangle of player 1 ?
+            if tile.hasCollision and tile.rect.colliderect(self.player.rect):
+                illegal_move = True
+                break
+        else:
+            for tile in tiles:
                 if tile.isCollectible and tile.rect.colliderect(self.player.rect) and level.fruit_eatable:
                     self.fruit_eaten = True
                     level.fruit_eatable = False
@@ -371,13 +449,17 @@ class Level:
             return False
 
     def draw(self):
-        for tile in self.map:
-            tile.draw()
+        """
+        Drawing the tiles that are not walls(the fruit), and the players. The walls never change, these are on the
+        background(see buildBackgrounds). Returns the parts of the screen that are drawn.
+        """
+        drawn = [tile.draw() for tile in self.map[self.n_of_walls:]]
         if self.player.active:
-            self.player.draw()
+            drawn.append(self.player.draw())
         for opponent in self.opponents.values():
             if opponent.active:
-                opponent.draw()
+                drawn.append(opponent.draw())
+        return drawn
 
 
     def getPlayer(self):
@@ -406,102 +488,177 @@ pygame.init()
 screenSize = [1280, 600]
 screenBGColor = grey
 
-# Tiles
+# Tiles(the characters of the tiles in a level file are defined in LevelCompiler.py)
 tileWidth = 15
-playerTiles = ['A', 'B', 'C', 'D']
 playerColors = [red, blue, black, gold]
-PositionTiles = []
-collisionTile = '#'
 
 # Level map (1-1.txt)
 levelHandle = "1-1.txt"
 level = Level(levelHandle)
 
 
+# Rendering(see render)
+background = None  # The background color with the walls, drawn once
+plainBackground = None  # The background color without the walls, once the level is finished
+wallLayer = None  # Only the walls, on a transparent surface
+renderedOn = None  # (screen, background) of the last frame, the whole screen is drawn again if one of them changed
+dirtyRects = []  # The parts of the screen drawn over the background in the last frame
+textSurfaces = {}  # The rendered surface of each (text, color) that was shown
+maxTextSurfaces = 256  # Once this many texts are rendered, the old ones are forgotten
+
+# Simulation(see tick)
+maxStepsPerFrame = 3  # Simulation steps that are caught up at most after a slow frame
+
 # Game
 running = True
 
 
-def render():
-    # Fill the whole screen with one color.
-    screen.fill(screenBGColor)
+def buildBackgrounds():
+    """
+    Drawing the backgrounds once: the background color with the walls on it(while playing), and without(once the level
+    is finished).
+    """
+    global background, plainBackground, wallLayer
+    plainBackground = pygame.Surface(screenSize).convert()
+    plainBackground.fill(screenBGColor)
+    wallLayer = pygame.Surface(screenSize, pygame.SRCALPHA).convert_alpha()
+    for tile in level.map[:level.n_of_walls]:
+        tile.draw(wallLayer)
+    background = plainBackground.copy()
+    background.blit(wallLayer, (0, 0))
+
+
+def renderText(text, color=black):
+    """
+    The surface of a text. A text is only rendered the first time it is shown: the scores and the time left only
+    change a few times per second, not every frame.
+    """
+    key = (text, tuple(color))
+    surface = textSurfaces.get(key)
+    if surface is None:
+        if len(textSurfaces) >= maxTextSurfaces:
+            textSurfaces.clear()
+        surface = textSurfaces[key] = textFont.render(text, True, color)
+    return surface
 
-    textUIP1 = textFont.render(f"Score P{level.player.ID}(YOU): " + str(level.player.score), True, [0, 0, 0])
-    screen.blit(textUIP1, (20, 560))
+
+def render():
+    """
+    Drawing a frame. Only the parts of the screen that can change are drawn again: the parts drawn in the last frame
+    are restored from the background(which has the walls on it already), the texts and the moving entities are drawn on
+    top, and only these parts are pushed to the display. The whole screen is only drawn if the screen or the background
+    changed(e.g. the level is finished).
+    """
+    global renderedOn, dirtyRects
+    texts = [(renderText(f"Score P{level.player.ID}(YOU): " + str(level.player.score)), (20, 560))]
     y_translation = 30  # Showing points of other players
     x_translation = 30  # Showing points of other players. This is only useful if n_of_players > 4
 
     if len(level.opponents.values()) < client.n_of_players - 1:
-        warningmessage = textFont.render(f"WAITING FOR OPPONENTS",True, [200, 0, 0]) # Game only starts if all players are there
-        screen.blit(warningmessage, (20, 480))
+        # Game only starts if all players are there
+        texts.append((renderText("WAITING FOR OPPONENTS", [200, 0, 0]), (20, 480)))
 
     for opponent_id in level.opponents.keys():
         if not level.opponents[opponent_id].active:
             # If player is not active, a P(<opponent_id>)(LEFT) will be displayed on the other screens of the clients.
-            textOpponent = textFont.render(f"Score P{opponent_id}(LEFT): " + str(level.opponents[opponent_id].score), True, [0, 0, 0])
+            textOpponent = renderText(f"Score P{opponent_id}(LEFT): " + str(level.opponents[opponent_id].score))
         else:
-            textOpponent = textFont.render(f"Score P{opponent_id}: " + str(level.opponents[opponent_id].score), True, [0, 0, 0])
-        screen.blit(textOpponent, (20 + x_translation, 560 - y_translation))
+            textOpponent = renderText(f"Score P{opponent_id}: " + str(level.opponents[opponent_id].score))
+        texts.append((textOpponent, (20 + x_translation, 560 - y_translation)))
         y_translation += 30
         if y_translation%90 == 0:
             x_translation += 30
 
     # Draw the total time left.
-    textTimeLeft = textFont.render("Time left: " + str(round(level.getTimeLeft()/1000)) + " s", True, [0, 0, 0])
-    screen.blit(textTimeLeft, (900, 530))
+    texts.append((renderText("Time left: " + str(round(level.getTimeLeft()/1000)) + " s"), (900, 530)))
     # Only if the level is not finished (timer has not run out yet), then we draw the complete level.
     if level.opponents:
         # If all opponents left, the player that is left over, will win automatically.
         if not any(level.opponents[opponent_id].active for opponent_id in level.opponents.keys()) and level.timeLeft > 0:
             level.levelEnds = True
             level.all_opponents_left = True
-            textWin = textFont.render("YOU WON! All players left", True, [0, 0, 0])
-            screen.blit(textWin, (540, 250))
+            texts.append((renderText("YOU WON! All players left"), (540, 250)))
 
-    if (not level.isLevelFinished()):
-        # Draw the complete level while not finished.
-        level.draw()
-
-    elif level.isLevelFinished() and not level.all_opponents_left:
+    if level.isLevelFinished() and not level.all_opponents_left:
         if all(level.player.score > opponent.score for opponent in level.opponents.values()):
-            textWin = textFont.render("You WON! Press SPACE to play again.", True, [0, 0, 0])
+            textWin = renderText("You WON! Press SPACE to play again.")
         elif any(level.player.score < opponent.score for opponent in level.opponents.values()):
-            textWin = textFont.render("You LOST :<! Press SPACE to play again.", True, [0, 0, 0])
+            textWin = renderText("You LOST :<! Press SPACE to play again.")
         else:
-            textWin = textFont.render("It's a tie ... Press SPACE to play again.", True, [0, 0, 0])
-        screen.blit(textWin, (540, 250))
+            textWin = renderText("It's a tie ... Press SPACE to play again.")
+        texts.append((textWin, (540, 250)))
+
+    if background is None:
+        buildBackgrounds()
+    # The walls are only shown while the level is not finished.
+    base = plainBackground if level.isLevelFinished() else background
+    if renderedOn != (screen, base):
+        screen.blit(base, (0, 0))
+        dirtyRects = [screen.get_rect()]
+        renderedOn = (screen, base)
+    else:
+        for rect in dirtyRects:
+            screen.blit(base, rect, rect)
+
+    drawn = [screen.blit(surface, position) for surface, position in texts]
+    if (not level.isLevelFinished()):
+        # The walls are drawn over the texts, the moving part of the level over both.
+        for rect in drawn:
+            screen.blit(wallLayer, rect, rect)
+        drawn += level.draw()
 
-    # Switch framebuffers. This should be called after every draw.
-    pygame.display.flip()
+    # Only the parts of the last frame(now background again) and of this frame are pushed to the display.
+    pygame.display.update(dirtyRects + drawn)
+    dirtyRects = drawn
 
 
 def tick():
     """"
-    Because the speed is actually given by deltatime TIMES moveSpeed, to reduce the amount of data, we can DIVIDE the
-    number of FPS by two, if we only too multiply moveSpeed by two. But this slightly reduces the user experience(less
-    smoothly play), so we kept it at 30.
+    The game is simulated in fixed steps of 1/STEPS_S s, apart from the FPS the screen is rendered with(--fps): the time
+    of each frame is added to stepTime, and each step that is due lets the player play one move(see takeSteps). A move
+    is a whole number of pixels(moveSpeed), so a direction brings a player to the same position on every client,
+    instead of one that depends on the deltaTime of the client that plays it. The time is counted in 1/STEPS_S ms, so
+    that the steps do not drift either. If a frame took very long, at most maxStepsPerFrame steps are caught up.
     """
-    # We run our game at 30 FPS.
-    level.deltaTime = clock.tick(30)
+    level.deltaTime = clock.tick(client.fps)
+    level.stepTime = min(level.stepTime + level.deltaTime * STEPS_S, maxStepsPerFrame * 1000)
     level.update(level.deltaTime)
 
 
 
+def printUsage():
+    print("Usage: python", sys.argv[0], "<port>", "<host>", "<[OPTIONAL]additional ping(min:0, max: 500, DEFAULT:0)>",
+          "<[OPTIONAL]--udp(moves over UDP)>", "<[OPTIONAL]--predict(play own moves without waiting for the server)>",
+          "<[OPTIONAL]--fps=<frames per second(min: 1, max: 240, DEFAULT:30)>>")
+    return
+
+
 class Client():
     """"
     This class handles the client, more specifically:
         -Socket
-        -The messages received from the server, @handleServer()
+        -The messages received from the server: one receiver thread reassembles and decodes them, and puts them in a
+        queue, which is emptied by the main loop once per tick, @handleServer()
         -Before the game starts, all players are pinged, the game starts only if probing is finished.
         -Simulating a ping, given via terminal
         -Keeping track of the number of players, on default this is equal to 2
+        -With --udp, sending the moves over UDP(Transport.py), once the server has answered the first datagram
+        -With --predict, playing the own moves right away, instead of waiting for the echo of the server
+        -With --fps=<n>, rendering n frames per second, the simulation steps stay at STEPS_S per second(see tick)
     """
     def __init__(self):
         self.socket_connection = None
-        self.total_message = bytes()
+        self.received = queue.Queue()  # (due time, decoded message) of every message received from the server
+        self.next_message = None  # Message taken out of the queue, of which the simulated ping did not pass yet
         self.RTT_probing_finished = False
         self.simulated_ping = 0
         self.n_of_players = 2
+        self.udp = False  # True if started with --udp
+        self.udp_connection = None  # UDP socket to the server, only with --udp
+        self.udp_channel = None  # Sequence numbers, acknowledgements and redundancy of the moves over UDP
+        self.udp_ready = False  # True once the server answered over UDP, until then the moves go over TCP
+        self.predict = False  # True if started with --predict
+        self.fps = 30  # Frames rendered per second, given with --fps
 
     def setupTCPConnection(self):
         """
@@ -510,76 +667,193 @@ class Client():
         system. Losing one ping could result to big delays.
         The extra RTT that TCP gives, is an issue, but this is something that we get for the reliability."""
 
-        if len(sys.argv) == 4:
+        arguments = [argument for argument in sys.argv if not argument.startswith('--')]
+        self.udp = '--udp' in sys.argv
+        self.predict = '--predict' in sys.argv
+        for argument in sys.argv:
+            if argument.startswith('--fps='):
+                try:
+                    self.fps = int(argument[len('--fps='):])
+                except ValueError:
+                    printUsage()
+                    sys.exit(1)
+                if not 1 <= self.fps <= 240:
+                    printUsage()
+                    sys.exit(1)
+        if len(arguments) == 4:
             try:
-                if not 0 <= int(sys.argv[3]) <= 500:
-                    print("Usage: python", sys.argv[0], "<port>", "<host>",
-                          "<[OPTIONAL]additional ping(min:0, max: 500, DEFAULT:0)>")
+                if not 0 <= int(arguments[3]) <= 500:
+                    printUsage()
                     sys.exit(1)
 
                 else:
-                    self.simulated_ping = int(sys.argv[3])
+                    self.simulated_ping = int(arguments[3])
             except:
-                print("Usage: python", sys.argv[0], "<port>", "<host>",
-                      "<[OPTIONAL]additional ping(min:0, max: 500, DEFAULT:0)>")
+                printUsage()
                 sys.exit(1)
 
-        elif not 1 < len(sys.argv) < 4:
-            print("Usage: python", sys.argv[0], "<port>", "<host>", "<[OPTIONAL]additional ping(min:0, max: 500, DEFAULT:0)>")
+        elif not 1 < len(arguments) < 4:
+            printUsage()
             sys.exit(1)
 
-        PORT = int(sys.argv[1])
-        HOST = str(sys.argv[2])
+        PORT = int(arguments[1])
+        HOST = str(arguments[2])
 
         self.socket_connection = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.socket_connection.connect((HOST, PORT))
+        self.socket_connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)  # Moves are sent right away
+        threading.Thread(target=self.receiveFromServer, args=(self.socket_connection,), daemon=True).start()
         return
 
-    def createRequestSpecificCo(self, level, x, y, msg_id):
+    def setupUDPConnection(self, socket_connection, session):
+        """
+        With --udp, the moves go over UDP, on the same port as the TCP connection. The session the server handed out in
+        the ID assignment identifies this client in each datagram(see Transport.py). A server without --udp does not
+        hand out a session, the moves then stay on TCP.
         """
-        There is only send the specific/absolute position of the player, if he presses a key DOWN, once. If the key
-        is being pressed, then the direction(relative position change) is sent to reduce data transfer
-        from client <-> server.
+        self.udp_connection = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.udp_connection.connect(socket_connection.getpeername())
+        self.udp_connection.settimeout(RESEND_INTERVAL)
+        self.udp_channel = DatagramChannel(SERVER_FRAME_LENGTH, session)
+        threading.Thread(target=self.receiveDatagrams, args=(self.udp_connection,), daemon=True).start()
+        return
 
-        waiting_move is set on True, so that the player cannot send another message while the server echoes back his
-        move.
+    def receiveFromServer(self, socket_connection):
         """
-        leading_zeros_2_bit = {1: '0',
-                               2: ''}  # Leading zeros fall of if number is too small, but assigned id, and msg_id
-        leading_zeros_3_bit = {1: '00', 2: '0',
-                               3: ''}  # Leading zeros fall of if number is too small, but assigned id, and msg_id
+        Body of the receiver thread, which lives as long as the connection. TCP is stream oriented based, so it can
+        happen that multiple messages come at once, or that a message comes in parts. The FrameBuffer(Protocol.py) takes
+        care of this. Each complete message is decoded, and put in the queue, together with the time it may be
+        applied(after the simulated ping).
+        Pings are answered right away by this thread(after the simulated ping), so that the RTT measured by the server
+        does not depend on the frame rate of the main loop.
+        """
+        mailbox = FrameBuffer(SERVER_FRAME_LENGTH)
+        try:
+            while mailbox.receiveFrom(socket_connection):
+                due_time = time.monotonic() + self.simulated_ping/1000
+                for frame in mailbox.frames():
+                    self.queueFrame(socket_connection, frame, due_time)
+        except (OSError, ValueError):
+            # Connection is closed, or the stream can not be parsed anymore.
+            pass
+        return
 
-        player_id = leading_zeros_2_bit[len(bin(level.player.ID)[2:])] + bin(level.player.ID)[2:]
-        msg_id = leading_zeros_3_bit[len(bin(msg_id)[2:])] + bin(msg_id)[2:]
-        header = str(msg_id + player_id + '000')
+    def queueFrame(self, socket_connection, frame, due_time):
+        if HEADER_DECODE[frame[0]][0] == 7:
+            # A batch(server in tick mode) holds all moves of one tick
+            for message in splitBatch(frame):
+                self.received.put((due_time, decodeFrame(message)))
+            return
+        message = decodeFrame(frame)
+        if message[0] == 5:
+            self.answerPing(socket_connection, bytes(frame))
+        elif message[0] == 1 and message[3] and self.udp:
+            self.setupUDPConnection(socket_connection, message[3][0])
+        self.received.put((due_time, message))
+        return
 
-        header = int(header, 2).to_bytes(1, byteorder='big')
-        pos_x = round(x).to_bytes(2, byteorder='big')
-        pos_y = round(y).to_bytes(2, byteorder='big')
+    def receiveDatagrams(self, udp_connection):
+        """
+        Body of the UDP receiver thread. Until the server has answered, a datagram without moves(the 'hello') is sent
+        every RESEND_INTERVAL, for at most 1 s: if the server does not answer, the moves stay on TCP. Afterwards, each
+        datagram with moves is acknowledged, and the moves that are not acknowledged by the server are sent again.
+        """
+        n_of_hellos = 0
+        while True:
+            try:
+                if not self.udp_ready:
+                    if n_of_hellos >= 1 / RESEND_INTERVAL:
+                        # The server does not answer over UDP, the moves stay on TCP.
+                        return
+                    udp_connection.send(self.udp_channel.acknowledgement())
+                    n_of_hellos += 1
+                else:
+                    datagram = self.udp_channel.resend()
+                    if datagram:
+                        udp_connection.send(datagram)
+                try:
+                    datagram = udp_connection.recv(MAX_DATAGRAM)
+                except socket.timeout:
+                    continue
+                due_time = time.monotonic() + self.simulated_ping/1000
+                messages = self.udp_channel.receive(datagram)
+                self.udp_ready = True
+                if hasMessages(datagram):
+                    udp_connection.send(self.udp_channel.acknowledgement())
+                for frame in messages:
+                    self.queueFrame(self.socket_connection, frame, due_time)
+            except ValueError:
+                # Malformed datagram, it is dropped.
+                continue
+            except OSError:
+                # Socket is closed, or the server does not listen on UDP(the moves stay on TCP).
+                if self.udp_connection is not udp_connection or not self.udp_ready:
+                    return
+
+    def send(self, request):
+        """
+        Sending a move to the server: over UDP if the server has answered over UDP, over TCP otherwise.
+        """
+        if self.udp_ready:
+            try:
+                self.udp_connection.send(self.udp_channel.pack(request))
+            except OSError:
+                # The datagram is dropped, it is repeated in the next one.
+                pass
+        else:
+            self.socket_connection.sendall(request)
+        return
 
-        data = pos_x + pos_y
-        request = header + data
+    def answerPing(self, socket_connection, ping):
+        """
+        Answering the ping of the server with the time stamps of this client(see ClockSync.py). With a simulated ping,
+        this is done by a timer thread, so that the receiver thread can continue receiving in the meantime.
+        """
+        if self.simulated_ping:
+            threading.Timer(self.simulated_ping/1000, self.sendAnswer, args=(socket_connection, ping)).start()
+        else:
+            self.sendAnswer(socket_connection, ping)
+        return
 
-        level.waiting_move = True
-        self.socket_connection.sendall(request)
+    def sendAnswer(self, socket_connection, ping):
+        """
+        The ping counts as received now, after the simulated ping.
+        """
+        try:
+            socket_connection.sendall(pingReply(ping, timestamp()))
+        except OSError:
+            # Connection is already closed.
+            pass
         return
 
-    def createRequestDirection(self, level, direction, msg_id):
+    def createRequestSpecificCo(self, level, x, y, msg_id):
         """
-        Specific request if there is only send a direction.
+        The specific/absolute position of the player is only sent as correction, if the player is put back on the
+        map(see the main loop). Every key press sends the direction(relative position change) instead, to reduce data
+        transfer from client <-> server.
+
+        waiting_move is set on True, so that the player cannot send another message while the server echoes back his
+        move. In prediction mode, the move is played right away instead, and the player can keep on moving.
         """
-        leading_zeros_2_bit = {1: '0', 2: ''}  # Leading zeros fall of if number is too small, but assigned id, and msg_id
-        leading_zeros_3_bit = {1: '00', 2: '0', 3: ''}  # Leading zeros fall of if number is too small, but assigned id, and msg_id
+        request = POSITION.pack(HEADER[msg_id][level.player.ID][0], round(x), round(y))
 
-        player_id = leading_zeros_2_bit[len(bin(level.player.ID)[2:])] + bin(level.player.ID)[2:]
-        msg_id = leading_zeros_3_bit[len(bin(msg_id)[2:])] + bin(msg_id)[2:]
-        direction = leading_zeros_3_bit[len(bin(direction)[2:])] + bin(direction)[2:]
+        if self.predict:
+            level.player.predict(0, round(x), round(y))
+        else:
+            level.waiting_move = True
+        self.send(request)
+        return
 
-        header = str(msg_id + player_id + direction)
-        header = int(header, 2).to_bytes(1, byteorder='big')
-        request = header
-        level.waiting_move = True
-        self.socket_connection.sendall(request)
+    def createRequestDirection(self, level, direction, msg_id):
+        """
+        Specific request if there is only send a direction.
+        """
+        request = HEADER_BYTES[HEADER[msg_id][level.player.ID][direction]]
+        if self.predict:
+            level.player.predict(direction, 0, 0)
+        else:
+            level.waiting_move = True
+        self.send(request)
         return
 
     def reset(self):
@@ -587,59 +861,47 @@ class Client():
         If player disconnects, all other players are notified.
         """
 
-        header = int('10000000', 2).to_bytes(1, byteorder='big')  # msg id is 4, thus 100 in front, all the others are
-                                                                    # zero in the header
-
-        response = header
+        response = HEADER_BYTES[HEADER[4][0][0]]  # msg id is 4, all the others are zero in the header
         self.socket_connection.sendall(response)
         self.socket_connection.close()
         self.socket_connection = None
-        self.total_message = ''
+        if self.udp_connection:
+            self.udp_connection.close()
+            self.udp_connection = None
+            self.udp_ready = False
         self.RTT_probing_finished = False
 
 
 
 
-def parseMessage(level, client, msg):
-    header_string = ''
-    header = msg[0]
-    for bit in range(7, -1, -1):
-        header_string += str((header & (1 << bit)) >> bit)
-    msg_id = int(header_string[:3], 2)
-    contestant_id = int(header_string[3:5], 2)
-    direction = int(header_string[5:8], 2)
-
-
+def applyMessage(level, client, msg_id, contestant_id, direction, data):
+    """
+    Applying one message of the server(decoded by the receiver thread with decodeFrame of Protocol.py) on the level.
+    This is only done by the main loop, so that the level is never changed while it is being drawn.
+    """
     if msg_id == 1:
         assigned_id = contestant_id
         print("ASSIGNED_ID", assigned_id)
-        level.player = Player(PositionTiles[assigned_id][0], PositionTiles[assigned_id][1],
+        level.player = Player(level.spawnPositions[assigned_id][0], level.spawnPositions[assigned_id][1],
                               tileWidth, tileWidth, playerColors[assigned_id], assigned_id)
         level.player.active = True
-        return msg[1:]  # Returning the rest of the message
 
     elif msg_id == 2:
-        if len(msg) < 7:
-            # In case the message was not fully done
-            print("MESSAGE NOT TOTAL", len(msg))
-            return -1
-        time_left = int.from_bytes(msg[1:3], byteorder='big', signed=False)
-        fruit_x = int.from_bytes(msg[3:5], byteorder='big', signed=False)
-        fruit_y = int.from_bytes(msg[5:7], byteorder='big', signed=False)
+        time_left, fruit_x, fruit_y = data
 
         n_opponents = contestant_id # in case id=2, the contestant ID resembles the number of opponents
         client.n_of_players = n_opponents + 1
         for id in range(0, client.n_of_players):
             if not id == level.player.ID:
-                level.opponents[id] = Opponent(PositionTiles[id][0], PositionTiles[id][1],
+                level.opponents[id] = Opponent(level.spawnPositions[id][0], level.spawnPositions[id][1],
                                                tileWidth, tileWidth, playerColors[id], id)
                 level.opponents[id].active = True
                 level.opponents[id].score = 0
                 # Based on current RTT, the game is going to be made faster. If no delay, than low speed suffice.
-                level.opponents[id].moveSpeed = {0: 0.4, 1: 0.6, 2: 0.8}[direction]
+                level.opponents[id].moveSpeed = STEP_PIXELS[direction]
                 print("active!")
-        level.player.moveSpeed = {0: 0.4, 1: 0.6, 2: 0.8}[direction]
-        print("SPEED CHOSEN AS:", {0: 0.4, 1: 0.6, 2: 0.8}[direction])
+        level.player.moveSpeed = STEP_PIXELS[direction]
+        print("SPEED CHOSEN AS:", STEP_PIXELS[direction], "pixels per step")
         level.all_players_active = True
         client.RTT_probing_finished = True
         level.player.score = 0
@@ -647,126 +909,65 @@ def parseMessage(level, client, msg):
         level.fruit_x = fruit_x
         level.fruit_y = fruit_y
         level.currentCollectible = PickupBlock(level.fruit_x, level.fruit_y, 25, 25, green)
-        level.map.append(level.currentCollectible)
-        return msg[7:]  # Returning the rest of the message
+        level.addTile(level.currentCollectible)
 
     elif msg_id == 3 or msg_id == 6:  # Movement, but without speed control
-        # last byte.
         if contestant_id == level.player.ID:
             level.waiting_move = False
-
-            if direction in [1, 2, 3, 4, 5]:
-                level.player.movement(level.deltaTime, direction)
-                last_byte_position = 0
-
-            else:
-                if len(msg) < 5:
-                    print("MESSAGE NOT TOTOAL")
-
-                    return -1
-                level.player.x = int.from_bytes(msg[1:3], byteorder='big', signed=False)
-                level.player.y = int.from_bytes(msg[3:5], byteorder='big', signed=False)
-                last_byte_position = 4
-
-
+            contestant = level.player
         else:
-            opponent = level.opponents[contestant_id]
-            if direction in [1, 2, 3, 4, 5]:
-                opponent.movement(level.deltaTime, direction)
-                last_byte_position = 0
-
-            else:
-                if len(msg) < 5:
-                    print("MESSAGE NOT TOTAL")
-                    return -1
-                opponent.x = int.from_bytes(msg[1:3], byteorder='big', signed=False)
-                opponent.y = int.from_bytes(msg[3:5], byteorder='big', signed=False)
-                last_byte_position = 4
+            contestant = level.opponents[contestant_id]
 
+        if client.predict and contestant is level.player:
+            contestant.reconcile(direction, data)
+        elif direction in [1, 2, 3, 4, 5]:
+            contestant.movement(direction)
+        else:
+            contestant.x, contestant.y = data[0], data[1]
 
         if msg_id == 6:
-            if contestant_id == level.player.ID:
-                level.player.score += 1
-            else:
-                opponent = level.opponents[contestant_id]
-                opponent.score += 1
+            contestant.score += 1
 
             if level.currentCollectible:
-                level.map.remove(level.currentCollectible)
+                level.removeTile(level.currentCollectible)
                 level.currentCollectible = ''
-            if direction in [1, 2, 3, 4, 5]:
-                if len(msg) < 5:
-                    print("MESSAGE NOT TOTAL")
-
-                    return -1
-                level.fruit_x = int.from_bytes(msg[1:3], byteorder='big', signed=False)
-                level.fruit_y = int.from_bytes(msg[3:5], byteorder='big', signed=False)
-                last_byte_position = 4
-
-            else:
-                if len(msg) < 9:
-                    print("MESSAGE NOT TOTAL")
-
-                    return -1
-                level.fruit_x = int.from_bytes(msg[5:7], byteorder='big', signed=False)
-                level.fruit_y = int.from_bytes(msg[7:9], byteorder='big', signed=False)
-                last_byte_position = 8
+            # The fruit position is always in the last 4 bytes
+            level.fruit_x, level.fruit_y = data[-2], data[-1]
             level.currentCollectible = PickupBlock(level.fruit_x, level.fruit_y, 25, 25, green)
-            level.map.append(level.currentCollectible)
+            level.addTile(level.currentCollectible)
             level.fruit_eatable = True
 
-        return msg[last_byte_position + 1:]
-
-
     elif msg_id == 4:  # A player is leaving
         if level.opponents:
             opponent = level.opponents[contestant_id]
             opponent.active = False
-        return msg[1:]
 
-    if msg_id == 5:
-        # In case of a pong, the message consists of 3 bytes(header(1 byte) + time stamp(2 bytes))
-        if len(msg) < 3:
-            print("MESSAGE NOT TOTAL")
-
-            # Check if whole message came in
-            return -1
-        client.socket_connection.sendall(msg)  # Sending back for ping
+    elif msg_id == 5:
+        # The ping is already answered by the receiver thread. If the move the player is waiting for got lost(UDP), the
+        # ping makes sure the player is not blocked for the rest of the game.
         level.waiting_move = False
-        return msg[3:]
+    return
 
 
 def handleServer(level, client):
     """
-    By making use of Threading, the client handles the server.
+    Called once per tick by the main loop: applying all messages of the server that came in, and of which the
+    simulated ping has passed.
     """
-    client.total_message = bytes()
-    if level.connected:
-        try:
-            if client.socket_connection:
-                msg = client.socket_connection.recv(1024)
-                if msg:
-                    time.sleep(client.simulated_ping/1000)
-                    client.total_message += msg
-        except Exception:
+    now = time.monotonic()
+    if client.predict and level.player:
+        level.player.dropLostInputs()
+    while True:
+        if client.next_message is None:
+            try:
+                client.next_message = client.received.get_nowait()
+            except queue.Empty:
+                return
+        due_time, message = client.next_message
+        if due_time > now:
             return
-
-
-    while client.total_message:
-        """"
-        TCP is stream oriented based, so it can happen that two messages comes at once, so we loop through these two.
-        """
-        output = parseMessage(level, client, client.total_message)
-        if output == -1:
-            #client.total_message = bytes()
-            break
-        else:
-            client.total_message = output
-
-    return
-
-
-
+        client.next_message = None
+        applyMessage(level, client, *message)
 
 
 ####################################
@@ -778,13 +979,13 @@ textFont = pygame.font.SysFont('Comic Sans MS', 40)
 pygame.display.set_caption("CN Assignment: Networked 2D Game")
 
 while running:
-    key_pressed = False
 
     if not level.connected:
         client = Client()
         level.client = client
         client_connection = client.setupTCPConnection()
         level.connected = True
+        renderedOn = None  # The next frame is drawn completely
         if client_connection:
             screen = pygame.display.set_mode(screenSize)
             clock = pygame.time.Clock()
@@ -812,54 +1013,28 @@ while running:
             if event.type == KEYDOWN and event.key == K_ESCAPE:
                 running = False
                 break
-            if event.type == KEYDOWN and client.RTT_probing_finished and not level.waiting_move and not level.all_opponents_left:
-                # Only sending if probing is finished, and we are not waiting on our move
-                key_pressed = True  # This is necessary so that
-                if event.key == pygame.K_RIGHT:
-                    level.player.send_x = level.player.x + level.player.moveSpeed * level.deltaTime
-                    level.player.send_y = level.player.y
-                elif event.key == pygame.K_LEFT:
-                    level.player.send_x = level.player.x - level.player.moveSpeed * level.deltaTime
-                    level.player.send_y = level.player.y
-                elif event.key == pygame.K_UP:
-                    level.player.send_y = level.player.y - level.player.moveSpeed * level.deltaTime
-                    level.player.send_x = level.player.x
-                elif event.key == pygame.K_DOWN:
-                    level.player.send_y = level.player.y + level.player.moveSpeed * level.deltaTime
-                    level.player.send_x = level.player.x
-                else:
-                    break
-
-                if not level.LegalMoveAdaptation():
-                    # Only sending move, if move is legal.
-                    if level.fruit_eaten:
-                        request = client.createRequestSpecificCo(level, level.player.send_x, level.player.send_y, 6)
-                        level.fruit_eaten = False
-                    else:
-                        request = client.createRequestSpecificCo(level, level.player.send_x, level.player.send_y, 3)
+            if event.type == KEYDOWN and event.key in keyDirection and client.RTT_probing_finished and not level.waiting_move and not level.all_opponents_left:
+                # The move is sent in the next simulation step(see below), also if the key is released by then.
+                level.tapped_direction = keyDirection[event.key]
 
 
-        threading.Thread(target=handleServer, args=(level, client)).start()
-        if running and client.socket_connection and not key_pressed and not level.waiting_move and not level.all_opponents_left:
+        handleServer(level, client)
+        for step in range(level.takeSteps()):
+            # At most one move per simulation step, whatever the FPS.
+            if not (running and client.socket_connection and not level.waiting_move and not level.all_opponents_left):
+                break
             key = pygame.key.get_pressed()
 
-            if level.legalKeyPresses(key) and client.RTT_probing_finished and level.timeLeft > 0:
-                if key[K_RIGHT]:
-                    level.player.send_x = level.player.x + level.player.moveSpeed * level.deltaTime
-                    level.player.send_y = level.player.y
-                    level.direction = 2
-                if key[K_LEFT]:
-                    level.player.send_x = level.player.x - level.player.moveSpeed * level.deltaTime
-                    level.player.send_y = level.player.y
-                    level.direction = 4
-                if key[K_UP]:
-                    level.player.send_y = level.player.y - level.player.moveSpeed * level.deltaTime
-                    level.player.send_x = level.player.x
-                    level.direction = 1
-                if key[K_DOWN]:
-                    level.player.send_y = level.player.y + level.player.moveSpeed * level.deltaTime
-                    level.player.send_x = level.player.x
-                    level.direction = 3
+            if (level.tapped_direction != 5 or level.legalKeyPresses(key)) and client.RTT_probing_finished and level.timeLeft > 0:
+                if level.tapped_direction != 5:
+                    level.direction = level.tapped_direction
+                    level.tapped_direction = 5
+                else:
+                    for pressed_key, direction in keyDirection.items():
+                        if key[pressed_key]:
+                            level.direction = direction
+                level.player.send_x = level.player.x + level.player.moveSpeed * xDirection[level.direction]
+                level.player.send_y = level.player.y + level.player.moveSpeed * yDirection[level.direction]
 
                 if not level.LegalMoveAdaptation():
                     if level.fruit_eaten:
@@ -870,9 +1045,13 @@ while running:
 
         if level.player:
             if not 0 < level.player.x < 1280 or not 0 < level.player.y < 600:
-                # If player jumps by a miracle out of the map, it spawns back in the middle.
+                # If player jumps by a miracle out of the map, it spawns back in the middle. This is the only move that
+                # is sent as absolute position, so that the server and the opponents follow the correction.
                 level.player.x = screenSize[0]//2
                 level.player.y = screenSize[1]//2
+                level.player.updateRect()
+                if client.socket_connection and client.RTT_probing_finished:
+                    client.createRequestSpecificCo(level, level.player.x, level.player.y, 3)
             tick()
             if level.connected:
                 # Only if connected the map is rendered
@@ -880,10 +1059,7 @@ while running:
 
     except KeyboardInterrupt:
 
-        header = int('10000000', 2).to_bytes(1, byteorder='big')  # msg id is 4, thus 100 in front, all the others are
-        # zero in the header
-
-        response = header
+        response = HEADER_BYTES[HEADER[4][0][0]]  # msg id is 4, all the others are zero in the header
         client.socket_connection.sendall(response)
         client.socket_connection.close()
 
@@ -891,9 +1067,7 @@ while running:
 
 pygame.quit()
 if level.player and client.socket_connection:
-    header = int('10000000', 2).to_bytes(1, byteorder='big')  # msg id is 4, thus 100 in front, all the others are
-    # zero in the header
-    response = header
+    response = HEADER_BYTES[HEADER[4][0][0]]  # msg id is 4, all the others are zero in the header
     client.socket_connection.sendall(response)
     client.socket_connection.close()
     level.connected = False